@@ -0,0 +1,410 @@
+# Benchmark Crawler Stages on a Synthetic Corpus.
+import sys
+import os
+import struct
+import random
+import time
+import json
+import platform
+import statistics
+import argparse
+import contextlib
+from datetime import datetime
+
+from osgeo import gdal
+from osgeo import osr
+
+from utils import posixpath, save_json, save_psv_stream
+from lasutils import (HEADER_STRUCT, HEADER_13_STRUCT, HEADER_14_STRUCT, VLR_HEADER_STRUCT,
+                      POINT_FORMATS, GLOBAL_ENCODING_WKT)
+import geoutils
+import produtils
+import crawl2psv
+
+
+# Product filename patterns, {i} image, {d} directory number, as matched by produtils
+PRODUCTS = {
+    'airbus': {
+        'raster': 'IMG_PHR1B_MS_2022051501{d:02d}{i:02d}1_SEN_71080401{d:02d}-2_R1C{i}.TIF',
+        'metadata': 'DIM_PHR1B_MS_2022051501{d:02d}001_SEN_71080401{d:02d}-2.XML',
+        'preview': 'PREVIEW_PHR1B_MS_2022051501{d:02d}001_SEN_71080401{d:02d}-2.JPG',
+    },
+    'maxar': {
+        'raster': '23NOV11{d:02d}{i:04d}-M2AS_R{i}C1-0501861400{d:02d}_01_P001.TIF',
+        'metadata': '23NOV11{d:02d}0000-M2AS-0501861400{d:02d}_01_P001.XML',
+        'preview': '23NOV11{d:02d}0000-M2AS-0501861400{d:02d}_01_P001-BROWSE.JPG',
+    },
+    'aoi': {
+        'raster': 'JL1KF01C_PMSL6_202501180843{d:02d}_200341659_101_00{i:02d}_001_L1_MSS_9789{d:02d}.tif',
+        'metadata': 'JL1KF01C_PMSL6_202501180843{d:02d}_200341659_101_0000_001_L1_MSS_9789{d:02d}_meta.xml',
+        'preview': 'JL1KF01C_PMSL6_202501180843{d:02d}_200341659_101_0000_001_L1_MSS_9789{d:02d}.jpg',
+    },
+}
+
+# Synthetic raster georeferencing kinds, cycled per file
+RASTER_KINDS = ('epsg', 'rpc', 'epsg_other')
+# Synthetic LAS CRS VLR kinds, cycled per file
+LAS_KINDS = ('geokeys', 'geoascii', 'wkt', 'geokeys_other')
+
+EPSG = 28355
+EPSG_OTHER = 7855
+ORIGIN = (500000.0, 6100000.0)
+# Image footprint near ORIGIN in EPSG:4326, for RPCs
+RPC_LON, RPC_LAT = 147.0, -35.0
+
+XML = '<?xml version="1.0"?>\n<Dimap_Document><Dataset_Identification><NAME>{name}</NAME>' \
+      '</Dataset_Identification><Coordinates>{coords}</Coordinates></Dimap_Document>\n'
+# Minimal JPEG (SOI, EOI markers), preview lookup only matches filenames
+JPG = b'\xff\xd8\xff\xd9'
+
+
+def _srs_wkt(epsg):
+    """Returns WKT of EPSG code."""
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    return srs.ExportToWkt()
+
+def _rpc(size):
+    """Returns RPC metadata for an image of size pixels near RPC_LON, RPC_LAT,
+       line and sample linear in normalised latitude and longitude."""
+    zeros = ['0'] * 19
+    return {
+        'LINE_OFF': str(size / 2), 'SAMP_OFF': str(size / 2), 'HEIGHT_OFF': '0',
+        'LAT_OFF': str(RPC_LAT), 'LONG_OFF': str(RPC_LON),
+        'LINE_SCALE': str(size / 2), 'SAMP_SCALE': str(size / 2), 'HEIGHT_SCALE': '100',
+        'LAT_SCALE': '0.01', 'LONG_SCALE': '0.01',
+        # Coefficients: 1, L(ongitude), P (latitude), H, ...
+        'LINE_NUM_COEFF': ' '.join(['0', '0', '-1'] + zeros[2:]),
+        'LINE_DEN_COEFF': ' '.join(['1'] + zeros),
+        'SAMP_NUM_COEFF': ' '.join(['0', '1'] + zeros[1:]),
+        'SAMP_DEN_COEFF': ' '.join(['1'] + zeros),
+    }
+
+def make_raster(filepath, kind='epsg', size=256, bands=3):
+    """Create GeoTIFF (or JP2 by extension) georeferenced by EPSG code or RPCs.
+       Returns filepath, or None if the format's driver is not available."""
+    dataset = gdal.GetDriverByName('MEM').Create('', size, size, bands, gdal.GDT_Byte)
+    if kind == 'rpc':
+        dataset.SetMetadata(_rpc(size), 'RPC')
+    else:
+        dataset.SetProjection(_srs_wkt(EPSG_OTHER if kind == 'epsg_other' else EPSG))
+        dataset.SetGeoTransform((ORIGIN[0], 0.5, 0.0, ORIGIN[1] + size * 0.5, 0.0, -0.5))
+    for i in range(1, bands + 1):
+        dataset.GetRasterBand(i).Fill(i * 40)
+    ext = os.path.splitext(filepath)[1].lower()
+    driver = gdal.GetDriverByName('JP2OpenJPEG' if ext == '.jp2' else 'GTiff')
+    if driver is None:
+        print(f'benchmark: no driver for "{filepath}", skipped.', file=sys.stderr)
+        return None
+    driver.CreateCopy(filepath, dataset)
+    dataset = None
+    return filepath
+
+def _vlr(user_id, record_id, record_data, description=''):
+    """Returns packed VLR."""
+    return VLR_HEADER_STRUCT.pack(0, user_id.encode('ascii'), record_id, len(record_data),
+                                  description.encode('ascii')) + record_data
+
+def _geokeys(epsg):
+    """Returns GeoKeyDirectory record data for projected EPSG code."""
+    keys = [(1024, 0, 1, 1), (3072, 0, 1, epsg), (3076, 0, 1, 9001)]
+    return struct.pack(f'<{4 + 4 * len(keys)}H', 1, 1, 0, len(keys), *[_ for key in keys for _ in key])
+
+def make_las(filepath, kind='geokeys', points=100, seed=0):
+    """Create uncompressed LAS 1.2 (or 1.4 for WKT) with CRS VLRs of kind and zeroed points.
+       Kinds: 'geokeys' EPSG code, 'geoascii' only an ASCII CRS name (bad CRS fallback),
+       'wkt' LAS 1.4 WKT, 'geokeys_other' another EPSG code."""
+    rng = random.Random(seed)
+    vlrs = []
+    global_encoding = 0
+    minor, point_format = 2, 3
+    if kind == 'wkt':
+        minor, point_format = 4, 6
+        global_encoding = GLOBAL_ENCODING_WKT
+        vlrs.append(_vlr('LASF_Projection', 2112, _srs_wkt(EPSG).encode('ascii') + b'\0', 'OGC WKT'))
+    elif kind == 'geoascii':
+        vlrs.append(_vlr('LASF_Projection', 34735, _geokeys(32767), 'GeoKeyDirectoryTag'))
+        vlrs.append(_vlr('LASF_Projection', 34737, b'GDA94 / MGA zone 55|\0', 'GeoAsciiParamsTag'))
+    else:
+        epsg = EPSG_OTHER if kind == 'geokeys_other' else EPSG
+        vlrs.append(_vlr('LASF_Projection', 34735, _geokeys(epsg), 'GeoKeyDirectoryTag'))
+    # Unknown binary VLR, as written by acquisition software
+    vlrs.append(_vlr('benchmark', 1, bytes(rng.randrange(256) for _ in range(64)), 'binary'))
+    number_of_vlrs = len(vlrs)
+    vlrs = b''.join(vlrs)
+
+    header_size = {2: HEADER_STRUCT.size,
+                   4: HEADER_STRUCT.size + HEADER_13_STRUCT.size + HEADER_14_STRUCT.size}[minor]
+    record_length = POINT_FORMATS[point_format][0]
+    x, y = ORIGIN[0] + rng.uniform(0, 1000), ORIGIN[1] + rng.uniform(0, 1000)
+    legacy_points = points if minor < 4 else 0
+    header = HEADER_STRUCT.pack(
+        b'LASF', 1, global_encoding, bytes(16), 1, minor, b'benchmark', b'benchmark.py', 1, 2024,
+        header_size, header_size + len(vlrs), number_of_vlrs, point_format,
+        record_length, legacy_points, legacy_points, 0, 0, 0, 0,
+        0.01, 0.01, 0.01, x, y, 0.0,
+        x + 500, x, y + 500, y, 100.0, 0.0,
+    )
+    if minor >= 3:
+        header += HEADER_13_STRUCT.pack(0)
+    if minor >= 4:
+        header += HEADER_14_STRUCT.pack(0, 0, points, points, *([0] * 14))
+    with open(filepath, 'wb') as f:
+        f.write(header + vlrs + bytes(record_length * points))
+    return filepath
+
+def make_laz(filepath, lasfilepath):
+    """Create LAZ from LAS with laspy, if a LAZ backend is installed.
+       Returns filepath, or None if not."""
+    try:
+        import laspy
+        if not laspy.LazBackend.detect_available():
+            raise ImportError('no LAZ backend')
+    except ImportError as ex:
+        print(f'benchmark: cannot write "{filepath}": {ex}, skipped.', file=sys.stderr)
+        return None
+    las = laspy.read(lasfilepath)
+    las.write(filepath)
+    return filepath
+
+def make_corpus(rootdir, dirs=2, rasters=6, las=8, size=256, points=100, jp2=True, laz=True, seed=0):
+    """Create synthetic crawl tree under rootdir and returns its parameters.
+       Per product style (Airbus, Maxar, AOI) dirs directories of rasters GeoTIFFs
+       (plus a JP2 each if jp2) with sidecar metadata XML and preview JPG,
+       and dirs directories of las LAS files (plus LAZ copies if laz) with varied CRS VLRs."""
+    rng = random.Random(seed)
+    counts = {'tif': 0, 'jp2': 0, 'las': 0, 'laz': 0, 'xml': 0, 'jpg': 0}
+    for product, patterns in PRODUCTS.items():
+        for d in range(dirs):
+            dirpath = os.path.join(rootdir, product, f'{product}_{d:02d}')
+            os.makedirs(dirpath, exist_ok=True)
+            for i in range(1, rasters + 1):
+                filename = patterns['raster'].format(d=d, i=i)
+                kind = RASTER_KINDS[(d + i) % len(RASTER_KINDS)]
+                make_raster(os.path.join(dirpath, filename), kind, size)
+                counts['tif'] += 1
+                if jp2 and i == 1:
+                    filepath = os.path.join(dirpath, os.path.splitext(filename)[0] + '.JP2')
+                    counts['jp2'] += bool(make_raster(filepath, kind, size))
+            coords = ' '.join(f'{rng.uniform(-35.1, -34.9):.6f},{rng.uniform(146.9, 147.1):.6f}' for _ in range(4))
+            with open(os.path.join(dirpath, patterns['metadata'].format(d=d)), 'w') as f:
+                f.write(XML.format(name=product, coords=coords))
+            counts['xml'] += 1
+            with open(os.path.join(dirpath, patterns['preview'].format(d=d)), 'wb') as f:
+                f.write(JPG)
+            counts['jpg'] += 1
+    for d in range(dirs):
+        dirpath = os.path.join(rootdir, 'las', f'240425_FLIGHT_{d}', '09_EXPORT')
+        os.makedirs(dirpath, exist_ok=True)
+        for i in range(las):
+            kind = LAS_KINDS[(d + i) % len(LAS_KINDS)]
+            filepath = make_las(os.path.join(dirpath, f'240425_Flight{d}_{i:03d}.las'), kind, points, seed + i)
+            counts['las'] += 1
+            if laz and make_laz(os.path.splitext(filepath)[0] + '.laz', filepath):
+                counts['laz'] += 1
+    return {
+        'rootdir': posixpath(os.path.abspath(rootdir)),
+        'dirs': dirs, 'rasters': rasters, 'las': las, 'size': size, 'points': points,
+        'seed': seed, 'files': counts,
+    }
+
+def corpus_files(rootdir, extensions):
+    """Returns sorted filepaths under rootdir with extensions."""
+    filepaths = []
+    for dirpath, dirnames, filenames in os.walk(rootdir):
+        dirnames.sort()
+        filepaths += [posixpath(os.path.join(dirpath, _)) for _ in sorted(filenames)
+                      if os.path.splitext(_)[1].lower() in extensions]
+    return filepaths
+
+def _reset_caches():
+    """Clear per-process caches, so every run starts cold."""
+    produtils._xml_json.cache_clear()
+    geoutils.coordinate_transformation.cache_clear()
+    geoutils._las_crs_cache.clear()
+
+def timeit(function, repeat=3):
+    """Returns result of timing function() repeat times from cold caches."""
+    runs = []
+    # Per-file progress lines would time the terminal, not the crawler
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            _reset_caches()
+            start = time.perf_counter()
+            count = function()
+            runs.append(time.perf_counter() - start)
+    median = statistics.median(runs)
+    return {
+        'count': count,
+        'runs': [round(_, 6) for _ in runs],
+        'median': round(median, 6),
+        'min': round(min(runs), 6),
+        'per_item': round(median / count, 9) if count else None,
+    }
+
+def bench_crawler(rootdir, workers=None, gdal_mode='full', las_reader='laspy'):
+    """Returns function crawling rootdir end to end, returning rows count."""
+    def run():
+        count = 0
+        for index, errors in crawl2psv.crawler('benchmark', 'benchmark', rootdir, workers=workers,
+                                               gdal_mode=gdal_mode, las_reader=las_reader):
+            count += len(index)
+        return count
+    return run
+
+def bench_gdal_info(filepaths, fast=False):
+    """Returns function running gdal_info over filepaths, returning count."""
+    def run():
+        for filepath in filepaths:
+            siblings = sorted(os.listdir(os.path.dirname(filepath))) if fast else None
+            geoutils.gdal_info(filepath, fast=fast, siblings=siblings)
+        return len(filepaths)
+    return run
+
+def bench_get_las_info(filepaths, fast=False):
+    """Returns function running get_las_info over filepaths, returning count."""
+    def run():
+        for filepath in filepaths:
+            geoutils.get_las_info(filepath, fast=fast)
+        return len(filepaths)
+    return run
+
+def bench_metadatapath(filepaths):
+    """Returns function resolving metadata XML and preview per file, returning count."""
+    def run():
+        for filepath in filepaths:
+            dirpath, filename = os.path.split(filepath)
+            filenames = sorted(os.listdir(dirpath))
+            filetime, infix = produtils.file_time(filename)
+            produtils.metadatapath(dirpath, filenames, filename, infix)
+            produtils.preview_filepath(dirpath, filenames, infix)
+        return len(filepaths)
+    return run
+
+def bench_load_psv(psvpath, db_url, epsg=3857):
+    """Returns function loading psvpath with load_psv into db_url, returning rows count.
+       Drops and recreates the imagery_metadata table."""
+    import psycopg2
+    import load_psv
+
+    def run():
+        conn = psycopg2.connect(db_url)
+        try:
+            load_psv.init_schema(conn)
+            load_psv.process_geometry(conn, epsg)
+            with open(psvpath, 'r') as f:
+                load_psv.load_psv_to_db(conn, f, epsg)
+            load_psv.analyze_table(conn)
+            with conn.cursor() as cur:
+                cur.execute('SELECT count(*) FROM imagery_metadata;')
+                return cur.fetchone()[0]
+        finally:
+            conn.close()
+    return run
+
+def benchmark(rootdir, repeat=3, workers=None, db_url=None, outdir='.'):
+    """Returns benchmark results dict for corpus at rootdir."""
+    rasters = corpus_files(rootdir, ('.tif', '.tiff', '.jp2'))
+    lasfiles = corpus_files(rootdir, ('.las', '.laz'))
+    benchmarks = {
+        'crawler': bench_crawler(rootdir),
+        'crawler_fast': bench_crawler(rootdir, gdal_mode='fast'),
+        'crawler_las_fast': bench_crawler(rootdir, las_reader='fast'),
+        'gdal_info': bench_gdal_info(rasters),
+        'gdal_info_fast': bench_gdal_info(rasters, fast=True),
+        'get_las_info': bench_get_las_info(lasfiles),
+        'get_las_info_fast': bench_get_las_info(lasfiles, fast=True),
+        'metadatapath': bench_metadatapath(rasters),
+    }
+    if workers:
+        benchmarks[f'crawler_workers_{workers}'] = bench_crawler(rootdir, workers=workers)
+    if db_url:
+        psvpath = os.path.join(outdir, 'benchmark.psv')
+        rows = (row for index, errors in crawl2psv.crawler('benchmark', 'benchmark', rootdir) for row in index)
+        save_psv_stream(psvpath, rows, crawl2psv.psv_fields)
+        benchmarks['load_psv'] = bench_load_psv(psvpath, db_url)
+    results = {}
+    for name, function in benchmarks.items():
+        print(f'benchmark: {name}...', file=sys.stderr)
+        results[name] = timeit(function, repeat)
+        print(f'benchmark: {name} {results[name]["median"]}s for {results[name]["count"]}', file=sys.stderr)
+    return results
+
+def environment():
+    """Returns environment of benchmark run, for comparing results files."""
+    return {
+        'python': platform.python_version(),
+        'gdal': gdal.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+    }
+
+def compare(results, baseline):
+    """Print median speedup of results versus baseline results, per benchmark."""
+    for name, result in results['benchmarks'].items():
+        base = baseline['benchmarks'].get(name)
+        if not base or not result['median']:
+            print(f'{name:24} {result["median"]:>12.6f}s')
+            continue
+        print(f'{name:24} {result["median"]:>12.6f}s {base["median"]:>12.6f}s {base["median"] / result["median"]:>8.2f}x')
+
+
+def main(args=None):
+    """Main parameters."""
+
+    parser = argparse.ArgumentParser(description='Benchmark crawler stages on a synthetic corpus')
+    parser.add_argument('rootdir', help='Corpus directory, generated if it does not exist')
+    parser.add_argument('--label', default=datetime.now().strftime('%Y%m%dT%H%M%S'),
+                        help='Results label, results are saved to benchmark.LABEL.json (default: timestamp)')
+    parser.add_argument('--outdir', default='.', help='Directory for results files (default: .)')
+    parser.add_argument('--dirs', type=int, default=2, help='Directories per product style (default: 2)')
+    parser.add_argument('--rasters', type=int, default=6, help='GeoTIFFs per directory (default: 6)')
+    parser.add_argument('--las', type=int, default=8, help='LAS files per directory (default: 8)')
+    parser.add_argument('--size', type=int, default=256, help='Raster width and height (default: 256)')
+    parser.add_argument('--points', type=int, default=100, help='Points per LAS file (default: 100)')
+    parser.add_argument('--no-jp2', action='store_true', help='Do not generate JP2 files')
+    parser.add_argument('--no-laz', action='store_true', help='Do not generate LAZ files')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark (default: 3)')
+    parser.add_argument('--workers', type=int, default=None, help='Also benchmark the crawler with workers')
+    parser.add_argument('--db-url', help='Also benchmark load_psv; DROPS and recreates imagery_metadata')
+    parser.add_argument('--compare', metavar='RESULTS', help='Previous results JSON to compare against')
+
+    parsed_args = parser.parse_args(args[1:] if args else None)
+
+    gdal.UseExceptions()
+    rootdir = posixpath(os.path.abspath(parsed_args.rootdir))
+    corpusfn = os.path.join(rootdir, 'corpus.json')
+    if os.path.isfile(corpusfn):
+        with open(corpusfn) as f:
+            corpus = json.load(f)
+        print(f'Using corpus "{rootdir}"', file=sys.stderr)
+    else:
+        print(f'Generating corpus "{rootdir}"', file=sys.stderr)
+        corpus = make_corpus(rootdir, parsed_args.dirs, parsed_args.rasters, parsed_args.las, parsed_args.size,
+                             parsed_args.points, not parsed_args.no_jp2, not parsed_args.no_laz, parsed_args.seed)
+        save_json(corpusfn, corpus)
+
+    os.makedirs(parsed_args.outdir, exist_ok=True)
+    results = {
+        'label': parsed_args.label,
+        'start': datetime.now().isoformat(),
+        'environment': environment(),
+        'corpus': corpus,
+        'repeat': parsed_args.repeat,
+        'benchmarks': benchmark(rootdir, parsed_args.repeat, parsed_args.workers, parsed_args.db_url,
+                                parsed_args.outdir),
+    }
+    resultsfn = os.path.join(parsed_args.outdir, f'benchmark.{parsed_args.label}.json')
+    save_json(resultsfn, results)
+    print(f'Saved results "{resultsfn}"', file=sys.stderr)
+    baseline = None
+    if parsed_args.compare:
+        with open(parsed_args.compare) as f:
+            baseline = json.load(f)
+    compare(results, baseline or {'benchmarks': {}})
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
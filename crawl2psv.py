@@ -1,259 +1,787 @@
-# Crawl Imagery File Metadata into PSV.
-import sys
-import os
-from datetime import datetime
-from geoutils import *
-from produtils import *
-from utils import *
-import os.path
-
-import argparse  # Add this import
-
-DEBUG = True
-DEBUG = False  # Set to True for debugging output
-
-
-
-
-
-
-EPSG = 3857  # EPSG code for WGS84 / Pseudo-Mercator
-
-
-include_exts = (
-    '.jp2',
-    '.tif',
-    '.tiff',
-    '.las',
-    '.laz',
-)
-
-excluded_exts = (
-    '.copc.laz',
-)
-
-exclude_dirs = (
-    '.git',
-    '.vs',
-    '.vscode',
-    'temp',
-    'ept-data',
-
-)
-
-
-def imagery_metadata_processor(progname, crawlname, curdirpath, curfilenames, filename):
-    """File Metadata Processor."""
-    index = []
-    errors = []
-    try:
-        # Filepath
-        filepath = posixpath(os.path.join(curdirpath, filename))
-        if not os.path.exists(filepath):
-            msg = f'File "{filepath}" not found!'
-            print(msg, file=sys.stderr)
-            raise FileNotFoundError(msg)
-        if not DEBUG:
-            print(fileuri(filepath))
-        index.append({})
-        index[-1].update({
-            'filename_text': filename,
-            'filepath_text': fileuri(filepath),
-        })
-        # Filename datetime and infix for Product
-        filetime, infix = file_time(filename)
-        index[-1].update({
-            'filetime_datetime': filetime,
-        })
-        # File system stats
-        stat = os.stat(filepath)
-        size = stat.st_size
-        ctime_str = datetime.fromtimestamp(stat.st_ctime).isoformat()
-        mtime_str = datetime.fromtimestamp(stat.st_mtime).isoformat()
-        index[-1].update({
-            'size_bigint': size,
-            'modified_datetime': mtime_str,
-            'created_datetime': ctime_str,
-        })
-        # Preview JPEG filepath
-        previewfilepath = preview_filepath(curdirpath, curfilenames, infix)
-        index[-1].update({
-            'previewfilepath_text': fileuri(previewfilepath),
-        })
-        
-        # Process file based on extension
-        ext = os.path.splitext(filepath)[1].lower()
-          # For LAS/LAZ files
-        if ext in ('.las', '.laz'):
-            lidar_info = get_las_info(filepath)
-            polygon, original_crs = getbound_poly_las(filepath, lidar_info, target_crs=EPSG)
-            if DEBUG:
-                print(dumps(lidar_info), end='')
-                print(',')
-            lidar_info_json = compacts(lidar_info)
-            if original_crs is None:
-                original_crs = bbox_json = None
-
-            bbox_json = compacts(polygon) if polygon else None
-
-            
-            metadatafilepath, metadata_json = metadatapath(curdirpath, curfilenames, filename, infix)
-            
-            bbox_epsg = EPSG if bbox_json else None
-            index[-1].update({
-                'metadatafilepath_text': fileuri(metadatafilepath),
-                'bbox_epsg_int': bbox_epsg,
-                'original_crs_int': original_crs,  # Add original CRS
-                'bbox_json': bbox_json,
-                'gdalinfo_json': None,  # Store LAS/LAZ specific info
-                'pylasinfo_json': lidar_info_json,  # Store LAS/LAZ specific info
-                'metadata_json': metadata_json,
-            })        # For TIFF/JP2 files
-        else:
-            # Gdalinfo and BBox and XML filepaths
-            gdalinfo = gdal_info(filepath)
-            polygon, original_crs = getbound_poly(filepath, gdalinfo, target_crs=EPSG)
-            if DEBUG:
-                print(dumps(gdalinfo), end='')
-                print(',')
-            gdalinfo_json = compacts(gdalinfo)
-            bbox_json = compacts(polygon) if polygon else None
-
-            metadatafilepath, metadata_json = metadatapath(curdirpath, curfilenames, filename, infix)
-
-            bbox_epsg = EPSG if bbox_json else None
-            index[-1].update({
-                'metadatafilepath_text': fileuri(metadatafilepath),
-                'bbox_epsg_int': bbox_epsg,
-                'original_crs_int': original_crs,  # Add original CRS
-                'bbox_json': bbox_json,
-                'gdalinfo_json': gdalinfo_json,
-                'pylasinfo_json': None,  # Store LAS/LAZ specific info
-                'metadata_json': metadata_json,
-            })
-    except Exception as ex:
-        msg = f'gdalinfo_processor: failed on {ex}.'
-        print(msg, file=sys.stderr)
-        errors.append(filepath)
-        return [], errors
-    return index, errors
-
-def crawler(progname, crawlname, crawlrootdir, custom_extensions=None):
-    """Recurse dirtree returning gdalinfo metadata index for files matching criteria."""
-    index = []
-    errors = []
-    # original_stderr = sys.stderr
-    # sys.stderr = open(os.devnull, 'w') # swallow debugging
-    crawlrootdir = posixpath(crawlrootdir)
-    if not os.path.isdir(crawlrootdir):
-        msg = f'Crawl Root Dir "{crawlrootdir}" not found or not a directory!'
-        print(msg, file=sys.stderr)
-        raise NotADirectoryError(msg)
-    
-    # Use custom extensions if provided, otherwise use default include_exts
-    extensions_to_use = custom_extensions if custom_extensions else include_exts
-    
-    if DEBUG:
-        print('[')
-    for curdirpath, curdirnames, curfilenames in os.walk(crawlrootdir, topdown=True):
-        curdirpath = posixpath(curdirpath)
-        # if'temp' in path skip
-        # if 'temp' in curdirpath.lower():
-        #     if DEBUG:
-        #         print(f'Skipping directory "{curdirpath}" due to "temp" in path.')
-        #     continue
-        # Modify curdirnames in-place to prevent os.walk from descending into excluded dirs
-        curdirnames[:] = [_ for _ in curdirnames if _ not in exclude_dirs]
-        # So can diff with find
-        curdirnames = sorted(curdirnames)
-        curfilenames = sorted(curfilenames)
-        # Included file extensions
-        filenames = [_ for _ in curfilenames if os.path.splitext(_)[1].lower() in extensions_to_use]
-
-        # excluded_exts
-        filenames = [_ for _ in filenames if os.path.splitext(_)[1].lower() not in excluded_exts]
-        for filename in filenames:
-            _index, _errors = imagery_metadata_processor(progname, crawlname, curdirpath, curfilenames, filename)
-            if _index:
-                index.extend(_index)
-            if _errors:
-                errors.extend(_errors)
-        else:
-            pass
-    if DEBUG:
-        print(']')
-    # sys.stderr.close()
-    # sys.stderr = original_stderr
-    return index, errors
-
-def crawl2psv(progname, crawlrootdir, custom_extensions=None):
-    """Crawl and output index PSV with crawler JSON metadata."""
-    crawlrootdir = os.path.abspath(crawlrootdir)
-    crawlrootdir = os.path.dirname(crawlrootdir) if os.path.isfile(crawlrootdir) else crawlrootdir
-    crawlname = os.path.basename(crawlrootdir)
-    start = datetime.now()
-    index, errors = crawler(progname, crawlname, crawlrootdir, custom_extensions)
-    end = datetime.now()
-    duration = end - start
-    count = len(index)
-    # ACCOUNT FOR 0
-    duration_per_count = duration / count if count > 0 else duration
-    info = { 
-        'crawlrootdir': crawlrootdir,
-        'start': start.isoformat(), 
-        'end': end.isoformat(),
-        'duration': str(duration),
-        'count': count,
-        'duration_per_count': str(duration_per_count),
-    }
-    jsonfn = f'{progname}.{crawlname}' + '.json'
-    save_json(jsonfn, info)
-    csvfn = f'{progname}.{crawlname}' + '.psv'
-
-    save_psv(csvfn, index)
-    errfn = f'{progname}.{crawlname}' + '.err'
-    save_txt(errfn, errors)
-
-
-def main(args=None):
-    """Main parameters."""
-
-    parser = argparse.ArgumentParser(description='Crawl directories for files and generate metadata PSV')
-    parser.add_argument('crawlrootdirs', nargs='+', help='Root directories to crawl')
-    parser.add_argument('--ext', nargs='+', help='File extensions to include (override defaults)')
-    
-
-
-    # If args is passed, use those, otherwise use sys.argv
-    parsed_args = parser.parse_args(args[1:] if args else None)
-    
-    progname = os.path.splitext(os.path.basename(sys.argv[0]))[0]
-    custom_extensions = None
-    
-    if parsed_args.ext:
-        # Process extensions
-        custom_extensions = ['.' + ext.lower().lstrip('.') for ext in parsed_args.ext]
-        print(f"Using custom extensions: {custom_extensions}", file=sys.stderr)
-
-
-    if not parsed_args.crawlrootdirs:
-        # If in debug mode
-        if DEBUG:
-            from tests.testpaths import testpaths
-            crawlrootdirs = testpaths
-            crawlrootdirs = [os.path.dirname(_) for _ in crawlrootdirs if os.path.isfile(_)]
-        else:
-            print(f'No directories specified for crawling.', file=sys.stderr)
-            parser.print_help()
-            return 1
-    else:
-        crawlrootdirs = parsed_args.crawlrootdirs
- 
-    for crawlrootdir in crawlrootdirs:
-        crawl2psv(progname, crawlrootdir, custom_extensions)
-    return 0
-
-if __name__ == '__main__':
-    main(sys.argv)
-    # main(['python','/mnt/datapool2/Archive/EO_IMAGERY/raw/aoi/'])
-
+# Crawl Imagery File Metadata into PSV.
+import sys
+import os
+from datetime import datetime
+from geoutils import *
+from produtils import *
+from utils import *
+import os.path
+import json
+import functools
+import time
+import contextlib
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from workerpool import WatchdogPool
+
+import argparse  # Add this import
+
+DEBUG = True
+DEBUG = False  # Set to True for debugging output
+
+
+
+
+
+
+EPSG = 3857  # EPSG code for WGS84 / Pseudo-Mercator
+
+# .err line reason of a file the processor failed on, see _task_result for worker failures
+EXTRACT_ERROR = 'EXTRACT_ERROR'
+
+
+include_exts = (
+    '.jp2',
+    '.tif',
+    '.tiff',
+    '.las',
+    '.laz',
+)
+
+excluded_exts = (
+    '.copc.laz',
+)
+
+# PSV columns, in output order
+psv_fields = (
+    'filename_text',
+    'filepath_text',
+    'filetime_datetime',
+    'size_bigint',
+    'modified_datetime',
+    'created_datetime',
+    'previewfilepath_text',
+    'metadatafilepath_text',
+    'bbox_epsg_int',
+    'original_crs_int',
+    'bbox_json',
+    'gdalinfo_json',
+    'pylasinfo_json',
+    'metadata_json',
+)
+
+# JSON columns deduplicated by --dedup-json
+dedup_fields = (
+    'gdalinfo_json',
+    'pylasinfo_json',
+    'metadata_json',
+)
+# Columns naming the file a deduplicated JSON value is read from, shared by many rows
+dedup_sources = {
+    'metadata_json': 'metadatafilepath_text',
+}
+
+# Renamed PSV columns, old name: new name
+renamed_fields = {
+    'lidar_info_json': 'pylasinfo_json',
+}
+
+exclude_dirs = (
+    '.git',
+    '.vs',
+    '.vscode',
+    'temp',
+    'ept-data',
+
+)
+
+
+def imagery_metadata_processor(progname, crawlname, curdirpath, dirindex, filename, gdal_mode='full',
+                               rpc_densify=0, las_reader='laspy', vlr_encoding='raw'):
+    """File Metadata Processor.
+       dirindex is the produtils.DirectoryIndex of curdirpath siblings, None in pool workers
+       to use the per-process cached produtils.directory_index instead.
+       gdal_mode 'fast' reads only the raster header fields needed, see geoutils.gdal_info.
+       rpc_densify adds points per edge to RPC footprints, see geoutils.gdal_transform_rpc.
+       las_reader 'laspy' uses laspy, 'fast' reads raw LAS headers with laspy fallback, see geoutils.get_las_info.
+       vlr_encoding 'compact' decodes CRS VLRs and base64 encodes other binary, see geoutils._las_vlr."""
+    index = []
+    errors = []
+    try:
+        # Filepath
+        filepath = posixpath(os.path.join(curdirpath, filename))
+        with timed('stat'):
+            exists = os.path.exists(filepath)
+            stat = os.stat(filepath) if exists else None
+        if not exists:
+            msg = f'File "{filepath}" not found!'
+            print(msg, file=sys.stderr)
+            raise FileNotFoundError(msg)
+        if dirindex is None:
+            with timed('dirindex'):
+                dirindex = directory_index(curdirpath)
+        if not DEBUG:
+            print(fileuri(filepath))
+        index.append({})
+        index[-1].update({
+            'filename_text': filename,
+            'filepath_text': fileuri(filepath),
+        })
+        # Filename datetime and infix for Product
+        filetime, infix = file_time(filename)
+        index[-1].update({
+            'filetime_datetime': filetime,
+        })
+        # File system stats
+        size = stat.st_size
+        ctime_str = datetime.fromtimestamp(stat.st_ctime).isoformat()
+        mtime_str = datetime.fromtimestamp(stat.st_mtime).isoformat()
+        index[-1].update({
+            'size_bigint': size,
+            'modified_datetime': mtime_str,
+            'created_datetime': ctime_str,
+        })
+        # Preview JPEG filepath
+        with timed('preview'):
+            previewfilepath = dirindex.preview_filepath(infix)
+        index[-1].update({
+            'previewfilepath_text': fileuri(previewfilepath),
+        })
+        
+        # Process file based on extension
+        ext = os.path.splitext(filepath)[1].lower()
+          # For LAS/LAZ files
+        if ext in ('.las', '.laz'):
+            with timed('las_info'):
+                lidar_info = get_las_info(filepath, fast=(las_reader == 'fast'), vlr_encoding=vlr_encoding)
+            with timed('las_bbox'):
+                polygon, original_crs = getbound_poly_las(filepath, lidar_info, target_crs=EPSG)
+            if DEBUG:
+                print(dumps(lidar_info), end='')
+                print(',')
+            with timed('json'):
+                lidar_info_json = compacts(lidar_info)
+            if original_crs is None:
+                original_crs = bbox_json = None
+
+            bbox_json = compacts(polygon) if polygon else None
+
+            
+            with timed('metadata'):
+                metadatafilepath, metadata_json = dirindex.metadatapath(filename, infix)
+            
+            bbox_epsg = EPSG if bbox_json else None
+            index[-1].update({
+                'metadatafilepath_text': fileuri(metadatafilepath),
+                'bbox_epsg_int': bbox_epsg,
+                'original_crs_int': original_crs,  # Add original CRS
+                'bbox_json': bbox_json,
+                'gdalinfo_json': None,  # Store LAS/LAZ specific info
+                'pylasinfo_json': lidar_info_json,  # Store LAS/LAZ specific info
+                'metadata_json': metadata_json,
+            })        # For TIFF/JP2 files
+        else:
+            # Gdalinfo and BBox and XML filepaths
+            # Opened once, RPC footprints reuse the dataset for the transformer
+            with timed('raster_info'):
+                dataset = gdal_open(filepath, fast=(gdal_mode == 'fast'), siblings=dirindex.filenames)
+                gdalinfo = gdal_info(filepath, fast=(gdal_mode == 'fast'), siblings=dirindex.filenames, dataset=dataset)
+            with timed('raster_bbox'):
+                polygon, original_crs = getbound_poly(filepath, gdalinfo, target_crs=EPSG, dataset=dataset,
+                                                      rpc_densify=rpc_densify)
+            dataset = None
+            if DEBUG:
+                print(dumps(gdalinfo), end='')
+                print(',')
+            with timed('json'):
+                gdalinfo_json = compacts(gdalinfo)
+            bbox_json = compacts(polygon) if polygon else None
+
+            with timed('metadata'):
+                metadatafilepath, metadata_json = dirindex.metadatapath(filename, infix)
+
+            bbox_epsg = EPSG if bbox_json else None
+            index[-1].update({
+                'metadatafilepath_text': fileuri(metadatafilepath),
+                'bbox_epsg_int': bbox_epsg,
+                'original_crs_int': original_crs,  # Add original CRS
+                'bbox_json': bbox_json,
+                'gdalinfo_json': gdalinfo_json,
+                'pylasinfo_json': None,  # Store LAS/LAZ specific info
+                'metadata_json': metadata_json,
+            })
+    except Exception as ex:
+        msg = f'gdalinfo_processor: failed on {ex}.'
+        print(msg, file=sys.stderr)
+        errors.append(f'{filepath}|{EXTRACT_ERROR}')
+        return [], errors
+    return index, errors
+
+def _walk_tasks(crawlrootdir, extensions_to_use, skip_dirs=None):
+    """Yield (curdirpath, dirindex, filename) for matching files in sorted walk order.
+       After the files of each directory a (curdirpath, dirindex, None) done marker is yielded.
+       Files in skip_dirs are not yielded, their subdirectories are still walked."""
+    for curdirpath, curdirnames, curfilenames in os.walk(crawlrootdir, topdown=True):
+        curdirpath = posixpath(curdirpath)
+        # if'temp' in path skip
+        # if 'temp' in curdirpath.lower():
+        #     if DEBUG:
+        #         print(f'Skipping directory "{curdirpath}" due to "temp" in path.')
+        #     continue
+        # Modify curdirnames in-place to prevent os.walk from descending into excluded dirs
+        # and sort in-place so the walk order is deterministic (so can diff with find)
+        curdirnames[:] = sorted(_ for _ in curdirnames if _ not in exclude_dirs)
+        curfilenames = sorted(curfilenames)
+        # Included file extensions
+        filenames = [_ for _ in curfilenames if os.path.splitext(_)[1].lower() in extensions_to_use]
+
+        # excluded_exts
+        filenames = [_ for _ in filenames if os.path.splitext(_)[1].lower() not in excluded_exts]
+        if not filenames or (skip_dirs and curdirpath in skip_dirs):
+            continue
+        # Siblings classified once per directory, not once per file
+        dirindex = DirectoryIndex(curdirpath, curfilenames)
+        for filename in filenames:
+            yield curdirpath, dirindex, filename
+        yield curdirpath, dirindex, None
+
+def load_manifest(psvpath):
+    """Return previous crawl PSV rows keyed by filepath_text.
+       Blob references of a --dedup-json crawl are resolved from its blobs PSV."""
+    manifest = {}
+    blobs = read_blobs(blobs_path(psvpath))
+    for row in read_psv(psvpath):
+        row = {renamed_fields.get(k, k): v for k, v in row.items()}
+        if any(_ not in row for _ in psv_fields):
+            msg = f'load_manifest: "{psvpath}" columns do not match, ignoring manifest.'
+            print(msg, file=sys.stderr)
+            return {}
+        row = resolve_blobs(row, blobs, dedup_fields) if blobs else row
+        manifest[row['filepath_text']] = {_: row[_] for _ in psv_fields}
+    return manifest
+
+def _manifest_carry(manifest, counts):
+    """Return carry function giving previous (index, errors) for files unchanged since manifest.
+       Every walked file is popped from manifest, so what remains afterwards was deleted."""
+    def carry(curdirpath, dirindex, filename):
+        filepath = posixpath(os.path.join(curdirpath, filename))
+        row = manifest.pop(fileuri(filepath), None)
+        if row is None:
+            return None
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        if row['size_bigint'] != str(stat.st_size):
+            return None
+        if row['modified_datetime'] != datetime.fromtimestamp(stat.st_mtime).isoformat():
+            return None
+        counts['carried'] += 1
+        return [row], []
+    return carry
+
+def _pool(workers, timeout=None):
+    """Return process pool of workers, a WatchdogPool killing tasks after timeout seconds if set."""
+    if timeout:
+        return WatchdogPool(max_workers=workers, timeout=timeout)
+    return ProcessPoolExecutor(max_workers=workers)
+
+def _process_tasks(processor, tasks, workers=None, carry=None, executor=None, timeout=None):
+    """Yield (task, result) for tasks in task order, optionally over a process pool.
+       The pool is executor if given (e.g. shared by roots on one device), else one of workers,
+       with a timeout even a single worker runs in a pool, so a hung file can be abandoned.
+       Tasks for which carry returns a result are not processed.
+       Directory done markers pass through with a None result."""
+    if executor is None and not timeout and (not workers or workers <= 1):
+        for task in tasks:
+            if task[2] is None:
+                yield task, None
+                continue
+            result = carry(*task) if carry else None
+            yield task, result if result is not None else processor(*task)
+        return
+    # Bounded window of in-flight futures keeps order deterministic without
+    # submitting the whole walk up front
+    window = deque()
+    max_pending = (workers or 1) * 4
+    with contextlib.ExitStack() as stack:
+        if executor is None:
+            executor = stack.enter_context(_pool(workers or 1, timeout))
+        for task in tasks:
+            result = carry(*task) if carry and task[2] is not None else None
+            if result is not None or task[2] is None:
+                future = Future()
+                future.set_result(result)
+            else:
+                # Workers index the directory themselves, the index isn't pickled per file
+                curdirpath, dirindex, filename = task
+                future = executor.submit(processor, curdirpath, None, filename)
+            window.append((task, future))
+            if len(window) >= max_pending:
+                yield _task_result(*window.popleft())
+        while window:
+            yield _task_result(*window.popleft())
+
+def _instrumented_processor(processor, *task):
+    """Return processor (index, errors) plus the task's stats: LAS CRS cache hits and misses
+       and seconds per stage (see utils.timed), so stats of pool workers reach the main process."""
+    before = las_crs_cache_info()
+    pop_timings()
+    start = time.perf_counter()
+    index, errors = processor(*task)
+    timings = pop_timings()
+    timings['total'] = time.perf_counter() - start
+    after = las_crs_cache_info()
+    return index, errors, {
+        'counts': {
+            'las_crs_hits': after['hits'] - before['hits'],
+            'las_crs_misses': after['misses'] - before['misses'],
+        },
+        'timings': timings,
+    }
+
+def _task_result(task, future):
+    """Return (task, future result), or 'filepath|REASON' as an error if the worker failed,
+       REASON being TIMEOUT, WORKER_DIED (see workerpool) or WORKER_ERROR."""
+    try:
+        return task, future.result()
+    except Exception as ex:
+        curdirpath, dirindex, filename = task
+        filepath = posixpath(os.path.join(curdirpath, filename))
+        reason = getattr(ex, 'reason', 'WORKER_ERROR')
+        msg = f'crawler: worker failed on {filepath}: {reason} {ex}.'
+        print(msg, file=sys.stderr)
+        return task, ([], [f'{filepath}|{reason}'])
+
+def crawler(progname, crawlname, crawlrootdir, custom_extensions=None, workers=None, carry=None,
+            skip_dirs=None, on_dir_done=None, gdal_mode='full', rpc_densify=0, las_reader='laspy',
+            vlr_encoding='raw', counts=None, timings=None, executor=None, timeout=None):
+    """Recurse dirtree yielding (index, errors) gdalinfo metadata per file matching criteria.
+       on_dir_done(curdirpath) is called once all of a directory's results have been consumed.
+       Processor counters (LAS CRS cache hits and misses) are summed into counts,
+       per-file stage seconds are added to timings, a utils.StageTimings.
+       executor is a process pool to use instead of one of workers, timeout is seconds per file
+       before its worker is killed and the file recorded as an error, see _process_tasks."""
+    # original_stderr = sys.stderr
+    # sys.stderr = open(os.devnull, 'w') # swallow debugging
+    crawlrootdir = posixpath(crawlrootdir)
+    if not os.path.isdir(crawlrootdir):
+        msg = f'Crawl Root Dir "{crawlrootdir}" not found or not a directory!'
+        print(msg, file=sys.stderr)
+        raise NotADirectoryError(msg)
+    
+    # Use custom extensions if provided, otherwise use default include_exts
+    extensions_to_use = custom_extensions if custom_extensions else include_exts
+    
+    if DEBUG:
+        print('[')
+    processor = functools.partial(imagery_metadata_processor, progname, crawlname,
+                                  gdal_mode=gdal_mode, rpc_densify=rpc_densify, las_reader=las_reader,
+                                  vlr_encoding=vlr_encoding)
+    processor = functools.partial(_instrumented_processor, processor)
+    tasks = _walk_tasks(crawlrootdir, extensions_to_use, skip_dirs)
+    for task, result in _process_tasks(processor, tasks, workers, carry, executor, timeout):
+        if result is None:
+            if on_dir_done:
+                on_dir_done(task[0])
+            continue
+        # Carried and failed tasks have no stats
+        index, errors, *task_stats = result
+        for _ in task_stats:
+            if counts is not None:
+                for key, value in _['counts'].items():
+                    counts[key] = counts.get(key, 0) + value
+            if timings is not None:
+                timings.add(posixpath(os.path.join(task[0], task[2])), _['timings'])
+        yield index, errors
+    if DEBUG:
+        print(']')
+    # sys.stderr.close()
+    # sys.stderr = original_stderr
+
+def _crawl_rows(crawl, errfn, counts):
+    """Yield index rows from crawl, appending 'filepath|REASON' errors to errfn as they occur,
+       counted per REASON in counts['error_reasons']."""
+    for _index, _errors in crawl:
+        for error in _errors:
+            save_txt_line(errfn, error)
+            counts['errors'] += 1
+            reason = error.rpartition('|')[2]
+            counts['error_reasons'][reason] = counts['error_reasons'].get(reason, 0) + 1
+        for row in _index:
+            yield row
+
+def load_checkpoint(path):
+    """Return checkpoint dict, or None if there is no checkpoint."""
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_checkpoint(path, data):
+    """Atomically save checkpoint dict, so a crash mid-write keeps the previous checkpoint."""
+    tmppath = path + '.tmp'
+    save_json(tmppath, data)
+    os.replace(tmppath, path)
+
+def _truncate(path, size):
+    """Truncate file to size bytes, dropping anything written after a checkpoint."""
+    with open(path, 'r+b') as f:
+        f.truncate(size)
+
+def _open_sink(csvfn, append=False, db_url=None, db_batch=5000, parquetfn=None, blobs=False):
+    """Return (stream, error): CsvStream writing PSV csvfn or, with db_url, load_psv.DbStream
+       upserting rows into imagery_metadata in batches of db_batch that falls back to csvfn if
+       the database fails, or with parquetfn, parquetutils.ParquetStream writing GeoParquet
+       parquetfn. error is the database error if the DbStream could not be opened, else None."""
+    if parquetfn:
+        # pyarrow is only needed for --format parquet
+        from parquetutils import ParquetStream
+        return ParquetStream(parquetfn, psv_fields, epsg=EPSG), None
+    error = None
+    if db_url:
+        try:
+            # psycopg2 is only needed for --db-url
+            from load_psv import DbStream
+            return DbStream(db_url, psv_fields, fallback=csvfn, batch_rows=db_batch, append=append,
+                            blobs=blobs), None
+        except Exception as ex:
+            error = ' '.join(str(ex).split())
+            print(f'WARNING: database sink failed, writing "{csvfn}" instead, load it with '
+                  f'load_psv.py --upsert: {error}', file=sys.stderr)
+            append = append and os.path.isfile(csvfn) and os.path.getsize(csvfn) > 0
+    return CsvStream(csvfn, psv_fields, delimiter='|', append=append), error
+
+def crawl2psv(progname, crawlrootdir, custom_extensions=None, workers=None, incremental=None,
+              resume=False, checkpoint_interval=60, gdal_mode='full', rpc_densify=0, las_reader='laspy',
+              vlr_encoding='raw', executor=None, timeout=None, db_url=None, db_batch=5000, format='psv',
+              compress=None, dedup_json=None):
+    """Crawl and stream index PSV with crawler JSON metadata.
+       If incremental is a previous PSV, unchanged files (same size and mtime) are carried over.
+       Completed directories are checkpointed every checkpoint_interval seconds,
+       resume continues a crawl from its checkpoint.
+       executor is a process pool shared with other crawls, workers then sizes its window.
+       Failed files are recorded in the .err file as 'filepath|REASON', EXTRACT_ERROR or a worker
+       failure (see _task_result); files taking longer than timeout seconds are abandoned as TIMEOUT.
+       With db_url rows are upserted into imagery_metadata as they are produced, in commits of
+       db_batch rows, instead of written to the PSV, which is only written if the database fails.
+       format 'parquet' writes GeoParquet instead of PSV, it can't be resumed or checkpointed.
+       compress 'gzip' or 'zstd' writes a compressed .psv.gz or .psv.zst PSV.
+       dedup_json replaces JSON values of at least dedup_json bytes by {"$blob": sha1} references,
+       writing each distinct value once to the blobs PSV (or metadata_blobs with db_url)."""
+    crawlrootdir = os.path.abspath(crawlrootdir)
+    crawlrootdir = os.path.dirname(crawlrootdir) if os.path.isfile(crawlrootdir) else crawlrootdir
+    crawlname = os.path.basename(crawlrootdir)
+    jsonfn = f'{progname}.{crawlname}' + '.json'
+    csvfn = f'{progname}.{crawlname}' + '.psv' + (COMPRESSION_EXTS[compress] if compress else '')
+    errfn = f'{progname}.{crawlname}' + '.err'
+    ckptfn = f'{progname}.{crawlname}' + '.checkpoint.json'
+    blobsfn = blobs_path(csvfn)
+    parquetfn = f'{progname}.{crawlname}' + '.parquet' if format == 'parquet' else None
+    if parquetfn:
+        if resume:
+            msg = f'Parquet output "{parquetfn}" can\'t be resumed, crawl to PSV to resume!'
+            print(msg, file=sys.stderr)
+            raise ValueError(msg)
+        # Parquet files are complete only when closed
+        checkpoint_interval = 0
+    start = datetime.now()
+    carry = None
+    counts = {'count': 0, 'carried': 0, 'errors': 0, 'error_reasons': {}, 'las_crs_hits': 0, 'las_crs_misses': 0}
+    timings = StageTimings()
+    completed_dirs = []
+    checkpoint = load_checkpoint(ckptfn) if resume else None
+    if resume and not checkpoint:
+        print(f'No checkpoint "{ckptfn}" found, starting from the beginning.', file=sys.stderr)
+    if checkpoint and checkpoint['crawlrootdir'] != crawlrootdir:
+        msg = f'Checkpoint "{ckptfn}" is for "{checkpoint["crawlrootdir"]}", not "{crawlrootdir}"!'
+        print(msg, file=sys.stderr)
+        raise ValueError(msg)
+    if checkpoint:
+        # Drop rows and errors of the directory in progress at the checkpoint
+        if os.path.isfile(csvfn):
+            _truncate(csvfn, checkpoint['psv_size'])
+        _truncate(errfn, checkpoint['err_size'])
+        start = datetime.fromisoformat(checkpoint['start'])
+        counts.update(checkpoint['counts'])
+        completed_dirs = list(checkpoint['completed_dirs'])
+        print(f'Resuming from checkpoint "{ckptfn}" after {len(completed_dirs)} directories.', file=sys.stderr)
+    if incremental:
+        # Read fully before csvfn is (re)opened, it may be the same file
+        manifest = load_manifest(incremental)
+        print(f'Loaded {len(manifest)} rows from manifest "{incremental}"', file=sys.stderr)
+        # Files in completed directories were walked before resuming
+        completed_uris = set(fileuri(_) for _ in completed_dirs)
+        for uri in [_ for _ in manifest if os.path.dirname(_) in completed_uris]:
+            del manifest[uri]
+        carry = _manifest_carry(manifest, counts)
+    if not checkpoint:
+        save_txt_line(errfn)
+
+    with contextlib.ExitStack() as stack:
+        stream, db_error = _open_sink(csvfn, bool(checkpoint), db_url, db_batch, parquetfn,
+                                      blobs=bool(dedup_json))
+        stack.enter_context(stream)
+        blobstream = None
+        dedup = None
+        if dedup_json:
+            if hasattr(stream, 'write_blob'):
+                write_blob = stream.write_blob
+            else:
+                # Blobs are never truncated on resume, a blob written twice loads once
+                append = bool(checkpoint) and os.path.isfile(blobsfn)
+                blobstream = stack.enter_context(CsvStream(blobsfn, blob_fields, delimiter='|', append=append))
+                write_blob = blobstream.write
+            dedup = JsonDedup(dedup_json, write_blob, dedup_fields, dedup_sources)
+        last_checkpoint = time.monotonic()
+
+        def on_dir_done(curdirpath):
+            nonlocal last_checkpoint
+            completed_dirs.append(curdirpath)
+            if not checkpoint_interval or time.monotonic() - last_checkpoint < checkpoint_interval:
+                return
+            # Blobs first, rows never reference unwritten blobs
+            if blobstream is not None:
+                blobstream.flush()
+            stream.flush()
+            counts['count'] = stream.count
+            save_checkpoint(ckptfn, {
+                'crawlrootdir': crawlrootdir,
+                'start': start.isoformat(),
+                # Database rows are committed by flush, the PSV only exists without or after it
+                'psv_size': os.path.getsize(csvfn) if os.path.isfile(csvfn) else 0,
+                'err_size': os.path.getsize(errfn),
+                'counts': counts,
+                'completed_dirs': completed_dirs,
+            })
+            last_checkpoint = time.monotonic()
+
+        stream.count = counts['count']
+        crawl = crawler(progname, crawlname, crawlrootdir, custom_extensions, workers, carry,
+                        skip_dirs=set(completed_dirs), on_dir_done=on_dir_done, gdal_mode=gdal_mode,
+                        rpc_densify=rpc_densify, las_reader=las_reader, vlr_encoding=vlr_encoding,
+                        counts=counts, timings=timings, executor=executor, timeout=timeout)
+        psv_write = 0.0
+        for row in _crawl_rows(crawl, errfn, counts):
+            write_start = time.perf_counter()
+            stream.write(dedup(row) if dedup else row)
+            psv_write += time.perf_counter() - write_start
+        count = stream.count
+    db_counts = getattr(stream, 'counts', None)
+    end = datetime.now()
+    duration = end - start
+    # ACCOUNT FOR 0
+    duration_per_count = duration / count if count > 0 else duration
+    info = { 
+        'crawlrootdir': crawlrootdir,
+        'start': start.isoformat(), 
+        'end': end.isoformat(),
+        'duration': str(duration),
+        'count': count,
+        'errors': counts['errors'],
+        'error_reasons': counts['error_reasons'],
+        'duration_per_count': str(duration_per_count),
+        'workers': workers,
+        'timeout': timeout,
+        'gdal_mode': gdal_mode,
+        'rpc_densify': rpc_densify,
+        'las_reader': las_reader,
+        'vlr_encoding': vlr_encoding,
+        'las_crs_cache': {
+            'hits': counts['las_crs_hits'],
+            'misses': counts['las_crs_misses'],
+        },
+        'sink': 'db' if db_counts is not None and stream.psv is None else format,
+        # Files extracted in this run, psv_write (or database write) is in the main process
+        'timings': dict(timings.summary(), main={'psv_write': round(psv_write, 6)}),
+    }
+    print(f'LAS CRS cache: {counts["las_crs_hits"]} hits, {counts["las_crs_misses"]} misses.', file=sys.stderr)
+    if checkpoint:
+        info.update({
+            'resumed': len(checkpoint['completed_dirs']),
+        })
+    if dedup:
+        info.update({
+            'dedup_json': dict(dedup.counts, min_bytes=dedup_json),
+        })
+    if db_counts is not None:
+        # Rows of this run, the fallback PSV has those written after the database failed
+        db_error = stream.error
+        info.update({
+            'db': dict(db_counts, fallback=csvfn if stream.psv is not None else None, error=db_error),
+        })
+    elif db_error:
+        info.update({
+            'db': {'inserted': 0, 'updated': 0, 'fallback': csvfn, 'error': db_error},
+        })
+    if incremental:
+        # Manifest rows under this root that were not walked
+        rooturi = fileuri(posixpath(crawlrootdir)).rstrip('/') + '/'
+        deleted = sorted(_ for _ in manifest if _.startswith(rooturi))
+        info.update({
+            'incremental': incremental,
+            'carried': counts['carried'],
+            'deleted': len(deleted),
+        })
+        delfn = f'{progname}.{crawlname}' + '.deleted'
+        save_txt(delfn, deleted)
+    save_json(jsonfn, info)
+    if db_error:
+        # Repeated after the crawl output, the crawl itself succeeded
+        print(f'WARNING: {crawlrootdir} rows were not all loaded into the database, '
+              f'load "{csvfn}" with load_psv.py --upsert: {db_error}', file=sys.stderr)
+    # Crawl complete, nothing to resume
+    if os.path.isfile(ckptfn):
+        os.remove(ckptfn)
+
+def crawl_device(path):
+    """Return st_dev of the device path is on, or None if path cannot be stat'd."""
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return None
+
+def crawl2psv_concurrent(progname, crawlrootdirs, workers=None, device_workers=None, timeout=None, **kwargs):
+    """Crawl all crawlrootdirs at once, each to its own PSV/JSON/ERR outputs.
+       Roots on the same device (st_dev) share a process pool of workers (default 1) processes,
+       device_workers {path: workers} overrides the budget of the device path is on.
+       With a timeout the pools are WatchdogPools abandoning files after timeout seconds.
+       kwargs are passed to crawl2psv. Returns list of roots that failed."""
+    crawlnames = [os.path.basename(os.path.abspath(_)) for _ in crawlrootdirs]
+    duplicates = sorted(set(_ for _ in crawlnames if crawlnames.count(_) > 1))
+    if duplicates:
+        msg = f'Crawl roots with the same name {duplicates} would share outputs, crawl them separately!'
+        print(msg, file=sys.stderr)
+        raise ValueError(msg)
+    budgets = {crawl_device(path): count for path, count in (device_workers or {}).items()}
+    devices = {}
+    for crawlrootdir in crawlrootdirs:
+        devices.setdefault(crawl_device(crawlrootdir), []).append(crawlrootdir)
+    failed = []
+    # Threads only feed the pools and write outputs, extraction runs in the pools
+    with contextlib.ExitStack() as stack, ThreadPoolExecutor(max_workers=len(crawlrootdirs)) as threads:
+        futures = []
+        for device, roots in devices.items():
+            device_budget = budgets.get(device, workers or 1)
+            print(f'Device {device}: {device_budget} workers for {roots}', file=sys.stderr)
+            executor = stack.enter_context(_pool(device_budget, timeout))
+            for crawlrootdir in roots:
+                future = threads.submit(crawl2psv, progname, crawlrootdir, workers=device_budget,
+                                        executor=executor, timeout=timeout, **kwargs)
+                futures.append((crawlrootdir, future))
+        for crawlrootdir, future in futures:
+            try:
+                future.result()
+            except Exception as ex:
+                print(f'crawl2psv_concurrent: failed on {crawlrootdir}: {ex}.', file=sys.stderr)
+                failed.append(crawlrootdir)
+    return failed
+
+def _device_workers(value):
+    """Parse PATH=N device workers argument."""
+    path, _, count = value.rpartition('=')
+    if not path or not count.isdigit() or int(count) < 1:
+        raise argparse.ArgumentTypeError(f'expected PATH=N, got "{value}"')
+    return path, int(count)
+
+
+def main(args=None):
+    """Main parameters."""
+
+    parser = argparse.ArgumentParser(description='Crawl directories for files and generate metadata PSV')
+    parser.add_argument('crawlrootdirs', nargs='+', help='Root directories to crawl')
+    parser.add_argument('--ext', nargs='+', help='File extensions to include (override defaults)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes for metadata extraction (default: serial)')
+    parser.add_argument('--incremental', metavar='PSV',
+                        help='Previous crawl PSV; carry over rows for files with unchanged size and mtime')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume an interrupted crawl from its checkpoint')
+    parser.add_argument('--gdal-mode', choices=('full', 'fast'), default='full',
+                        help='full gdalinfo JSON, or fast header-only fields without directory scans (default: full)')
+    parser.add_argument('--rpc-densify', type=int, default=0, metavar='N',
+                        help='Extra points per edge of RPC image footprints (default: 0, corners only)')
+    parser.add_argument('--las-reader', choices=('laspy', 'fast'), default='laspy',
+                        help='laspy, or fast raw LAS/LAZ header reader with laspy fallback (default: laspy)')
+    parser.add_argument('--vlr-encoding', choices=('raw', 'compact'), default='raw',
+                        help='LAS VLRs as raw int lists, or compact decoded/base64 with a size cap (default: raw)')
+    parser.add_argument('--timeout', type=float, default=None, metavar='SECONDS',
+                        help='Abandon files whose extraction takes longer, recording them as TIMEOUT errors '
+                             '(runs extraction in killable worker processes)')
+    parser.add_argument('--concurrent', action='store_true',
+                        help='Crawl all roots at once, with a process pool per device of --workers (default: 1)')
+    parser.add_argument('--device-workers', type=_device_workers, action='append', metavar='PATH=N',
+                        help='With --concurrent, N workers for the device PATH is on (repeatable)')
+    parser.add_argument('--profile', metavar='PSTATS',
+                        help='Save cProfile stats of the crawl to PSTATS, main process only (use without --workers)')
+    parser.add_argument('--format', choices=('psv', 'parquet'), default='psv',
+                        help='Output PSV, or GeoParquet with typed columns and WKB footprints for DuckDB/pandas '
+                             '(needs pyarrow; no --resume or --db-url) (default: psv)')
+    parser.add_argument('--compress', choices=tuple(COMPRESSION_EXTS),
+                        help='Write the PSV gzip (.psv.gz) or zstd (.psv.zst, needs zstandard) compressed; '
+                             'load_psv.py and --incremental read them as is')
+    parser.add_argument('--dedup-json', type=int, default=None, metavar='MIN_BYTES',
+                        help='Store gdalinfo/pylasinfo/metadata JSON of at least MIN_BYTES once, in a blobs PSV '
+                             '(load with load_psv.py --blobs) or metadata_blobs table, rows referencing its hash')
+    parser.add_argument('--db-url', metavar='URL',
+                        help='Upsert rows into the imagery_metadata table (see load_psv.py --init) as they are '
+                             'produced instead of writing the PSV, which is written only if the database fails')
+    parser.add_argument('--db-batch', type=int, default=5000, metavar='ROWS',
+                        help='With --db-url, rows per COPY transaction (default: 5000)')
+    parser.add_argument('--checkpoint-interval', type=float, default=60, metavar='SECONDS',
+                        help='Seconds between checkpoints of completed directories (default: 60, 0 disables)')
+    
+
+
+    # If args is passed, use those, otherwise use sys.argv
+    parsed_args = parser.parse_args(args[1:] if args else None)
+    if parsed_args.format == 'parquet' and (parsed_args.resume or parsed_args.db_url):
+        parser.error('--format parquet can\'t be used with --resume or --db-url')
+    
+    progname = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    custom_extensions = None
+    
+    if parsed_args.ext:
+        # Process extensions
+        custom_extensions = ['.' + ext.lower().lstrip('.') for ext in parsed_args.ext]
+        print(f"Using custom extensions: {custom_extensions}", file=sys.stderr)
+
+
+    if not parsed_args.crawlrootdirs:
+        # If in debug mode
+        if DEBUG:
+            from tests.testpaths import testpaths
+            crawlrootdirs = testpaths
+            crawlrootdirs = [os.path.dirname(_) for _ in crawlrootdirs if os.path.isfile(_)]
+        else:
+            print(f'No directories specified for crawling.', file=sys.stderr)
+            parser.print_help()
+            return 1
+    else:
+        crawlrootdirs = parsed_args.crawlrootdirs
+ 
+    if parsed_args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    failed = []
+    if parsed_args.concurrent:
+        failed = crawl2psv_concurrent(progname, crawlrootdirs, parsed_args.workers,
+                                      dict(parsed_args.device_workers or []), timeout=parsed_args.timeout,
+                                      custom_extensions=custom_extensions, incremental=parsed_args.incremental,
+                                      resume=parsed_args.resume,
+                                      checkpoint_interval=parsed_args.checkpoint_interval,
+                                      gdal_mode=parsed_args.gdal_mode, rpc_densify=parsed_args.rpc_densify,
+                                      las_reader=parsed_args.las_reader, vlr_encoding=parsed_args.vlr_encoding,
+                                      db_url=parsed_args.db_url, db_batch=parsed_args.db_batch,
+                                      format=parsed_args.format, compress=parsed_args.compress,
+                                      dedup_json=parsed_args.dedup_json)
+    else:
+        for crawlrootdir in crawlrootdirs:
+            crawl2psv(progname, crawlrootdir, custom_extensions, parsed_args.workers, parsed_args.incremental,
+                      parsed_args.resume, parsed_args.checkpoint_interval, gdal_mode=parsed_args.gdal_mode,
+                      rpc_densify=parsed_args.rpc_densify, las_reader=parsed_args.las_reader,
+                      vlr_encoding=parsed_args.vlr_encoding, timeout=parsed_args.timeout,
+                      db_url=parsed_args.db_url, db_batch=parsed_args.db_batch, format=parsed_args.format,
+                      compress=parsed_args.compress, dedup_json=parsed_args.dedup_json)
+    if parsed_args.profile:
+        # View with: python -m pstats PSTATS
+        profiler.disable()
+        profiler.dump_stats(parsed_args.profile)
+        print(f'Saved profile "{parsed_args.profile}"', file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    main(sys.argv)
+    # main(['python','/mnt/datapool2/Archive/EO_IMAGERY/raw/aoi/'])
+
@@ -1,14 +1,14 @@
--- createdb.sql
-\! clear
-\set ECHO all
----
-CREATE DATABASE catalog;
----
-\c catalog
----
-CREATE EXTENSION IF NOT EXISTS postgis CASCADE;
-CREATE EXTENSION IF NOT EXISTS postgis_topology CASCADE;
-CREATE EXTENSION IF NOT EXISTS postgis_raster CASCADE;
-CREATE EXTENSION IF NOT EXISTS postgis_sfcgal CASCADE;
-CREATE EXTENSION IF NOT EXISTS postgis_tiger_geocoder CASCADE;
----
+-- createdb.sql
+\! clear
+\set ECHO all
+---
+CREATE DATABASE catalog;
+---
+\c catalog
+---
+CREATE EXTENSION IF NOT EXISTS postgis CASCADE;
+CREATE EXTENSION IF NOT EXISTS postgis_topology CASCADE;
+CREATE EXTENSION IF NOT EXISTS postgis_raster CASCADE;
+CREATE EXTENSION IF NOT EXISTS postgis_sfcgal CASCADE;
+CREATE EXTENSION IF NOT EXISTS postgis_tiger_geocoder CASCADE;
+---
@@ -1,5 +1,4 @@
 import re
-import laspy
 from pyproj import CRS, exceptions
 from pyproj.database import query_crs_info
 
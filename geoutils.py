@@ -1,580 +1,1028 @@
-# Geospatial Utilities (GDAL et al).
-import sys
-import os
-import json
-from osgeo import gdal
-from osgeo import osr
-import platform
-import subprocess
-from utils import dumps, posixpath
-import datetime
-
-import pyproj
-
-from typing import Any, Dict, Union
-from pathlib import Path
-from typing import Any, Dict, List, Mapping, MutableMapping, Sequence, Union
-
-from laspy.point.format import PointFormat as _LasPointFormat  # type: ignore
-from crs_fix import crs_from_ascii_strings  # type: ignore
-
-# Import laspy for LAS/LAZ file handling
-try:
-    import laspy
-    import numpy as np
-    HAS_LASPY = True
-except ImportError:
-    HAS_LASPY = False
-    print("Warning: laspy not installed. LAS/LAZ file processing will not be available.", file=sys.stderr)
-
-
-# def build_bbox(xs, ys):
-#     """Builds BBox from xs and ys (or lons and lats) lists."""
-#     min_x = min(xs)
-#     max_x = max(xs)
-#     min_y = min(ys)
-#     max_y = max(ys)
-#     bbox = {
-#         'type': 'Polygon',
-#         'coordinates': [
-#             [
-#                 [min_x, min_y],
-#                 [min_x, max_y],
-#                 [max_x, max_y],
-#                 [max_x, min_y],
-#                 [min_x, min_y]
-#             ]
-#         ]
-#     }
-#     return bbox
-
-
-def gdal_info(filepath):
-    """Returns Gdalinfo as compact JSON."""
-    # Equivalent to: 
-    #   'gdalinfo -json -proj4 '{dirpath}\\{filename}' | jq -c .'.
-    if platform.system() == 'Windows':
-        return _gdal_info_subprocess(filepath)
-    elif platform.system() == 'Linux':
-        return _gdal_info_native(filepath)
-    raise NotImplementedError('Running on an unknown OS!')
-
-def _gdal_info_native(filepath):
-    """Returns Gdalinfo via native wrappers.
-       Native (python API bindings over native) 
-       skips case-sensitive '22633_TRING_1_4band' after '22633_TRING_1_4Band'."""
-    try:
-        gdal.UseExceptions() # default versus # gdal.DontUseExceptions()
-        dataset = gdal.Open(filepath)
-        return gdal.Info(dataset, options=gdal.InfoOptions(
-            format='json',
-            options=[
-            ])
-        )
-    except Exception as ex:
-        msg = f'gdal_info_native: failed on {filepath}: {str(ex)}.'
-        print(msg, file=sys.stderr)
-    return None
-
-def _gdal_info_subprocess(filepath):
-    """Returns Gdalinfo via subprocess.
-       Subprocess (exe or binary) picks up 
-       case-sensitive '22633_TRING_1_4band' after '22633_TRING_1_4Band'."""
-    try:
-        result = subprocess.run(
-            [
-                'gdalinfo',
-                '-json',
-                filepath,
-            ],
-            capture_output=True,
-            check=True,
-            text=True,
-        )
-        return json.loads(result.stdout)
-    except subprocess.CalledProcessError as ex:
-        msg = f'gdal_info_subprocess: failed on {filepath}: {ex.stderr}.'
-        print(msg, file=sys.stderr)
-    return None
-
-
-
-def gdal_transform_rpc(filepath, epsg, coords):
-    """Returns Gdaltransform with -rpc to transform a list of (x, y, z) coordinates.
-        Args:
-            dirpath (str): Directory path to the image.
-            filename (str): Image filename.
-            coords (list of tuples): List of (x, y, z) coordinates.
-        Returns:
-            list of str: Transformed coordinates as strings."""
-    # Equivalent to:  
-    # 'gdalinfo IMG_...JP2 
-    # | awk '/Upper Left/{ul=$0} /Upper Right/{ur=$0} /Lower Right/{lr=$0} /Lower Left/{ll=$0} 
-    # END {print ul RS ur RS lr RS ll RS ul}' 
-    # | sed -E 's/.*\(\s*([0-9.+-]+),\s*([0-9.+-]+).*/\1 \2/' 
-    # | gdaltransform -rpc -t_srs EPSG:4326 IMG_...JP2'.
-    try:
-        cmd = [
-            'gdaltransform',
-            '-rpc',
-            '-t_srs', f'EPSG:{epsg}',
-            filepath
-        ]
-        # Join all coordinates into a single input string
-
-        # {'upperLeft': [0.0, 0.0], 'lowerLeft': [0.0, 351.0], 'lowerRight': [275.0, 351.0], 'upperRight': [275.0, 0.0], 'center': [137.5, 175.5]}
-        coords_str = '\n'.join(
-            f"{coords[key][0]} {coords[key][1]}" for key in ('upperLeft', 'upperRight', 'lowerRight', 'lowerLeft', 'center')
-        )
-
-
-        result = subprocess.run(
-            cmd,
-            input=coords_str.encode(),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True,
-        )
-        resultstring = result.stdout.decode().strip()
-
-        coords_new = coords.copy()
-
-        # update coords
-        for i, key in enumerate(('upperLeft', 'upperRight', 'lowerRight', 'lowerLeft', 'center')):
-            x, y, z  = map(float, resultstring.splitlines()[i].split())
-            coords_new[key] = [x, y]
-
-
-        return coords_new
-    except subprocess.CalledProcessError as ex:
-        msg = f'gdal_transform_rpc: failed on {filepath}: {ex.stderr.decode().strip()}'
-        print(msg, file=sys.stderr)
-    return None
-
-def _gdal_contains_epsg( gdalinfo):
-    """Return gdalinfo contains epsg crs other than WGS84 Extents."""
-    # Gdalinfo 'stac'.'proj:epsg'
-    if gdalinfo and 'stac' in gdalinfo and 'proj:epsg' in gdalinfo['stac']:
-        return gdalinfo['stac']['proj:epsg']
-    return None
-
-def _gdal_contains_rpc(gdalinfo):
-    """Return gdalinfo contains rpc data."""
-    # Gdalinfo 'metadata'.'rpc'
-    if gdalinfo and 'metadata' in gdalinfo and 'RPC' in gdalinfo['metadata']:
-        return gdalinfo['metadata']['RPC']
-    return None
-
-
-
-def transform_coords(coords, src_crs, tgt_crs):
-
-
-#   print(f'Transforming corner coordinates from EPSG:{src_crs} to {tgt_crs}', file=sys.stderr)
-
-    new_coords = coords.copy()
-
-    # Set up source and target spatial references
-    src_srs = osr.SpatialReference()
-    src_srs.ImportFromEPSG((src_crs))
-    src_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
-
-    tgt_srs = osr.SpatialReference()
-    tgt_epsg = int(tgt_crs)
-    tgt_srs.ImportFromEPSG(tgt_epsg)
-    tgt_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
-
-    transform = osr.CoordinateTransformation(src_srs, tgt_srs)
-    # Transform each corner coordinate
-    for key in ('upperLeft', 'upperRight', 'lowerRight', 'lowerLeft'):
-        x, y = coords[key]
-        x2, y2, _ = transform.TransformPoint(x, y)
-        new_coords[key] = [x2, y2]
-
-    return new_coords
-
-
-
-
-def getbound_poly(filepath,infojson=None,target_crs=3857):
-
-    if infojson is None:
-       infojson = gdal_info(filepath)
-
-    if not infojson:
-        msg = f'gdal_info_failed on {filepath}.'
-        print(msg, file=sys.stderr)
-        return None, None
-        
-
-    crs = _gdal_contains_epsg(infojson)
-    original_crs = crs  # Store the original CRS
-
-    if 'cornerCoordinates' not in infojson:
-        msg = f'gdal_info: no cornerCoordinates in {filepath}.'
-        print(msg, file=sys.stderr)
-        return None
-    
-    coords = infojson['cornerCoordinates']
-
-    if not crs:
-        # if rpcdata is present
-        rpcdata = _gdal_contains_rpc(infojson)
-        if rpcdata:
-            print(f'gdal_info: using RPC data for {filepath}.', file=sys.stderr)
-            # coords, use pixel counts
-            coords = gdal_transform_rpc(filepath, target_crs, coords)
-            crs = target_crs # altready transformed
-            original_crs = 0  # RPC data doesn't have a specific EPSG code
-        else:
-            msg = f'gdal_info: no EPSG CRS in {filepath} and no RPC data.'
-            print(msg, file=sys.stderr)
-            return None, None
-        
-        
-    #CRS exists
-    
-# print(f'CRS for {filepath}: {crs} Target CRS: {target_crs}', file=sys.stderr)    if crs != target_crs:
-    try:
-        coords = transform_coords(coords, crs, target_crs)
-
-    except Exception as ex:
-        msg = f'Coordinate transformation failed for {filepath}: {ex}'
-        print(msg, file=sys.stderr)
-        return None, None
-    
-    polygon = {
-        'type': 'Polygon',  # GeoJSON type  
-        'coordinates': [
-            [
-                [coords['upperLeft'][0], coords['upperLeft'][1]],
-                [coords['upperRight'][0], coords['upperRight'][1]],
-                [coords['lowerRight'][0], coords['lowerRight'][1]],
-                [coords['lowerLeft'][0], coords['lowerLeft'][1]],
-                [coords['upperLeft'][0], coords['upperLeft'][1]]  # Closing the polygon
-            ]
-        ],
-    }
-    return polygon, original_crs
-
-
-
-
-def _serialise(value: Any) -> Any:  # noqa: C901 – complexity acceptable
-    """Recursively convert *value* into JSON‑friendly primitives."""
-
-    # ── Bytes → UTF‑8 string / list[int] ─────────────────────────────────────
-    if isinstance(value, (bytes, bytearray)):
-        try:
-            return value.decode("utf-8")
-        except UnicodeDecodeError:
-            return list(value)
-
-    # ── NumPy scalars / arrays ───────────────────────────────────────────────
-    if isinstance(value, np.generic):
-        return value.item()
-    if isinstance(value, np.ndarray):
-        return value.tolist()
-
-    # ── Path objects → str ───────────────────────────────────────────────────
-    if isinstance(value, Path):
-        return str(value)
-
-    # ── laspy PointFormat special‑case ───────────────────────────────────────
-    if _LasPointFormat is not None and isinstance(value, _LasPointFormat):  # type: ignore[arg-type]
-        return {
-            "id": value.id,
-            "size": value.size ,
-            "num_extra_bytes ": value.num_extra_bytes,
-            "num_standard_bytes ": value.num_standard_bytes ,
-            "dimensions": [d.name for d in value.dimensions],
-        }
-
-    # ── Mapping (dict‑like) → recurse over keys/values ───────────────────────
-    if isinstance(value, Mapping):  # includes dict, defaultdict, OrderedDict …
-        return {str(k): _serialise(v) for k, v in value.items()}
-
-    # ── Sequence / set but **not** (str, bytes) → recurse element‑wise ───────
-    if isinstance(value, (list, tuple, set, frozenset)):
-        return [_serialise(v) for v in value]
-    
-    # datetime.date
-    if isinstance(value, datetime.date):
-        return value.isoformat()
-
-    # ── Fallback: if JSON accepts it, keep; else stringify ───────────────────
-    try:
-        json.dumps(value)
-        return value
-    except TypeError:
-        return str(value)
-
-
-
-
-def get_las_info(filepath):
-    """Returns LAS/LAZ file information as a dictionary."""
-    if not HAS_LASPY:
-        msg = f'las_info: laspy not installed, cannot process {filepath}.'
-        print(msg, file=sys.stderr)
-        return None
-
-    try:
-        with laspy.open(filepath) as las_file:
-            header = las_file.header
-
-            # convert header into json-like dictionary
-            info: Dict[str, Any] = {}
-            for name in dir(header):
-                if name.startswith("_"):
-                    continue  # Skip private attrs
-                try:
-                    val = getattr(header, name)
-                except AttributeError:
-                    continue
-
-                # Skip callables (methods, properties w/ arguments, etc.)
-                if callable(val):
-                    continue
-
-                # Special‑case Variable Length Records
-                if name == "vlrs":
-                    val = [
-                        {
-                            "user_id": v.user_id,
-                            "record_id": v.record_id,
-                            "description": v.description,
-                            # if has record data
-                        # "AttributeError: 'GeoKeyDirectoryVlr' object has no attribute 'record_data'"
-                            # Raw bytes converted to list of ints for JSON safety
-                            "record_data": list(v.record_data) if hasattr(v, 'record_data') else None,
-
-                            # "record_data": list(v.record_data),
-                        }
-                        for v in val
-                    ]
-
-                info[name] = _serialise(val)
-              # Extract CRS information if available and store it instead of the raw header object
-            crs_info = header.parse_crs()
-
-            # if crs_info is not None:
-            #         # 'COMPD_CS***
-            #     if 'COMPD_CS' in crs_info.srs:
-            #         ascii_vlr = header.vlrs.get("GeoAsciiParamsVlr")
-            #         if ascii_vlr:
-            #             crs_info2 = crs_from_ascii_strings(ascii_vlr[0].strings)
-
-
-
-            if crs_info is None:
-                info['bad_crs'] = True
-                ascii_vlr = header.vlrs.get("GeoAsciiParamsVlr")
-                if ascii_vlr:
-                     crs_info = crs_from_ascii_strings(ascii_vlr[0].strings)
-
-            if crs_info is None:
-                info['crs'] = None
-                info['srs'] = None
-            else:
-                info['crs'] = crs_info.to_json_dict()
-                info['srs'] = crs_info.to_2d().to_epsg() if crs_info.srs else None
-            
-            # Store header properties we might need later, but don't store the raw header object
-            info['header_info'] = {
-                'version': header.version,
-                'point_format': _serialise(header.point_format),
-                'scales': _serialise(header.scales),
-                'offsets': _serialise(header.offsets)
-            }
-            
-            # Extract corner coordinates
-            corner_coordinates = {
-                'upperLeft': [float(header.mins[0]), float(header.maxs[1])],
-                'upperRight': [float(header.maxs[0]), float(header.maxs[1])],
-                'lowerRight': [float(header.maxs[0]), float(header.mins[1])],
-                'lowerLeft': [float(header.mins[0]), float(header.mins[1])],
-                'center': [
-                    float(header.mins[0] + (header.maxs[0] - header.mins[0]) / 2),
-                    float(header.mins[1] + (header.maxs[1] - header.mins[1]) / 2)
-                ]
-            }
-            
-            info['cornerCoordinates'] = corner_coordinates
-            
-            return info
-    except Exception as ex:
-        msg = f'las_info: failed on {filepath}: {str(ex)}.'
-        print(msg, file=sys.stderr)
-    
-    return None
-
-
-def get_las_crs(header):
-
-    crsdata = header.parse_crs()
-    crs = crsdata.srs
-    return crs if crs else None
-
-
-   
-
-def getbound_poly_las(filepath, las_info=None, target_crs=3857):
-    """Get the bounding polygon for a LAS/LAZ file."""
-    if not HAS_LASPY:
-        msg = f'getbound_poly_las: laspy not installed, cannot process {filepath}.'
-        print(msg, file=sys.stderr)
-        return None, None
-    
-    if las_info is None:
-        las_info = get_las_info(filepath)
-    
-    if not las_info or 'cornerCoordinates' not in las_info:
-        msg = f'las_info: no cornerCoordinates in {filepath}.'
-        print(msg, file=sys.stderr)
-        return None, None
-    
-    coords = las_info['cornerCoordinates']
-      # Try to determine the source CRS from the LAS file
-    src_crs = None
-    if 'srs' in las_info:
-        src_crs = las_info['srs']
-
-    # get as int after epsg
-    # src_crs = int(src_crs.split(':')[-1]) if src_crs else None
-    # src_crs = int(src_crs.split(':')[-1]) if src_crs else None
-    
-    # Store the original CRS for returning later
-    original_crs = src_crs
-    
-    # If we couldn't determine the CRS from the file, use a default
-    # or inform the user that we're making an assumption
-    if not src_crs:
-        print(f"Warning: Could not determine CRS for {filepath}", file=sys.stderr)
-        src_crs = None  # WGS 84 as a reasonable default for LiDAR data    # Transform coordinates if necessary
-    if src_crs != target_crs:
-        try:
-            print(f"Transforming LAS coordinates from EPSG:{src_crs} to EPSG:{target_crs}", file=sys.stderr)
-            coords = transform_coords(coords, src_crs, target_crs)
-        except Exception as ex:
-            msg = f"Coordinate transformation failed for LAS file {filepath}: {ex}"
-            print(msg, file=sys.stderr)
-            # Continue with untransformed coordinates rather than failing completely
-
-    # Check for Infinity values in coordinates
-    for corner in ['upperLeft', 'upperRight', 'lowerRight', 'lowerLeft']:
-        if corner not in coords:
-            print(f"Warning: Missing {corner} coordinate in {filepath}", file=sys.stderr)
-            return None, original_crs
-        
-        # Check if values are numbers and not infinity or NaN
-        for val in coords[corner]:
-            if not isinstance(val, (int, float)) or not np.isfinite(val):
-                print(f"Warning: Invalid coordinate value {val} in {corner} for {filepath}", file=sys.stderr)
-                return None, original_crs
-    
-    # Create polygon only if all coordinates are valid
-    polygon = {
-        'type': 'Polygon',  # GeoJSON type  
-        'coordinates': [
-            [
-                [coords['upperLeft'][0], coords['upperLeft'][1]],
-                [coords['upperRight'][0], coords['upperRight'][1]],
-                [coords['lowerRight'][0], coords['lowerRight'][1]],
-                [coords['lowerLeft'][0], coords['lowerLeft'][1]],
-                [coords['upperLeft'][0], coords['upperLeft'][1]]  # Closing the polygon
-            ]
-        ],
-    }
-    
-    # Final safety check - convert to string and check for "Infinity"
-    polygon_str = json.dumps(polygon)
-    if "Infinity" in polygon_str or "NaN" in polygon_str:
-        print(f"Warning: Found Infinity or NaN in final polygon for {filepath}, returning None", file=sys.stderr)
-        return None, original_crs
-        
-    return polygon, original_crs
-
-
-if __name__ == '__main__':
-
-    from tests.testpaths import testpaths
-
-    # Tests for geoutils.
-    # mnt/datapool2/Archive/EO_IMAGERY/raw/aoi/Curranyalpa_AOI2/Curranyalpa_AOI2/01_Raw/JL1KF01C_PMSL6_20250118084319_200341659_101_0021_001_L1_978900/JL1KF01C_PMSL6_20250118084319_200341659_101_0021_001_L1_MSS_978900/JL1KF01C_PMSL6_20250118084319_200341659_101_0021_001_L1_MSS_978900.tif
-    def tests_geoutils_gdal_info_native():
-        for filepath in testpaths:
-            print(f'filepath={filepath}', file=sys.stderr)
-            result = _gdal_info_native(filepath)
-            result_str = dumps(result)
-            print(f'result_str={result_str}', file=sys.stderr)
-
-    def tests_geoutils_gdal_info_subprocess():
-        for filepath in testpaths:
-            print(f'filepath={filepath}', file=sys.stderr)
-            result = _gdal_info_subprocess(filepath)
-            result_str = dumps(result)
-            print(f'result_str={result_str}', file=sys.stderr)
-
-    def test_polygon():
-        for filepath in testpaths:
-            ext = os.path.splitext(filepath)[1].lower()
-            if ext not in ('.tif', '.jp2', '.tiff'):
-                print(f'Skipping non-image file: {filepath}', file=sys.stderr)
-                continue
-            # print(f'filepath={filepath}', file=sys.stderr)
-            polygon = getbound_poly(filepath)
-            if polygon:
-                print(f'Polygon for {filepath}: {dumps(polygon)}', file=sys.stderr)
-            else:
-                print(f'Failed to get polygon for {filepath}', file=sys.stderr)
-              
-    def test_las_crs(filepath):
-        """Test function to extract CRS information from a LAS/LAZ file."""
-        if not filepath.lower().endswith(('.las', '.laz')):
-            return None
-        
-        try:
-            with laspy.open(filepath) as las_file:
-                header = las_file.header
-                crs_info = get_las_crs(header)
-                return crs_info
-        except Exception as ex:
-            print(f"Error extracting CRS from {filepath}: {ex}", file=sys.stderr)
-            return None   
-    def test_las():
-        for filepath in testpaths:
-            if filepath.lower().endswith(('.las', '.laz')):
-                print(f'Testing LAS/LAZ file: {filepath}', file=sys.stderr)
-                info = get_las_info(filepath)
-                if info:
-                    dumps_info = json.dumps(info, indent=2)
-                    print(f'LAS info for {filepath}:\n{dumps_info}', file=sys.stderr)
-                    # Extract and display CRS information from the serialized info
-                    crs_code = None
-                    if 'crs' in info:
-                        crs_code = info['crs']
-                    
-                    if crs_code:
-                        print(f'Detected CRS for {filepath}: EPSG:{crs_code}', file=sys.stderr)
-                    else:
-                        print(f'Could not detect CRS for {filepath}, using default', file=sys.stderr)
-                    
-                    # Generate and display polygon
-                    polygon = getbound_poly_las(filepath, info)
-                    if polygon:
-                        print(f'LAS polygon for {filepath}: {dumps(polygon)}', file=sys.stderr)
-                    else:
-                        print(f'Failed to get LAS polygon for {filepath}', file=sys.stderr)
-                else:
-                    print(f'Failed to get LAS info for {filepath}', file=sys.stderr)
-
-    def tests():
-        # tests_geoutils_gdal_info_native()
-        # tests_geoutils_gdal_info_subprocess()
-        test_polygon()
-        if HAS_LASPY:
-            test_las()
-
-
+# Geospatial Utilities (GDAL et al).
+import sys
+import os
+import json
+from osgeo import gdal
+from osgeo import osr
+import platform
+import subprocess
+import functools
+import base64
+from utils import dumps, posixpath, timed
+import datetime
+import math
+
+import pyproj
+
+from typing import Any, Dict, Union
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, MutableMapping, Sequence, Union
+
+from crs_fix import crs_from_ascii_strings  # type: ignore
+from lasutils import read_las_header, parse_las_crs, las_crs_vlrs, las_crs_key, is_known_vlr, encode_vlr_compact
+
+# Import laspy for LAS/LAZ file handling
+try:
+    import laspy
+    import numpy as np
+    from laspy.point.format import PointFormat as _LasPointFormat  # type: ignore
+    HAS_LASPY = True
+except ImportError:
+    np = None
+    _LasPointFormat = None
+    HAS_LASPY = False
+    print("Warning: laspy not installed. LAS/LAZ file processing will not be available.", file=sys.stderr)
+
+
+# def build_bbox(xs, ys):
+#     """Builds BBox from xs and ys (or lons and lats) lists."""
+#     min_x = min(xs)
+#     max_x = max(xs)
+#     min_y = min(ys)
+#     max_y = max(ys)
+#     bbox = {
+#         'type': 'Polygon',
+#         'coordinates': [
+#             [
+#                 [min_x, min_y],
+#                 [min_x, max_y],
+#                 [max_x, max_y],
+#                 [max_x, min_y],
+#                 [min_x, min_y]
+#             ]
+#         ]
+#     }
+#     return bbox
+
+
+def gdal_open(filepath, fast=False, siblings=None):
+    """Returns raster dataset opened read-only as gdal_info opens it, None on failure.
+       Pass it to gdal_info and getbound_poly to open the file only once."""
+    try:
+        gdal.UseExceptions()
+        with timed('gdal_open'):
+            if not fast:
+                return gdal.Open(filepath)
+            with gdal.config_option('GDAL_DISABLE_READDIR_ON_OPEN', 'EMPTY_DIR' if siblings is None else 'FALSE'):
+                return gdal.OpenEx(filepath, gdal.OF_RASTER | gdal.OF_READONLY, sibling_files=siblings)
+    except Exception as ex:
+        msg = f'gdal_open: failed on {filepath}: {str(ex)}.'
+        print(msg, file=sys.stderr)
+    return None
+
+def gdal_info(filepath, fast=False, siblings=None, dataset=None):
+    """Returns Gdalinfo as compact JSON.
+       If fast, returns only the header fields getbound_poly and the PSV need,
+       opening with siblings (directory filenames) instead of a directory scan.
+       dataset is an already open gdal_open dataset, unused by the subprocess."""
+    # Equivalent to: 
+    #   'gdalinfo -json -proj4 '{dirpath}\\{filename}' | jq -c .'.
+    if fast:
+        return _gdal_info_fast(filepath, siblings, dataset)
+    if platform.system() == 'Windows':
+        return _gdal_info_subprocess(filepath)
+    elif platform.system() == 'Linux':
+        return _gdal_info_native(filepath, dataset)
+    raise NotImplementedError('Running on an unknown OS!')
+
+def _gdal_info_native(filepath, dataset=None):
+    """Returns Gdalinfo via native wrappers.
+       Native (python API bindings over native) 
+       skips case-sensitive '22633_TRING_1_4band' after '22633_TRING_1_4Band'."""
+    try:
+        gdal.UseExceptions() # default versus # gdal.DontUseExceptions()
+        if dataset is None:
+            with timed('gdal_open'):
+                dataset = gdal.Open(filepath)
+        with timed('gdal_info'):
+            return gdal.Info(dataset, options=gdal.InfoOptions(
+                format='json',
+                options=[
+                ])
+            )
+    except Exception as ex:
+        msg = f'gdal_info_native: failed on {filepath}: {str(ex)}.'
+        print(msg, file=sys.stderr)
+    return None
+
+def _gdal_info_fast(filepath, siblings=None, dataset=None):
+    """Returns header-only subset of Gdalinfo via native wrappers.
+       Opens read-only with the known sibling filenames (or no directory scan at all
+       if None) and reads no statistics, histograms, overviews or metadata domains
+       other than RPC. Keys match the full Gdalinfo JSON."""
+    try:
+        gdal.UseExceptions()
+        if dataset is None:
+            with timed('gdal_open'), \
+                 gdal.config_option('GDAL_DISABLE_READDIR_ON_OPEN', 'EMPTY_DIR' if siblings is None else 'FALSE'):
+                dataset = gdal.OpenEx(filepath, gdal.OF_RASTER | gdal.OF_READONLY, sibling_files=siblings)
+        width, height = dataset.RasterXSize, dataset.RasterYSize
+        info = {
+            'description': filepath,
+            'driverShortName': dataset.GetDriver().ShortName,
+            'size': [width, height],
+        }
+        stac = {
+            'proj:shape': [height, width],
+        }
+        srs = dataset.GetSpatialRef()
+        if srs is not None:
+            info['coordinateSystem'] = {
+                'wkt': srs.ExportToWkt(['FORMAT=WKT2_2019']),
+            }
+            if srs.GetAuthorityName(None) == 'EPSG':
+                stac['proj:epsg'] = int(srs.GetAuthorityCode(None))
+        geotransform = dataset.GetGeoTransform(can_return_null=True)
+        if geotransform is not None:
+            info['geoTransform'] = list(geotransform)
+            stac['proj:transform'] = list(geotransform)
+        info['stac'] = stac
+        rpc = dataset.GetMetadata('RPC')
+        if rpc:
+            info['metadata'] = {'RPC': rpc}
+        # Without a geotransform Gdalinfo reports corners in pixel/line
+        gt = geotransform or (0.0, 1.0, 0.0, 0.0, 0.0, 1.0)
+        def corner(x, y):
+            return [gt[0] + x * gt[1] + y * gt[2], gt[3] + x * gt[4] + y * gt[5]]
+        info['cornerCoordinates'] = {
+            'upperLeft': corner(0, 0),
+            'lowerLeft': corner(0, height),
+            'lowerRight': corner(width, height),
+            'upperRight': corner(width, 0),
+            'center': corner(width / 2, height / 2),
+        }
+        bands = []
+        for i in range(1, dataset.RasterCount + 1):
+            band = dataset.GetRasterBand(i)
+            bands.append({
+                'band': i,
+                'type': gdal.GetDataTypeName(band.DataType),
+                'colorInterpretation': gdal.GetColorInterpretationName(band.GetColorInterpretation()),
+            })
+            nodata = band.GetNoDataValue()
+            if nodata is not None:
+                bands[-1]['noDataValue'] = nodata
+        info['bands'] = bands
+        return info
+    except Exception as ex:
+        msg = f'gdal_info_fast: failed on {filepath}: {str(ex)}.'
+        print(msg, file=sys.stderr)
+    return None
+
+def _gdal_info_subprocess(filepath):
+    """Returns Gdalinfo via subprocess.
+       Subprocess (exe or binary) picks up 
+       case-sensitive '22633_TRING_1_4band' after '22633_TRING_1_4Band'."""
+    try:
+        result = subprocess.run(
+            [
+                'gdalinfo',
+                '-json',
+                filepath,
+            ],
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+        return json.loads(result.stdout)
+    except subprocess.CalledProcessError as ex:
+        msg = f'gdal_info_subprocess: failed on {filepath}: {ex.stderr}.'
+        print(msg, file=sys.stderr)
+    return None
+
+
+
+RPC_COORD_KEYS = ('upperLeft', 'upperRight', 'lowerRight', 'lowerLeft', 'center')
+
+
+def gdal_transform_rpc(filepath, epsg, coords, dataset=None, densify=0):
+    """Returns pixel/line corner coords transformed to EPSG epsg with the image RPCs.
+       In-process equivalent of Gdaltransform with -rpc, see _gdal_transform_rpc_native."""
+    return _gdal_transform_rpc_native(filepath, epsg, coords, dataset, densify)
+
+def _densify_ring(points, densify):
+    """Returns closed ring through points with densify extra points interpolated along each edge."""
+    ring = []
+    for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]):
+        for i in range(densify + 1):
+            t = i / (densify + 1)
+            ring.append([x0 + (x1 - x0) * t, y0 + (y1 - y0) * t])
+    ring.append(ring[0])
+    return ring
+
+def _gdal_transform_rpc_native(filepath, epsg, coords, dataset=None, densify=0):
+    """Returns pixel/line corner coords transformed to EPSG epsg via native RPC transformer.
+        Args:
+            filepath (str): Image filepath, opened if dataset is None.
+            epsg (int): Target EPSG code.
+            coords (dict): Gdalinfo cornerCoordinates in pixel/line.
+            dataset (gdal.Dataset): Already open image dataset.
+            densify (int): Extra points per footprint edge, 0 for none.
+        Returns:
+            dict: Transformed coords, plus a closed 'footprint' ring if densify."""
+    try:
+        gdal.UseExceptions()
+        if dataset is None:
+            dataset = gdal.Open(filepath)
+        transformer = gdal.Transformer(dataset, None, ['METHOD=RPC', f'DST_SRS=EPSG:{epsg}'])
+        points = [coords[key] for key in RPC_COORD_KEYS]
+        if densify:
+            points += _densify_ring([coords[key] for key in CORNER_KEYS], densify)
+        results, success = transformer.TransformPoints(0, points)
+        if not all(success):
+            raise RuntimeError(f'{success.count(0)} of {len(points)} points failed')
+
+        coords_new = coords.copy()
+        for key, (x, y, z) in zip(RPC_COORD_KEYS, results):
+            coords_new[key] = [x, y]
+        if densify:
+            coords_new['footprint'] = [[x, y] for x, y, z in results[len(RPC_COORD_KEYS):]]
+        return coords_new
+    except Exception as ex:
+        msg = f'gdal_transform_rpc_native: failed on {filepath}: {str(ex)}'
+        print(msg, file=sys.stderr)
+    return None
+
+def _gdal_transform_rpc_subprocess(filepath, epsg, coords):
+    """Returns Gdaltransform with -rpc to transform a list of (x, y, z) coordinates.
+        Args:
+            dirpath (str): Directory path to the image.
+            filename (str): Image filename.
+            coords (list of tuples): List of (x, y, z) coordinates.
+        Returns:
+            list of str: Transformed coordinates as strings."""
+    # Equivalent to:  
+    # 'gdalinfo IMG_...JP2 
+    # | awk '/Upper Left/{ul=$0} /Upper Right/{ur=$0} /Lower Right/{lr=$0} /Lower Left/{ll=$0} 
+    # END {print ul RS ur RS lr RS ll RS ul}' 
+    # | sed -E 's/.*\(\s*([0-9.+-]+),\s*([0-9.+-]+).*/\1 \2/' 
+    # | gdaltransform -rpc -t_srs EPSG:4326 IMG_...JP2'.
+    try:
+        cmd = [
+            'gdaltransform',
+            '-rpc',
+            '-t_srs', f'EPSG:{epsg}',
+            filepath
+        ]
+        # Join all coordinates into a single input string
+
+        # {'upperLeft': [0.0, 0.0], 'lowerLeft': [0.0, 351.0], 'lowerRight': [275.0, 351.0], 'upperRight': [275.0, 0.0], 'center': [137.5, 175.5]}
+        coords_str = '\n'.join(
+            f"{coords[key][0]} {coords[key][1]}" for key in ('upperLeft', 'upperRight', 'lowerRight', 'lowerLeft', 'center')
+        )
+
+
+        result = subprocess.run(
+            cmd,
+            input=coords_str.encode(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+        resultstring = result.stdout.decode().strip()
+
+        coords_new = coords.copy()
+
+        # update coords
+        for i, key in enumerate(('upperLeft', 'upperRight', 'lowerRight', 'lowerLeft', 'center')):
+            x, y, z  = map(float, resultstring.splitlines()[i].split())
+            coords_new[key] = [x, y]
+
+
+        return coords_new
+    except subprocess.CalledProcessError as ex:
+        msg = f'gdal_transform_rpc_subprocess: failed on {filepath}: {ex.stderr.decode().strip()}'
+        print(msg, file=sys.stderr)
+    return None
+
+def _gdal_contains_epsg( gdalinfo):
+    """Return gdalinfo contains epsg crs other than WGS84 Extents."""
+    # Gdalinfo 'stac'.'proj:epsg'
+    if gdalinfo and 'stac' in gdalinfo and 'proj:epsg' in gdalinfo['stac']:
+        return gdalinfo['stac']['proj:epsg']
+    return None
+
+def _gdal_contains_rpc(gdalinfo):
+    """Return gdalinfo contains rpc data."""
+    # Gdalinfo 'metadata'.'rpc'
+    if gdalinfo and 'metadata' in gdalinfo and 'RPC' in gdalinfo['metadata']:
+        return gdalinfo['metadata']['RPC']
+    return None
+
+
+
+CORNER_KEYS = ('upperLeft', 'upperRight', 'lowerRight', 'lowerLeft')
+
+
+@functools.lru_cache(maxsize=64)
+def coordinate_transformation(src_crs, tgt_crs, axis_order=osr.OAMS_TRADITIONAL_GIS_ORDER):
+    """Returns cached CoordinateTransformation from EPSG src_crs to EPSG tgt_crs.
+       A crawl only sees a handful of source CRSs, so the SRS setup is done once per pair."""
+    # Set up source and target spatial references
+    src_srs = osr.SpatialReference()
+    src_srs.ImportFromEPSG(src_crs)
+    src_srs.SetAxisMappingStrategy(axis_order)
+
+    tgt_srs = osr.SpatialReference()
+    tgt_srs.ImportFromEPSG(tgt_crs)
+    tgt_srs.SetAxisMappingStrategy(axis_order)
+
+    return osr.CoordinateTransformation(src_srs, tgt_srs)
+
+def transform_coords(coords, src_crs, tgt_crs):
+
+
+#   print(f'Transforming corner coordinates from EPSG:{src_crs} to {tgt_crs}', file=sys.stderr)
+
+    new_coords = coords.copy()
+
+    transform = coordinate_transformation(int(src_crs), int(tgt_crs))
+    # Transform each corner coordinate
+    for key in CORNER_KEYS:
+        x, y = coords[key]
+        x2, y2, _ = transform.TransformPoint(x, y)
+        new_coords[key] = [x2, y2]
+
+    return new_coords
+
+def transform_coords_batch(coords_list, src_crs, tgt_crs):
+    """Returns corner coordinates of many files transformed from src_crs to tgt_crs at once.
+       All corners go through a single TransformPoints call of the cached transformation
+       used by transform_coords. Files with a corner TransformPoints can't transform (not
+       finite) are redone by transform_coords, so results, inf or the exception, are the same."""
+    if not coords_list:
+        return []
+    transform = coordinate_transformation(int(src_crs), int(tgt_crs))
+    points = [coords[key] for coords in coords_list for key in CORNER_KEYS]
+    transformed = transform.TransformPoints(points)
+    new_coords_list = []
+    for i, coords in enumerate(coords_list):
+        corners = [list(_[:2]) for _ in transformed[i * len(CORNER_KEYS):(i + 1) * len(CORNER_KEYS)]]
+        if not all(math.isfinite(_) for corner in corners for _ in corner):
+            new_coords_list.append(transform_coords(coords, src_crs, tgt_crs))
+            continue
+        new_coords = coords.copy()
+        new_coords.update(zip(CORNER_KEYS, corners))
+        new_coords_list.append(new_coords)
+    return new_coords_list
+
+def transform_cache_info():
+    """Returns coordinate transformation cache hits, misses and size."""
+    info = coordinate_transformation.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'currsize': info.currsize}
+
+
+
+
+def getbound_poly(filepath,infojson=None,target_crs=3857,dataset=None,rpc_densify=0):
+    """Returns bounding polygon in target_crs, original EPSG crs (0 for RPC) from gdalinfo.
+       RPC footprints get rpc_densify extra points per edge."""
+
+    if infojson is None:
+       infojson = gdal_info(filepath)
+
+    if not infojson:
+        msg = f'gdal_info_failed on {filepath}.'
+        print(msg, file=sys.stderr)
+        return None, None
+        
+
+    crs = _gdal_contains_epsg(infojson)
+    original_crs = crs  # Store the original CRS
+
+    if 'cornerCoordinates' not in infojson:
+        msg = f'gdal_info: no cornerCoordinates in {filepath}.'
+        print(msg, file=sys.stderr)
+        return None
+    
+    coords = infojson['cornerCoordinates']
+
+    if not crs:
+        # if rpcdata is present
+        rpcdata = _gdal_contains_rpc(infojson)
+        if rpcdata:
+            print(f'gdal_info: using RPC data for {filepath}.', file=sys.stderr)
+            # coords, use pixel counts
+            with timed('gdal_transform_rpc'):
+                coords = gdal_transform_rpc(filepath, target_crs, coords, dataset, rpc_densify)
+            crs = target_crs # altready transformed
+            original_crs = 0  # RPC data doesn't have a specific EPSG code
+        else:
+            msg = f'gdal_info: no EPSG CRS in {filepath} and no RPC data.'
+            print(msg, file=sys.stderr)
+            return None, None
+        
+        
+    #CRS exists
+    
+# print(f'CRS for {filepath}: {crs} Target CRS: {target_crs}', file=sys.stderr)    if crs != target_crs:
+    try:
+        with timed('transform_coords'):
+            coords = transform_coords(coords, crs, target_crs)
+
+    except Exception as ex:
+        msg = f'Coordinate transformation failed for {filepath}: {ex}'
+        print(msg, file=sys.stderr)
+        return None, None
+    
+    if 'footprint' in coords:
+        # Densified RPC footprint, already in target_crs
+        polygon = {
+            'type': 'Polygon',  # GeoJSON type
+            'coordinates': [coords['footprint']],
+        }
+        return polygon, original_crs
+
+    polygon = {
+        'type': 'Polygon',  # GeoJSON type  
+        'coordinates': [
+            [
+                [coords['upperLeft'][0], coords['upperLeft'][1]],
+                [coords['upperRight'][0], coords['upperRight'][1]],
+                [coords['lowerRight'][0], coords['lowerRight'][1]],
+                [coords['lowerLeft'][0], coords['lowerLeft'][1]],
+                [coords['upperLeft'][0], coords['upperLeft'][1]]  # Closing the polygon
+            ]
+        ],
+    }
+    return polygon, original_crs
+
+
+
+
+def _serialise(value: Any, compact: bool = False) -> Any:  # noqa: C901 – complexity acceptable
+    """Recursively convert *value* into JSON‑friendly primitives.
+       If *compact*, non UTF-8 bytes become base64 strings instead of list[int]."""
+
+    # ── Bytes → UTF‑8 string / list[int] ─────────────────────────────────────
+    if isinstance(value, (bytes, bytearray)):
+        try:
+            return value.decode("utf-8")
+        except UnicodeDecodeError:
+            return base64.b64encode(value).decode("ascii") if compact else list(value)
+
+    # ── NumPy scalars / arrays (laspy headers only) ─────────────────────────
+    if np is not None and isinstance(value, np.generic):
+        return value.item()
+    if np is not None and isinstance(value, np.ndarray):
+        return value.tolist()
+
+    # ── Path objects → str ───────────────────────────────────────────────────
+    if isinstance(value, Path):
+        return str(value)
+
+    # ── laspy PointFormat special‑case ───────────────────────────────────────
+    if _LasPointFormat is not None and isinstance(value, _LasPointFormat):  # type: ignore[arg-type]
+        return {
+            "id": value.id,
+            "size": value.size ,
+            "num_extra_bytes ": value.num_extra_bytes,
+            "num_standard_bytes ": value.num_standard_bytes ,
+            "dimensions": [d.name for d in value.dimensions],
+        }
+
+    # ── Mapping (dict‑like) → recurse over keys/values ───────────────────────
+    if isinstance(value, Mapping):  # includes dict, defaultdict, OrderedDict …
+        return {str(k): _serialise(v, compact) for k, v in value.items()}
+
+    # ── Sequence / set but **not** (str, bytes) → recurse element‑wise ───────
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [_serialise(v, compact) for v in value]
+    
+    # datetime.date
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+
+    # ── Fallback: if JSON accepts it, keep; else stringify ───────────────────
+    try:
+        json.dumps(value)
+        return value
+    except TypeError:
+        return str(value)
+
+
+
+
+def _las_vlr(user_id, record_id, description, record_data, known, vlr_encoding='raw'):
+    """Returns VLR as JSON-friendly dict.
+       'raw' keeps record_data as list of ints (None for VLRs laspy knows),
+       'compact' decodes CRS VLRs and base64 encodes the rest, see lasutils.encode_vlr_compact."""
+    if vlr_encoding == 'compact':
+        return encode_vlr_compact(user_id, record_id, description, record_data)
+    return {
+        "user_id": user_id,
+        "record_id": record_id,
+        "description": description,
+        # Raw bytes converted to list of ints for JSON safety
+        "record_data": None if known or record_data is None else list(record_data),
+    }
+
+def get_las_info(filepath, fast=False, vlr_encoding='raw'):
+    """Returns LAS/LAZ file information as a dictionary.
+       If fast, reads the raw header and VLRs with lasutils, falling back to laspy on failure.
+       vlr_encoding 'compact' decodes CRS VLRs and base64 encodes other binary, see _las_vlr."""
+    compact = vlr_encoding == 'compact'
+    if fast:
+        try:
+            return _get_las_info_fast(filepath, vlr_encoding)
+        except Exception as ex:
+            msg = f'las_info_fast: failed on {filepath}: {str(ex)}, falling back to laspy.'
+            print(msg, file=sys.stderr)
+
+    if not HAS_LASPY:
+        msg = f'las_info: laspy not installed, cannot process {filepath}.'
+        print(msg, file=sys.stderr)
+        return None
+
+    try:
+        with laspy.open(filepath) as las_file:
+            header = las_file.header
+
+            # convert header into json-like dictionary
+            info: Dict[str, Any] = {}
+            for name in dir(header):
+                if name.startswith("_"):
+                    continue  # Skip private attrs
+                try:
+                    val = getattr(header, name)
+                except AttributeError:
+                    continue
+
+                # Skip callables (methods, properties w/ arguments, etc.)
+                if callable(val):
+                    continue
+
+                # Special‑case Variable Length Records, EVLRs alike (None before LAS 1.4)
+                if name in ("vlrs", "evlrs") and val is not None:
+                    val = [
+                        _las_vlr(
+                            v.user_id,
+                            v.record_id,
+                            v.description,
+                            # "AttributeError: 'GeoKeyDirectoryVlr' object has no attribute 'record_data'"
+                            v.record_data_bytes() if compact else getattr(v, 'record_data', None),
+                            not hasattr(v, 'record_data'),
+                            vlr_encoding,
+                        )
+                        for v in val
+                    ]
+                elif name == "global_encoding":
+                    # Bit field object, the raw value as the header stores it
+                    val = val.value
+
+                info[name] = _serialise(val, compact)
+              # Extract CRS information if available and store it instead of the raw header object
+            # if crs_info is not None:
+            #         # 'COMPD_CS***
+            #     if 'COMPD_CS' in crs_info.srs:
+            #         ascii_vlr = header.vlrs.get("GeoAsciiParamsVlr")
+            #         if ascii_vlr:
+            #             crs_info2 = crs_from_ascii_strings(ascii_vlr[0].strings)
+
+            def ascii_strings():
+                ascii_vlr = header.vlrs.get("GeoAsciiParamsVlr")
+                return ascii_vlr[0].strings if ascii_vlr else None
+
+            crs_vlrs = [(v.user_id, v.record_id, v.record_data_bytes())
+                        for v in list(header.vlrs) + list(header.evlrs or [])]
+            crs_key = 'laspy:' + las_crs_key(crs_vlrs, header.global_encoding.value)
+            _las_crs_fields(info, resolve_las_crs(crs_key, header.parse_crs, ascii_strings))
+            
+            # Store header properties we might need later, but don't store the raw header object
+            info['header_info'] = {
+                'version': header.version,
+                'point_format': _serialise(header.point_format),
+                'scales': _serialise(header.scales),
+                'offsets': _serialise(header.offsets)
+            }
+            
+            # Extract corner coordinates
+            info['cornerCoordinates'] = _las_corner_coordinates(header.mins, header.maxs)
+            
+            return info
+    except Exception as ex:
+        msg = f'las_info: failed on {filepath}: {str(ex)}.'
+        print(msg, file=sys.stderr)
+    
+    return None
+
+def _get_las_info_fast(filepath, vlr_encoding='raw'):
+    """Returns LAS/LAZ file information from the raw header, same keys, types and order as
+       get_las_info via laspy."""
+    header = read_las_header(filepath)
+    info: Dict[str, Any] = {}
+    for name, val in header.items():
+        if name in ("vlrs", "evlrs") and val is not None:
+            val = [
+                _las_vlr(
+                    v['user_id'],
+                    v['record_id'],
+                    v['description'],
+                    v['record_data'],
+                    # laspy parses known VLRs into classes without record_data
+                    is_known_vlr(v['user_id'], v['record_id']),
+                    vlr_encoding,
+                )
+                for v in val
+            ]
+        info[name] = _serialise(val, vlr_encoding == 'compact')
+    # Per-axis header properties, as laspy exposes them
+    for i, axis in enumerate('xyz'):
+        info[f'{axis}_max'] = header['maxs'][i]
+        info[f'{axis}_min'] = header['mins'][i]
+        info[f'{axis}_offset'] = header['offsets'][i]
+        info[f'{axis}_scale'] = header['scales'][i]
+    # laspy header attributes are listed by dir(), in sorted order
+    info = {name: info[name] for name in sorted(info)}
+
+    crs_vlrs = [(v['user_id'], v['record_id'], v['record_data']) for v in header['vlrs'] + (header['evlrs'] or [])]
+    crs_key = 'fast:' + las_crs_key(crs_vlrs, header['global_encoding'])
+    crs = resolve_las_crs(crs_key, lambda: parse_las_crs(header),
+                          lambda: las_crs_vlrs(header)['ascii_strings'])
+    _las_crs_fields(info, crs)
+
+    info['header_info'] = {
+        'version': header['version'],
+        'point_format': header['point_format'],
+        'scales': header['scales'],
+        'offsets': header['offsets'],
+    }
+    info['cornerCoordinates'] = _las_corner_coordinates(header['mins'], header['maxs'])
+    return info
+
+# Resolved LAS CRS per las_crs_key, (bad_crs, crs PROJ JSON, srs 2D EPSG code)
+LAS_CRS_CACHE_SIZE = 1024
+_las_crs_cache = {}
+_las_crs_cache_stats = {'hits': 0, 'misses': 0}
+
+def resolve_las_crs(key, parse_crs, ascii_strings):
+    """Return (bad_crs, crs, srs) for CRS VLRs key, resolved once per process.
+       On a miss parse_crs() gives a pyproj CRS or None, if None the ascii_strings()
+       are tried with crs_fix.crs_from_ascii_strings. The PROJ JSON and EPSG lookup
+       (to_epsg queries the PROJ database) are cached, not the CRS."""
+    if key in _las_crs_cache:
+        _las_crs_cache_stats['hits'] += 1
+        return _las_crs_cache[key]
+    _las_crs_cache_stats['misses'] += 1
+    crs_info = parse_crs()
+    bad_crs = crs_info is None
+    if bad_crs:
+        strings = ascii_strings()
+        if strings:
+            crs_info = crs_from_ascii_strings(strings)
+    if crs_info is None:
+        resolved = bad_crs, None, None
+    else:
+        resolved = bad_crs, crs_info.to_json_dict(), crs_info.to_2d().to_epsg() if crs_info.srs else None
+    if len(_las_crs_cache) >= LAS_CRS_CACHE_SIZE:
+        _las_crs_cache.clear()
+    _las_crs_cache[key] = resolved
+    return resolved
+
+def las_crs_cache_info():
+    """Return LAS CRS cache hits, misses and size for this process."""
+    return dict(_las_crs_cache_stats, size=len(_las_crs_cache))
+
+def _las_crs_fields(info, crs):
+    """Set info bad_crs (if unresolved from VLRs), crs (PROJ JSON) and srs (2D EPSG code)
+       from resolve_las_crs (bad_crs, crs, srs)."""
+    bad_crs, info_crs, srs = crs
+    if bad_crs:
+        info['bad_crs'] = True
+    info['crs'] = info_crs
+    info['srs'] = srs
+
+def _las_corner_coordinates(mins, maxs):
+    """Returns Gdalinfo-like cornerCoordinates from LAS header mins and maxs."""
+    return {
+        'upperLeft': [float(mins[0]), float(maxs[1])],
+        'upperRight': [float(maxs[0]), float(maxs[1])],
+        'lowerRight': [float(maxs[0]), float(mins[1])],
+        'lowerLeft': [float(mins[0]), float(mins[1])],
+        'center': [
+            float(mins[0] + (maxs[0] - mins[0]) / 2),
+            float(mins[1] + (maxs[1] - mins[1]) / 2)
+        ]
+    }
+
+
+def get_las_crs(header):
+
+    crsdata = header.parse_crs()
+    crs = crsdata.srs
+    return crs if crs else None
+
+
+   
+
+def getbound_poly_las(filepath, las_info=None, target_crs=3857):
+    """Get the bounding polygon for a LAS/LAZ file."""
+    if las_info is None:
+        las_info = get_las_info(filepath)
+    
+    if not las_info or 'cornerCoordinates' not in las_info:
+        msg = f'las_info: no cornerCoordinates in {filepath}.'
+        print(msg, file=sys.stderr)
+        return None, None
+    
+    coords = las_info['cornerCoordinates']
+      # Try to determine the source CRS from the LAS file
+    src_crs = None
+    if 'srs' in las_info:
+        src_crs = las_info['srs']
+
+    # get as int after epsg
+    # src_crs = int(src_crs.split(':')[-1]) if src_crs else None
+    # src_crs = int(src_crs.split(':')[-1]) if src_crs else None
+    
+    # Store the original CRS for returning later
+    original_crs = src_crs
+    
+    # If we couldn't determine the CRS from the file, use a default
+    # or inform the user that we're making an assumption
+    if not src_crs:
+        print(f"Warning: Could not determine CRS for {filepath}", file=sys.stderr)
+        src_crs = None  # WGS 84 as a reasonable default for LiDAR data    # Transform coordinates if necessary
+    if src_crs != target_crs:
+        try:
+            print(f"Transforming LAS coordinates from EPSG:{src_crs} to EPSG:{target_crs}", file=sys.stderr)
+            with timed('transform_coords'):
+                coords = transform_coords(coords, src_crs, target_crs)
+        except Exception as ex:
+            msg = f"Coordinate transformation failed for LAS file {filepath}: {ex}"
+            print(msg, file=sys.stderr)
+            # Continue with untransformed coordinates rather than failing completely
+
+    # Check for Infinity values in coordinates
+    for corner in ['upperLeft', 'upperRight', 'lowerRight', 'lowerLeft']:
+        if corner not in coords:
+            print(f"Warning: Missing {corner} coordinate in {filepath}", file=sys.stderr)
+            return None, original_crs
+        
+        # Check if values are numbers and not infinity or NaN
+        for val in coords[corner]:
+            if not isinstance(val, (int, float)) or not math.isfinite(val):
+                print(f"Warning: Invalid coordinate value {val} in {corner} for {filepath}", file=sys.stderr)
+                return None, original_crs
+    
+    # Create polygon only if all coordinates are valid
+    polygon = {
+        'type': 'Polygon',  # GeoJSON type  
+        'coordinates': [
+            [
+                [coords['upperLeft'][0], coords['upperLeft'][1]],
+                [coords['upperRight'][0], coords['upperRight'][1]],
+                [coords['lowerRight'][0], coords['lowerRight'][1]],
+                [coords['lowerLeft'][0], coords['lowerLeft'][1]],
+                [coords['upperLeft'][0], coords['upperLeft'][1]]  # Closing the polygon
+            ]
+        ],
+    }
+    
+    # Final safety check - convert to string and check for "Infinity"
+    polygon_str = json.dumps(polygon)
+    if "Infinity" in polygon_str or "NaN" in polygon_str:
+        print(f"Warning: Found Infinity or NaN in final polygon for {filepath}, returning None", file=sys.stderr)
+        return None, original_crs
+        
+    return polygon, original_crs
+
+
+if __name__ == '__main__':
+
+    from tests.testpaths import testpaths
+
+    # Tests for geoutils.
+    # mnt/datapool2/Archive/EO_IMAGERY/raw/aoi/Curranyalpa_AOI2/Curranyalpa_AOI2/01_Raw/JL1KF01C_PMSL6_20250118084319_200341659_101_0021_001_L1_978900/JL1KF01C_PMSL6_20250118084319_200341659_101_0021_001_L1_MSS_978900/JL1KF01C_PMSL6_20250118084319_200341659_101_0021_001_L1_MSS_978900.tif
+    def tests_geoutils_gdal_info_native():
+        for filepath in testpaths:
+            print(f'filepath={filepath}', file=sys.stderr)
+            result = _gdal_info_native(filepath)
+            result_str = dumps(result)
+            print(f'result_str={result_str}', file=sys.stderr)
+
+    def tests_geoutils_gdal_info_subprocess():
+        for filepath in testpaths:
+            print(f'filepath={filepath}', file=sys.stderr)
+            result = _gdal_info_subprocess(filepath)
+            result_str = dumps(result)
+            print(f'result_str={result_str}', file=sys.stderr)
+
+    def tests_geoutils_gdal_info_modes(repeat=5):
+        """Benchmark full versus fast gdal_info and compare the fields getbound_poly uses."""
+        import time
+        filepaths = [_ for _ in testpaths if os.path.isfile(_)
+                     and os.path.splitext(_)[1].lower() in ('.tif', '.tiff', '.jp2')]
+        for filepath in filepaths:
+            siblings = sorted(os.listdir(os.path.dirname(filepath)))
+            timings = {}
+            for mode in ('full', 'fast'):
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    info = gdal_info(filepath, fast=(mode == 'fast'), siblings=siblings)
+                timings[mode] = (time.perf_counter() - start) / repeat
+                timings[mode + '_poly'] = getbound_poly(filepath, info)
+            same = timings['full_poly'] == timings['fast_poly']
+            print(f'{filepath}: full={timings["full"]:.4f}s fast={timings["fast"]:.4f}s same_poly={same}', file=sys.stderr)
+
+    def tests_geoutils_gdal_transform_rpc():
+        """Compare native RPC transformer against gdaltransform -rpc subprocess."""
+        for filepath in testpaths:
+            if not os.path.isfile(filepath):
+                continue
+            info = gdal_info(filepath)
+            if _gdal_contains_epsg(info) or not _gdal_contains_rpc(info):
+                continue
+            native = _gdal_transform_rpc_native(filepath, 4326, info['cornerCoordinates'])
+            subproc = _gdal_transform_rpc_subprocess(filepath, 4326, info['cornerCoordinates'])
+            print(f'{filepath}: native={native} subprocess={subproc}', file=sys.stderr)
+
+    def tests_geoutils_gdal_transform_rpc_synthetic(tolerance=1e-6):
+        """Compare native RPC transformer, with and without an open dataset, against
+           gdaltransform -rpc subprocess at rpc_densify=0 on a synthetic RPC GeoTIFF."""
+        import shutil
+        import tempfile
+        if shutil.which('gdaltransform') is None:
+            print('gdaltransform not found, skipping RPC comparison', file=sys.stderr)
+            return
+        # Affine RPCs (sample from longitude, line from latitude) over a 100x100 image
+        coeffs = lambda *head: ' '.join(str(_) for _ in head + (0,) * (20 - len(head)))
+        rpc = {
+            'LINE_OFF': '50', 'SAMP_OFF': '50', 'LINE_SCALE': '50', 'SAMP_SCALE': '50',
+            'LAT_OFF': '-33.0', 'LONG_OFF': '150.0', 'HEIGHT_OFF': '0',
+            'LAT_SCALE': '0.01', 'LONG_SCALE': '0.01', 'HEIGHT_SCALE': '1',
+            'LINE_NUM_COEFF': coeffs(0, 0, -1), 'LINE_DEN_COEFF': coeffs(1),
+            'SAMP_NUM_COEFF': coeffs(0, 1), 'SAMP_DEN_COEFF': coeffs(1),
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filepath = os.path.join(tmpdir, 'rpc.tif')
+            dataset = gdal.GetDriverByName('GTiff').Create(filepath, 100, 100, 1, gdal.GDT_Byte)
+            dataset.SetMetadata(rpc, 'RPC')
+            dataset = None
+            siblings = sorted(os.listdir(tmpdir))
+            for fast in (False, True):
+                dataset = gdal_open(filepath, fast=fast, siblings=siblings)
+                info = gdal_info(filepath, fast=fast, siblings=siblings, dataset=dataset)
+                assert _gdal_contains_rpc(info) and not _gdal_contains_epsg(info)
+                coords = info['cornerCoordinates']
+                reused = _gdal_transform_rpc_native(filepath, 4326, coords, dataset)
+                reopened = _gdal_transform_rpc_native(filepath, 4326, coords)
+                subproc = _gdal_transform_rpc_subprocess(filepath, 4326, coords)
+                assert reused == reopened, (reused, reopened)
+                for key in RPC_COORD_KEYS:
+                    assert all(abs(a - b) <= tolerance for a, b in zip(reused[key], subproc[key])), \
+                        (key, reused[key], subproc[key])
+                assert getbound_poly(filepath, info, 4326, dataset) == getbound_poly(filepath, info, 4326)
+                dataset = None
+        print(f'RPC native and subprocess agree within {tolerance}', file=sys.stderr)
+
+    def test_transform_cache():
+        """Compare cached corner transformation against an uncached CoordinateTransformation."""
+        coords = {'upperLeft': [500000.0, 6350000.0], 'upperRight': [510000.0, 6350000.0],
+                  'lowerRight': [510000.0, 6340000.0], 'lowerLeft': [500000.0, 6340000.0]}
+        src_srs, tgt_srs = osr.SpatialReference(), osr.SpatialReference()
+        src_srs.ImportFromEPSG(28356)
+        tgt_srs.ImportFromEPSG(3857)
+        for srs in (src_srs, tgt_srs):
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        uncached = osr.CoordinateTransformation(src_srs, tgt_srs)
+        expected = {key: list(uncached.TransformPoint(*coords[key])[:2]) for key in CORNER_KEYS}
+        before = transform_cache_info()
+        for _ in range(3):
+            assert transform_coords(coords, 28356, 3857) == expected
+        after = transform_cache_info()
+        assert after['hits'] - before['hits'] >= 2, (before, after)
+        print(f'transform_cache_info={after}', file=sys.stderr)
+
+    def test_transform_batch():
+        """Compare batched against per-file corner transformation, including corners at the
+           pole and beyond it, outside the Web Mercator domain."""
+        def corners(x0, y0, x1, y1):
+            return {'upperLeft': [x0, y1], 'upperRight': [x1, y1], 'lowerRight': [x1, y0],
+                    'lowerLeft': [x0, y0], 'center': [(x0 + x1) / 2, (y0 + y1) / 2]}
+        cases = {
+            28356: [corners(500000.0 + i * 1000, 6340000.0, 501000.0 + i * 1000, 6341000.0) for i in range(5)],
+            4326: [corners(150.0, -34.0, 151.0, -33.0), corners(-180.0, 80.0, 180.0, 90.0),
+                   corners(0.0, 89.0, 1.0, 91.0), corners(10.5, 45.25, 11.0, 46.0)],
+        }
+        for epsg, coords_list in cases.items():
+            single = []
+            for coords in coords_list:
+                try:
+                    single.append(transform_coords(coords, epsg, 3857))
+                except Exception as ex:
+                    single.append(type(ex))
+            try:
+                batch = transform_coords_batch(coords_list, epsg, 3857)
+            except Exception as ex:
+                # Only a file the per-file path fails on may fail the batch
+                assert type(ex) in single, (epsg, ex, single)
+                continue
+            # repr, so inf and nan compare as the per-file path gives them
+            assert repr(batch) == repr(single), (epsg, batch, single)
+            assert all(_['center'] == coords['center'] for _, coords in zip(batch, coords_list))
+        print('transform_coords_batch matches transform_coords', file=sys.stderr)
+
+    def test_polygon():
+        for filepath in testpaths:
+            ext = os.path.splitext(filepath)[1].lower()
+            if ext not in ('.tif', '.jp2', '.tiff'):
+                print(f'Skipping non-image file: {filepath}', file=sys.stderr)
+                continue
+            # print(f'filepath={filepath}', file=sys.stderr)
+            polygon = getbound_poly(filepath)
+            if polygon:
+                print(f'Polygon for {filepath}: {dumps(polygon)}', file=sys.stderr)
+            else:
+                print(f'Failed to get polygon for {filepath}', file=sys.stderr)
+              
+    def test_las_crs(filepath):
+        """Test function to extract CRS information from a LAS/LAZ file."""
+        if not filepath.lower().endswith(('.las', '.laz')):
+            return None
+        
+        try:
+            with laspy.open(filepath) as las_file:
+                header = las_file.header
+                crs_info = get_las_crs(header)
+                return crs_info
+        except Exception as ex:
+            print(f"Error extracting CRS from {filepath}: {ex}", file=sys.stderr)
+            return None   
+    def test_las():
+        for filepath in testpaths:
+            if filepath.lower().endswith(('.las', '.laz')):
+                print(f'Testing LAS/LAZ file: {filepath}', file=sys.stderr)
+                info = get_las_info(filepath)
+                if info:
+                    dumps_info = json.dumps(info, indent=2)
+                    print(f'LAS info for {filepath}:\n{dumps_info}', file=sys.stderr)
+                    # Extract and display CRS information from the serialized info
+                    crs_code = None
+                    if 'crs' in info:
+                        crs_code = info['crs']
+                    
+                    if crs_code:
+                        print(f'Detected CRS for {filepath}: EPSG:{crs_code}', file=sys.stderr)
+                    else:
+                        print(f'Could not detect CRS for {filepath}, using default', file=sys.stderr)
+                    
+                    # Generate and display polygon
+                    polygon = getbound_poly_las(filepath, info)
+                    if polygon:
+                        print(f'LAS polygon for {filepath}: {dumps(polygon)}', file=sys.stderr)
+                    else:
+                        print(f'Failed to get LAS polygon for {filepath}', file=sys.stderr)
+                else:
+                    print(f'Failed to get LAS info for {filepath}', file=sys.stderr)
+
+    def test_las_reader_parity():
+        """Compare fast raw header reader against laspy on synthetic LAS 1.2 (GeoKeys),
+           LAS 1.4 (WKT, an EVLR) and LAS 1.5 (GPS time range) files with extra header and
+           VLR bytes. The whole info dict must serialise to the same JSON text."""
+        import tempfile
+        from laspy.vlrs.vlrlist import VLRList
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for version, point_format in (('1.2', 3), ('1.4', 6), ('1.5', 6)):
+                filepath = os.path.join(tmpdir, f'synthetic_{version}.las')
+                try:
+                    header = laspy.LasHeader(point_format=point_format, version=version)
+                except laspy.LaspyException:
+                    print(f'laspy {laspy.__version__} has no LAS {version}, skipped', file=sys.stderr)
+                    continue
+                header.offsets = [500000.0, 6340000.0, 0.0]
+                header.scales = [0.01, 0.01, 0.01]
+                header.add_crs(pyproj.CRS.from_epsg(28356))
+                header.extra_header_bytes = b'xy'
+                header.extra_vlr_bytes = b'\x00\x01\xff'
+                if version != '1.2':
+                    header.evlrs = VLRList([laspy.VLR('test_user', 42, 'test evlr', b'\x01\x02payload')])
+                las = laspy.LasData(header, points=laspy.ScaleAwarePointRecord.zeros(3, header=header))
+                las.x = np.array([500000.0, 500100.5, 500050.25])
+                las.y = np.array([6340000.0, 6340200.75, 6340100.5])
+                las.z = np.array([10.0, 20.0, 15.5])
+                if las.point_format.id >= 6:
+                    las.gps_time = np.array([5.0, 1.5, 3.0])
+                las.write(filepath)
+                for vlr_encoding in ('raw', 'compact'):
+                    fast = dumps(get_las_info(filepath, fast=True, vlr_encoding=vlr_encoding))
+                    slow = dumps(get_las_info(filepath, fast=False, vlr_encoding=vlr_encoding))
+                    assert fast == slow, (version, vlr_encoding, fast, slow)
+                    assert json.loads(fast)['srs'] == 28356
+        print('LAS fast reader matches laspy', file=sys.stderr)
+
+    def tests():
+        # tests_geoutils_gdal_info_native()
+        # tests_geoutils_gdal_info_subprocess()
+        # tests_geoutils_gdal_info_modes()
+        test_transform_cache()
+        test_transform_batch()
+        # tests_geoutils_gdal_transform_rpc()
+        tests_geoutils_gdal_transform_rpc_synthetic()
+        test_polygon()
+        if HAS_LASPY:
+            test_las_reader_parity()
+            test_las()
+
+
     tests()
\ No newline at end of file
@@ -0,0 +1,394 @@
+# LAS/LAZ Utilities (raw header reader).
+import sys
+import struct
+import uuid
+import base64
+import hashlib
+import datetime
+
+
+# Public header block, LAS 1.0-1.2 part (227 bytes)
+HEADER_STRUCT = struct.Struct(
+    '<4s'   # file signature 'LASF'
+    'H'     # file source id (reserved in 1.0)
+    'H'     # global encoding (reserved in 1.0)
+    '16s'   # project id GUID
+    'B'     # version major
+    'B'     # version minor
+    '32s'   # system identifier
+    '32s'   # generating software
+    'H'     # file creation day of year
+    'H'     # file creation year
+    'H'     # header size
+    'L'     # offset to point data
+    'L'     # number of variable length records
+    'B'     # point data format id
+    'H'     # point data record length
+    'L'     # legacy number of point records
+    '5L'    # legacy number of points by return
+    '3d'    # x, y, z scale factors
+    '3d'    # x, y, z offsets
+    '6d'    # max x, min x, max y, min y, max z, min z
+)
+# LAS 1.3 addition
+HEADER_13_STRUCT = struct.Struct('<Q')  # start of waveform data packet record
+# LAS 1.4 additions
+HEADER_14_STRUCT = struct.Struct(
+    '<Q'    # start of first extended variable length record
+    'L'     # number of extended variable length records
+    'Q'     # number of point records
+    '15Q'   # number of points by return
+)
+# LAS 1.5 additions
+HEADER_15_STRUCT = struct.Struct(
+    '<d'    # max GPS time
+    'd'     # min GPS time
+    'H'     # GPS time offset
+)
+VLR_HEADER_STRUCT = struct.Struct('<H16sHH32s')
+EVLR_HEADER_STRUCT = struct.Struct('<H16sHQ32s')
+
+# EVLR payloads larger than this (e.g. waveform data) are not read
+EVLR_MAX_READ = 1024 * 1024
+
+# Compact VLR encoding cap, per record bytes of binary payload or characters of text
+VLR_MAX_BYTES = 64 * 1024
+
+# Points by return slots, laspy always has the 15 of LAS 1.4
+NUMBER_OF_RETURNS = 15
+
+# laspy LasHeader class defaults, listed with the header attributes of every file
+DEFAULT_VERSION = [1, 2]
+DEFAULT_POINT_FORMAT = 3
+
+# VLRs laspy parses into known record classes, (user_id, record_id or None for any)
+KNOWN_VLRS = (
+    ('LASF_Projection', None),
+    ('LASF_Spec', None),
+    ('laszip encoded', 22204),
+    ('copc', None),
+)
+
+GEO_KEY_DIRECTORY = ('LASF_Projection', 34735)
+GEO_DOUBLE_PARAMS = ('LASF_Projection', 34736)
+GEO_ASCII_PARAMS = ('LASF_Projection', 34737)
+WKT_MATH_TRANSFORM = ('LASF_Projection', 2111)
+WKT_COORDINATE_SYSTEM = ('LASF_Projection', 2112)
+LASZIP = ('laszip encoded', 22204)
+
+# VLRs the CRS is resolved from
+CRS_VLRS = (GEO_KEY_DIRECTORY, GEO_DOUBLE_PARAMS, GEO_ASCII_PARAMS, WKT_COORDINATE_SYSTEM)
+
+# GeoTIFF keys holding an EPSG code
+PROJECTED_CS_TYPE_GEO_KEY = 3072
+GEOGRAPHIC_TYPE_GEO_KEY = 2048
+USER_DEFINED = 32767
+
+# Global encoding bit 4, CRS is WKT (LAS 1.4)
+GLOBAL_ENCODING_WKT = 0x10
+
+# Standard point format dimensions, as named by laspy
+_FORMAT_0 = [
+    'X', 'Y', 'Z', 'intensity', 'return_number', 'number_of_returns',
+    'scan_direction_flag', 'edge_of_flight_line', 'classification',
+    'synthetic', 'key_point', 'withheld', 'scan_angle_rank', 'user_data',
+    'point_source_id',
+]
+_FORMAT_6 = [
+    'X', 'Y', 'Z', 'intensity', 'return_number', 'number_of_returns',
+    'synthetic', 'key_point', 'withheld', 'overlap', 'scanner_channel',
+    'scan_direction_flag', 'edge_of_flight_line', 'classification',
+    'user_data', 'scan_angle', 'point_source_id', 'gps_time',
+]
+_GPS = ['gps_time']
+_RGB = ['red', 'green', 'blue']
+_NIR = ['nir']
+_WAVEPACKET = [
+    'wavepacket_index', 'wavepacket_offset', 'wavepacket_size',
+    'return_point_wave_location', 'x_t', 'y_t', 'z_t',
+]
+POINT_FORMATS = {
+    # id: (standard record size, dimension names)
+    0: (20, _FORMAT_0),
+    1: (28, _FORMAT_0 + _GPS),
+    2: (26, _FORMAT_0 + _RGB),
+    3: (34, _FORMAT_0 + _GPS + _RGB),
+    4: (57, _FORMAT_0 + _GPS + _WAVEPACKET),
+    5: (63, _FORMAT_0 + _GPS + _RGB + _WAVEPACKET),
+    6: (30, _FORMAT_6),
+    7: (36, _FORMAT_6 + _RGB),
+    8: (38, _FORMAT_6 + _RGB + _NIR),
+    9: (59, _FORMAT_6 + _WAVEPACKET),
+    10: (67, _FORMAT_6 + _RGB + _NIR + _WAVEPACKET),
+}
+
+
+def _cstr(value):
+    """Return NUL padded bytes as stripped string."""
+    return value.split(b'\0', 1)[0].decode('ascii', errors='replace').strip()
+
+def _creation_date(year, day):
+    """Return creation date from year and day of year, or None if not set."""
+    if not year or not day:
+        return None
+    try:
+        return datetime.date(year, 1, 1) + datetime.timedelta(days=day - 1)
+    except (ValueError, OverflowError):
+        return None
+
+def is_known_vlr(user_id, record_id):
+    """Return VLR is parsed by laspy into a known record class."""
+    return any(user_id == uid and (rid is None or record_id == rid) for uid, rid in KNOWN_VLRS)
+
+def point_format_info(point_format_id, record_length):
+    """Return point format description, same keys as geoutils._serialise of a laspy PointFormat."""
+    size, dimensions = POINT_FORMATS[point_format_id]
+    return {
+        "id": point_format_id,
+        "size": record_length,
+        "num_extra_bytes ": record_length - size,
+        "num_standard_bytes ": size,
+        "dimensions": list(dimensions),
+    }
+
+def _read_vlrs(data, offset, count):
+    """Return VLR dicts parsed from header bytes starting at offset, and the offset after them."""
+    vlrs = []
+    for _ in range(count):
+        reserved, user_id, record_id, length, description = VLR_HEADER_STRUCT.unpack_from(data, offset)
+        offset += VLR_HEADER_STRUCT.size
+        record_data = bytes(data[offset:offset + length])
+        if len(record_data) != length:
+            raise ValueError(f'VLR {_cstr(user_id)}/{record_id} truncated')
+        offset += length
+        vlrs.append({
+            'user_id': _cstr(user_id),
+            'record_id': record_id,
+            'description': _cstr(description),
+            'record_data': record_data,
+        })
+    return vlrs, offset
+
+def _read_evlrs(f, offset, count):
+    """Return EVLR dicts read from file f starting at offset.
+       Payloads over EVLR_MAX_READ are not read, their record_data is None."""
+    evlrs = []
+    for _ in range(count):
+        f.seek(offset)
+        head = f.read(EVLR_HEADER_STRUCT.size)
+        reserved, user_id, record_id, length, description = EVLR_HEADER_STRUCT.unpack(head)
+        offset += EVLR_HEADER_STRUCT.size
+        record_data = f.read(length) if length <= EVLR_MAX_READ else None
+        offset += length
+        evlrs.append({
+            'user_id': _cstr(user_id),
+            'record_id': record_id,
+            'description': _cstr(description),
+            'record_data': record_data,
+        })
+    return evlrs
+
+def read_las_header(filepath):
+    """Returns LAS/LAZ 1.0-1.5 public header block, VLRs and EVLRs as a dictionary, with the
+       header attributes of a laspy LasHeader (evlrs is None before LAS 1.4, as in laspy).
+       Reads only the header and VLR bytes (up to the point data) and EVLR headers,
+       so compressed LAZ point data is never touched."""
+    with open(filepath, 'rb') as f:
+        data = f.read(HEADER_STRUCT.size)
+        if len(data) != HEADER_STRUCT.size or data[:4] != b'LASF':
+            raise ValueError(f'{filepath} is not a LAS/LAZ file')
+        (signature, file_source_id, global_encoding, guid, major, minor,
+         system_identifier, generating_software, creation_day, creation_year,
+         header_size, offset_to_point_data, number_of_vlrs, point_format_id,
+         point_record_length, legacy_point_count, *rest) = HEADER_STRUCT.unpack(data)
+        legacy_points_by_return = list(rest[0:5]) + [0] * (NUMBER_OF_RETURNS - 5)
+        scales = list(rest[5:8])
+        offsets = list(rest[8:11])
+        x_max, x_min, y_max, y_min, z_max, z_min = rest[11:17]
+
+        # Header and VLRs up to the point data, in one read
+        data += f.read(max(offset_to_point_data, header_size) - len(data))
+
+        header = {
+            'file_source_id': file_source_id,
+            'global_encoding': global_encoding,
+            'uuid': str(uuid.UUID(bytes_le=guid)),
+            'version': [major, minor],
+            'major_version': major,
+            'minor_version': minor,
+            'system_identifier': _cstr(system_identifier),
+            'generating_software': _cstr(generating_software),
+            'creation_date': _creation_date(creation_year, creation_day),
+            'offset_to_point_data': offset_to_point_data,
+            # Bits 6/7 flag LAZ compressed points
+            'are_points_compressed': bool(point_format_id & 0xC0),
+            'point_format': point_format_info(point_format_id & 0x3F, point_record_length),
+            'point_count': legacy_point_count,
+            'number_of_points_by_return': legacy_points_by_return,
+            'scales': scales,
+            'offsets': offsets,
+            'mins': [x_min, y_min, z_min],
+            'maxs': [x_max, y_max, z_max],
+            'start_of_waveform_data_packet_record': 0,
+            'start_of_first_evlr': 0,
+            'number_of_evlrs': 0,
+            'max_gps_time': 0.0,
+            'min_gps_time': 0.0,
+            'gps_time_offset': 0,
+            'DEFAULT_VERSION': DEFAULT_VERSION,
+            'DEFAULT_POINT_FORMAT': point_format_info(DEFAULT_POINT_FORMAT, POINT_FORMATS[DEFAULT_POINT_FORMAT][0]),
+        }
+        offset = HEADER_STRUCT.size
+        if (major, minor) >= (1, 3):
+            header['start_of_waveform_data_packet_record'], = HEADER_13_STRUCT.unpack_from(data, offset)
+            offset += HEADER_13_STRUCT.size
+        if (major, minor) >= (1, 4):
+            start_of_first_evlr, number_of_evlrs, point_count, *points_by_return = \
+                HEADER_14_STRUCT.unpack_from(data, offset)
+            header.update({
+                'start_of_first_evlr': start_of_first_evlr,
+                'number_of_evlrs': number_of_evlrs,
+                'point_count': point_count,
+                'number_of_points_by_return': points_by_return,
+            })
+            offset += HEADER_14_STRUCT.size
+        if (major, minor) >= (1, 5):
+            header['max_gps_time'], header['min_gps_time'], header['gps_time_offset'] = \
+                HEADER_15_STRUCT.unpack_from(data, offset)
+            offset += HEADER_15_STRUCT.size
+        # Bytes between the standard header and header_size, and the VLRs and the point data
+        header['extra_header_bytes'] = bytes(data[offset:header_size])
+
+        vlrs, offset = _read_vlrs(data, header_size, number_of_vlrs)
+        header['extra_vlr_bytes'] = bytes(data[offset:offset_to_point_data])
+        # laspy consumes the LAZ VLR when opening compressed files
+        header['vlrs'] = [_ for _ in vlrs if (_['user_id'], _['record_id']) != LASZIP]
+        header['evlrs'] = _read_evlrs(f, header['start_of_first_evlr'], header['number_of_evlrs']) \
+            if (major, minor) >= (1, 4) else None
+    return header
+
+def _find_vlr(header, key):
+    """Return record_data of first VLR or EVLR matching (user_id, record_id), or None."""
+    for vlr in header['vlrs'] + (header['evlrs'] or []):
+        if (vlr['user_id'], vlr['record_id']) == key and vlr['record_data'] is not None:
+            return vlr['record_data']
+    return None
+
+def geo_keys(record_data):
+    """Return GeoKeyDirectory as list of (key_id, tiff_tag_location, count, value_offset)."""
+    values = struct.unpack(f'<{len(record_data) // 2}H', record_data[:len(record_data) // 2 * 2])
+    number_of_keys = values[3]
+    return [tuple(values[4 + i * 4:8 + i * 4]) for i in range(number_of_keys)]
+
+def geo_ascii_strings(record_data):
+    """Return GeoAsciiParams as list of strings."""
+    return [_ for _ in record_data.decode('ascii', errors='replace').split('\0') if _]
+
+def geo_doubles(record_data):
+    """Return GeoDoubleParams as list of floats."""
+    return list(struct.unpack(f'<{len(record_data) // 8}d', record_data[:len(record_data) // 8 * 8]))
+
+def _cap_text(vlr, name, text, max_bytes):
+    """Set vlr name to text, truncated and flagged beyond max_bytes characters."""
+    vlr[name] = text[:max_bytes]
+    if len(text) > max_bytes:
+        vlr['truncated'] = True
+
+def encode_vlr_compact(user_id, record_id, description, record_data, max_bytes=VLR_MAX_BYTES):
+    """Return VLR as compact JSON-friendly dict.
+       GeoKeyDirectory, GeoDoubleParams, GeoAsciiParams and WKT VLRs are decoded into
+       structured fields, other payloads are base64. Payloads over max_bytes are
+       truncated and flagged 'truncated'."""
+    vlr = {
+        'user_id': user_id,
+        'record_id': record_id,
+        'description': description,
+    }
+    if record_data is None:
+        vlr['record_data'] = None
+        return vlr
+    record_data = bytes(record_data)
+    vlr['record_length'] = len(record_data)
+    key = (user_id, record_id)
+    try:
+        if key == GEO_KEY_DIRECTORY:
+            vlr['geo_keys'] = [
+                {'id': key_id, 'location': location, 'count': count, 'value': value}
+                for key_id, location, count, value in geo_keys(record_data)
+            ]
+            return vlr
+        if key == GEO_DOUBLE_PARAMS:
+            vlr['doubles'] = geo_doubles(record_data[:max_bytes])
+            if len(record_data) > max_bytes:
+                vlr['truncated'] = True
+            return vlr
+        if key == GEO_ASCII_PARAMS:
+            _cap_text(vlr, 'ascii', '\0'.join(geo_ascii_strings(record_data)), max_bytes)
+            return vlr
+        if key in (WKT_COORDINATE_SYSTEM, WKT_MATH_TRANSFORM):
+            _cap_text(vlr, 'wkt', record_data.split(b'\0', 1)[0].decode('utf-8', errors='replace'), max_bytes)
+            return vlr
+    except (struct.error, IndexError):
+        pass  # Malformed, keep as binary
+    vlr['record_data_base64'] = base64.b64encode(record_data[:max_bytes]).decode('ascii')
+    if len(record_data) > max_bytes:
+        vlr['truncated'] = True
+    return vlr
+
+def las_crs_vlrs(header):
+    """Return CRS VLR payloads as dict of WKT string, GeoKeyDirectory keys and GeoAscii strings."""
+    wkt = _find_vlr(header, WKT_COORDINATE_SYSTEM)
+    keys = _find_vlr(header, GEO_KEY_DIRECTORY)
+    ascii = _find_vlr(header, GEO_ASCII_PARAMS)
+    return {
+        'wkt': wkt.split(b'\0', 1)[0].decode('utf-8', errors='replace').strip() if wkt else None,
+        'geo_keys': geo_keys(keys) if keys else None,
+        'ascii_strings': geo_ascii_strings(ascii) if ascii else None,
+    }
+
+def las_crs_key(vlrs, global_encoding=0):
+    """Return hex digest of CRS VLR payloads and WKT global encoding bit.
+       vlrs is a sequence of (user_id, record_id, record_data), tiles of a flight with
+       byte-identical CRS VLRs share a key."""
+    digest = hashlib.sha1(b'wkt' if global_encoding & GLOBAL_ENCODING_WKT else b'')
+    for user_id, record_id, record_data in vlrs:
+        if (user_id, record_id) in CRS_VLRS and record_data is not None:
+            digest.update(f'{user_id}/{record_id}/{len(record_data)}:'.encode('utf-8'))
+            digest.update(record_data)
+    return digest.hexdigest()
+
+def parse_las_crs(header):
+    """Returns pyproj CRS from header CRS VLRs, or None, like laspy LasHeader.parse_crs.
+       WKT is preferred, then the GeoKeyDirectory projected or geographic EPSG code."""
+    from pyproj import CRS
+    crs_vlrs = las_crs_vlrs(header)
+    if crs_vlrs['wkt']:
+        return CRS.from_wkt(crs_vlrs['wkt'])
+    for key_id, location, count, value in crs_vlrs['geo_keys'] or []:
+        if key_id in (PROJECTED_CS_TYPE_GEO_KEY, GEOGRAPHIC_TYPE_GEO_KEY) and location == 0 \
+           and value not in (0, USER_DEFINED):
+            return CRS.from_epsg(value)
+    return None
+
+
+if __name__ == '__main__':
+    from tests.testpaths import testpaths
+
+    # Tests for lasutils.
+    def tests_read_las_header():
+        for filepath in testpaths:
+            if not filepath.lower().endswith(('.las', '.laz')):
+                continue
+            try:
+                header = read_las_header(filepath)
+            except Exception as ex:
+                print(f'Failed to read LAS header for {filepath}: {ex}', file=sys.stderr)
+                continue
+            print(f'{filepath}: version={header["version"]} points={header["point_count"]} '
+                  f'format={header["point_format"]["id"]} vlrs={len(header["vlrs"])} '
+                  f'crs={las_crs_vlrs(header)}', file=sys.stderr)
+
+    def tests():
+        tests_read_las_header()
+
+    tests()
@@ -3,12 +3,74 @@
 Script to load a PSV file into the PostgreSQL imagery_metadata table.
 """
 import argparse
+import csv
+import gzip
 import io
+import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import psycopg2
 import requests
 
+from utils import CsvStream, BLOB_REF, blob_fields, blobs_path
+
+
+TABLE = 'imagery_metadata'
+STAGING_TABLE = 'imagery_metadata_staging'
+# Per-session staging table of DbStream
+STREAM_TABLE = 'imagery_metadata_stream'
+# Advisory lock key (hashtext) serialising the schema setup of concurrent DbStreams
+STREAM_SCHEMA_LOCK = 'imagery_metadata_stream_schema'
+# Deduplicated JSON blobs (crawl2psv --dedup-json), their staging tables and resolving view
+BLOB_TABLE = 'metadata_blobs'
+BLOB_STAGING_TABLE = 'metadata_blobs_staging'
+STREAM_BLOB_TABLE = 'metadata_blobs_stream'
+BLOB_VIEW = 'imagery_metadata_resolved'
+BLOB_COLUMNS = ['hash', 'json']
+# JSON document columns, JSONB with --jsonb
+JSON_COLUMNS = ('bbox', 'gdalinfo', 'pylasinfo', 'metadata')
+# Key functions of JSONB documents, each with an expression index; query with the function
+# (e.g. WHERE imagery_sensor(metadata) = 'WV03') or the same expression to use the index
+JSONB_FUNCTIONS = {
+    'imagery_band_count(gdalinfo jsonb) RETURNS int':
+        "CASE WHEN jsonb_typeof(gdalinfo->'bands') = 'array' THEN jsonb_array_length(gdalinfo->'bands') END",
+    'imagery_point_count(pylasinfo jsonb) RETURNS bigint':
+        "CASE WHEN jsonb_typeof(pylasinfo->'point_count') = 'number' "
+        "THEN (pylasinfo->>'point_count')::numeric::bigint END",
+    # Airbus DIMAP mission, Maxar ISD satellite id
+    'imagery_sensor(metadata jsonb) RETURNS text':
+        "COALESCE("
+        "metadata #>> '{Dimap_Document,Dataset_Sources,Source_Identification,Strip_Source,MISSION}' || "
+        "COALESCE(metadata #>> '{Dimap_Document,Dataset_Sources,Source_Identification,Strip_Source,MISSION_INDEX}', ''), "
+        "metadata #>> '{isd,IMD,IMAGE,SATID}')",
+    # ISO 8601 text, orders as dates; filetime holds the acquisition time parsed from filenames
+    'imagery_acquired(metadata jsonb) RETURNS text':
+        "COALESCE("
+        "metadata #>> '{Dimap_Document,Dataset_Sources,Source_Identification,Strip_Source,IMAGING_DATE}', "
+        "metadata #>> '{isd,IMD,IMAGE,FIRSTLINETIME}')",
+}
+JSONB_INDEXES = {
+    'idx_imagery_metadata_gdalinfo_epsg': "((gdalinfo->'stac'->>'proj:epsg'))",
+    'idx_imagery_metadata_pylasinfo_srs': "((pylasinfo->>'srs'))",
+    'idx_imagery_metadata_band_count': "(imagery_band_count(gdalinfo))",
+    'idx_imagery_metadata_point_count': "(imagery_point_count(pylasinfo))",
+    'idx_imagery_metadata_sensor': "(imagery_sensor(metadata))",
+    'idx_imagery_metadata_acquired': "(imagery_acquired(metadata))",
+    'idx_imagery_metadata_filetime': "(filetime)",
+}
+# Optional GIN indexes for containment queries, e.g. WHERE gdalinfo @> '{"driverShortName": "JP2OpenJPEG"}'
+GIN_COLUMNS = ('gdalinfo', 'pylasinfo', 'metadata')
+# Columns not loaded from the PSV
+DERIVED_COLUMNS = ('bbox_geom',)
+# HTTP download chunk and read buffer size
+CHUNK_SIZE = 1024 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# Rows per COPY batch when isolating bad rows (--reject-file)
+BATCH_ROWS = 10000
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -17,7 +79,8 @@ def parse_args():
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument(
         '--psv', '-p',
-        help='Local path to the PSV file to load.'
+        nargs='+',
+        help='Local path to the PSV file to load, or paths of PSV shards.'
     )
     group.add_argument(
         '--url', '-u',
@@ -44,36 +107,568 @@ def parse_args():
         action='store_true',
         help='Drop and recreate imagery_metadata table and indexes before loading.'
     )
-    return parser.parse_args()
+    parser.add_argument(
+        '--upsert',
+        action='store_true',
+        help='Load via an unlogged staging table, inserting new files and updating only those '
+             'whose size or modified time changed (unique on filepath).'
+    )
+    parser.add_argument(
+        '--delete-missing',
+        nargs='?',
+        const='',
+        metavar='PREFIX',
+        help='With --upsert, delete rows not in this PSV whose filepath starts with PREFIX '
+             '(e.g. file:///mnt/datapool2/; all rows if omitted).'
+    )
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=1,
+        help='Parallel COPY connections, PSVs are split into shards if fewer than jobs (default: 1).'
+    )
+    parser.add_argument(
+        '--jsonb',
+        action='store_true',
+        help='JSONB document columns (with --init, else the existing table is converted) with '
+             'expression indexes on EPSG, band and point counts, sensor and acquisition date.'
+    )
+    parser.add_argument(
+        '--gin',
+        action='store_true',
+        help='With --jsonb, also GIN indexes of gdalinfo, pylasinfo and metadata for @> queries.'
+    )
+    parser.add_argument(
+        '--blobs', '-b',
+        nargs='+',
+        metavar='PATH',
+        help='Blobs PSVs of crawl2psv --dedup-json (e.g. crawl2psv.raw.blobs.psv) to load into '
+             'metadata_blobs; query imagery_metadata_resolved for rows with blobs resolved. '
+             'A JSONB table stores blobs resolved, so its indexes see the documents.'
+    )
+    parser.add_argument(
+        '--reject-file',
+        metavar='PATH',
+        help='Copy in batches, writing rows COPY fails on (stray pipes, invalid JSON) to PATH '
+             'and their line numbers and errors to PATH.err, and load the rest. Rows whose bbox '
+             'fails to transform are written there too; without it they fail the load.'
+    )
+    args = parser.parse_args()
+    if args.delete_missing is not None and not args.upsert:
+        parser.error('--delete-missing requires --upsert')
+    if args.gin and not args.jsonb:
+        parser.error('--gin requires --jsonb')
+    if args.upsert and args.clear:
+        parser.error('--upsert and --clear are exclusive, --clear reloads everything')
+    return args
+
+
+class IterStream(io.RawIOBase):
+    """
+    Read-only binary file-like object over an iterator of bytes chunks, e.g. an HTTP body,
+    so COPY reads the body as it downloads instead of from an in-memory copy.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.leftover = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.leftover:
+            try:
+                self.leftover = memoryview(next(self.chunks))
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self.leftover))
+        b[:n] = self.leftover[:n]
+        self.leftover = self.leftover[n:]
+        return n
+
+
+class GzipReader(gzip.GzipFile):
+    """
+    GzipFile reading fileobj, closing it when closed like a file it opened itself.
+    """
+
+    def __init__(self, fileobj):
+        super().__init__(fileobj=fileobj, mode='rb')
+        self.source = fileobj
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.source.close()
+
+
+def is_compressed(head):
+    """
+    Return True if bytes head start with the gzip or zstd magic bytes.
+    """
+    return head.startswith(GZIP_MAGIC) or head.startswith(ZSTD_MAGIC)
+
+
+def decompressed(stream):
+    """
+    Return buffered binary stream, decompressed if it starts with the gzip or zstd magic bytes.
+    Closing it closes stream. zstd needs zstandard.
+    """
+    head = stream.peek(len(ZSTD_MAGIC))[:len(ZSTD_MAGIC)]
+    if head.startswith(GZIP_MAGIC):
+        return GzipReader(stream)
+    if head.startswith(ZSTD_MAGIC):
+        import zstandard
+        reader = zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True, closefd=True)
+        return io.BufferedReader(reader, buffer_size=CHUNK_SIZE)
+    return stream
+
+
+def response_stream(response, chunk_size=CHUNK_SIZE):
+    """
+    Return binary file-like object streaming a requests stream=True response body.
+    Content-Encoding gzip is decoded by requests, gzip and zstd files (.psv.gz, .psv.zst) here.
+    """
+    chunks = response.iter_content(chunk_size=chunk_size)
+    return decompressed(io.BufferedReader(IterStream(chunks), buffer_size=chunk_size))
+
+
+def table_columns(conn, table=TABLE, exclude=DERIVED_COLUMNS):
+    """
+    Return table column names in table order, without the exclude columns.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = %s "
+            "ORDER BY ordinal_position;",
+            (table,)
+        )
+        return [col[0] for col in cur.fetchall() if col[0] not in exclude]
+
+
+
+def create_geometry_functions(cur):
+    """
+    Create imagery_bbox_geom_checked(bbox, bbox_epsg, epsg), the (geom, error) of computing the
+    bbox_geom Polygon of a json or jsonb GeoJSON bbox: the Polygon, or the error it raises
+    (invalid GeoJSON, unknown bbox_epsg, not a Polygon). Its exception block is a subtransaction
+    per row (so not parallel safe), it is only used to isolate rejects (see reject_geometries),
+    loads use geometry_expression. STABLE, as ST_Transform reads spatial_ref_sys.
+    """
+    geometry = "ST_Transform(ST_SetSRID(ST_GeomFromGeoJSON(bbox::text), bbox_epsg), epsg)"
+    for bbox_type in ('json', 'jsonb'):
+        cur.execute(
+            f"""
+            CREATE OR REPLACE FUNCTION imagery_bbox_geom_checked(bbox {bbox_type}, bbox_epsg int, epsg int,
+                                                                 OUT geom geometry, OUT error text)
+            LANGUAGE plpgsql STABLE STRICT AS $$
+            BEGIN
+                geom := {geometry};
+                IF GeometryType(geom) <> 'POLYGON' THEN
+                    error := 'bbox is a ' || GeometryType(geom);
+                    geom := NULL;
+                END IF;
+            EXCEPTION WHEN OTHERS THEN
+                geom := NULL;
+                error := SQLERRM;
+            END $$;
+            """
+        )
+
+
+def geometry_expression(epsg):
+    """
+    Return SQL expression of bbox_geom in EPSG epsg from the bbox and bbox_epsg columns,
+    NULL if either is. A bbox it fails on fails the statement, reject_geometries moves
+    those rows out of staging first.
+    """
+    return f"ST_Transform(ST_SetSRID(ST_GeomFromGeoJSON(bbox::text), bbox_epsg), {int(epsg)})"
+
+
+def reject_geometries(cur, columns, epsg, rejects, source=None, staging=STAGING_TABLE):
+    """
+    Move staging rows whose bbox_geom fails to rejects, so they are reported rather than
+    failing the load. Their rows are written as the table exports them, with no line number.
+    bbox_geom is computed once per row, the staging rows keep it for staging_selects.
+    Returns count rejected.
+    """
+    cur.execute(
+        f"""
+        WITH checked AS MATERIALIZED (
+            SELECT s.ctid, c.geom, c.error
+            FROM {staging} s, LATERAL imagery_bbox_geom_checked(s.bbox, s.bbox_epsg, {int(epsg)}) c
+        ), computed AS (
+            UPDATE {staging} s SET bbox_geom = checked.geom
+            FROM checked
+            WHERE s.ctid = checked.ctid AND checked.geom IS NOT NULL
+        )
+        SELECT ctid::text, error FROM checked WHERE error IS NOT NULL ORDER BY ctid;
+        """
+    )
+    failed = cur.fetchall()
+    if not failed:
+        return 0
+    rows = cur.mogrify("ctid = ANY(%s::tid[])", ([ctid for ctid, error in failed],)).decode()
+    exported = io.StringIO()
+    cur.copy_expert(
+        f"COPY (SELECT {', '.join(columns)} FROM {staging} WHERE {rows} ORDER BY ctid) "
+        "TO STDOUT WITH (FORMAT csv, DELIMITER '|', HEADER true)",
+        exported
+    )
+    header, *lines = exported.getvalue().splitlines(keepends=True)
+    for (ctid, error), line in zip(failed, lines):
+        rejects.add(source, header, '', line, error)
+    cur.execute(f"DELETE FROM {staging} WHERE {rows};")
+    return len(failed)
+
+
+def bbox_jsonb(cur, table=TABLE):
+    """
+    Return True if the table bbox column is JSONB.
+    """
+    cur.execute(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'bbox';",
+        (table,)
+    )
+    row = cur.fetchone()
+    return bool(row) and row[0] == 'jsonb'
+
+
+def staging_selects(cur, columns, epsg=3857):
+    """
+    Return SQL select list of staging columns and bbox_geom in EPSG epsg, unless reject_geometries
+    already computed it.
+    Into a JSONB table, blob references (crawl2psv --dedup-json) are resolved from metadata_blobs,
+    which is loaded first, as the JSONB key indexes need the documents, not {"$blob": hash}.
+    """
+    jsonb = bbox_jsonb(cur)
+    resolve = False
+    if jsonb:
+        cur.execute("SELECT to_regclass(%s);", (BLOB_TABLE,))
+        resolve = cur.fetchone()[0] is not None
+    selects = [
+        f"COALESCE((SELECT b.json::jsonb FROM {BLOB_TABLE} b WHERE b.hash = {col}->>'{BLOB_REF}'), {col})"
+        if resolve and col in JSON_COLUMNS else col
+        for col in columns
+    ]
+    return ', '.join(selects + [f"COALESCE(bbox_geom, {geometry_expression(epsg)})"])
+
+
+def create_staging(cur):
+    """
+    Recreate the unlogged staging table, shaped like imagery_metadata.
+    """
+    cur.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE};")
+    # Unlogged: no WAL for rows that only live until they are inserted
+    cur.execute(f"CREATE UNLOGGED TABLE {STAGING_TABLE} (LIKE {TABLE} INCLUDING DEFAULTS);")
+
+
+class Rejects:
+    """
+    Reject file for rows COPY failed on: the PSV header and rejected rows as read, so the
+    file can be fixed and reloaded, and path + '.err' with a source|line|error line per row.
+    Rows whose bbox_geom failed are added as exported from staging, with no line number (nor
+    source, after a parallel load).
+    Shared by parallel shard loads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.err_file = None
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def add(self, source, header, line_number, line, error):
+        if isinstance(line, bytes):
+            header, line = header.decode('utf-8', 'replace'), line.decode('utf-8', 'replace')
+        error = ' '.join(str(error).split())
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, 'w', encoding='utf-8')
+                self.err_file = open(self.path + '.err', 'w', encoding='utf-8')
+                self.file.write(header)
+            self.file.write(line if line.endswith('\n') else line + '\n')
+            self.err_file.write(f"{source or ''}|{line_number}|{error}\n")
+            self.count += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.err_file.close()
+
+
+def copy_psv(cur, file_obj, columns, table=STAGING_TABLE, rejects=None, source=None):
+    """
+    COPY PSV content (with header) from file_obj into table columns.
+    With rejects (Rejects), rows are copied in batches and rows COPY fails on are isolated
+    into rejects instead of failing the load.
+    """
+    if rejects is not None:
+        return copy_psv_isolating(cur, file_obj, columns, table, rejects, source)
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) "
+        "FROM STDIN WITH (FORMAT csv, DELIMITER '|', HEADER true)",
+        file_obj
+    )
+
+
+def copy_psv_isolating(cur, file_obj, columns, table, rejects, source=None, batch_rows=BATCH_ROWS):
+    """
+    COPY PSV rows from file_obj in batches of batch_rows lines, each under a savepoint.
+    A failing batch is rolled back and bisected until the failing rows are found, those are
+    written to rejects with their line number and error, the rest are loaded.
+    Rows are single lines, crawl2psv writes compact JSON.
+    """
+    sql = (f"COPY {table} ({', '.join(columns)}) "
+           "FROM STDIN WITH (FORMAT csv, DELIMITER '|', HEADER false)")
+    header = file_obj.readline()
+    empty = header[:0]
+
+    def copy_batch(first, lines):
+        cur.execute("SAVEPOINT copy_batch;")
+        try:
+            cur.copy_expert(sql, io.BytesIO(empty.join(lines)) if isinstance(empty, bytes)
+                            else io.StringIO(empty.join(lines)))
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT copy_batch;")
+            if len(lines) == 1:
+                rejects.add(source, header, first, lines[0], e.pgerror or e)
+                return
+            half = len(lines) // 2
+            copy_batch(first, lines[:half])
+            copy_batch(first + half, lines[half:])
+        else:
+            cur.execute("RELEASE SAVEPOINT copy_batch;")
+
+    # Line numbers count the header as line 1
+    first, lines = 2, []
+    for line in file_obj:
+        lines.append(line)
+        if len(lines) >= batch_rows:
+            copy_batch(first, lines)
+            first, lines = first + len(lines), []
+    if lines:
+        copy_batch(first, lines)
+
+
+def staging_counts(cur):
+    """
+    Analyze the staging table, returns its (rows, distinct filepaths).
+    """
+    cur.execute(f"ANALYZE {STAGING_TABLE};")
+    cur.execute(f"SELECT count(*), count(DISTINCT filepath) FROM {STAGING_TABLE};")
+    return cur.fetchone()
+
+
+def copy_to_staging(cur, file_obj, columns, rejects=None, source=None, epsg=3857):
+    """
+    Recreate the unlogged staging table and COPY PSV content from file_obj into it.
+    With rejects, rows whose bbox_geom in EPSG epsg fails are moved to it too.
+    Returns (rows, distinct filepaths) loaded.
+    """
+    create_staging(cur)
+    copy_psv(cur, file_obj, columns, rejects=rejects, source=source)
+    if rejects is not None:
+        reject_geometries(cur, columns, epsg, rejects, source)
+    return staging_counts(cur)
+
+
+class ShardReader(io.RawIOBase):
+    """
+    Read-only binary file-like object over the header line plus bytes start to end of a PSV,
+    so each shard COPYs like a PSV of its own.
+    """
+
+    def __init__(self, path, header, start, end):
+        self.file = open(path, 'rb')
+        self.file.seek(start)
+        self.header = memoryview(header)
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.header:
+            n = min(len(b), len(self.header))
+            b[:n] = self.header[:n]
+            self.header = self.header[n:]
+            return n
+        n = self.file.readinto(memoryview(b)[:min(len(b), self.remaining)]) if self.remaining else 0
+        self.remaining -= n
+        return n
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+def psv_shards(path, jobs):
+    """
+    Return (header, [(start, end), ...]) splitting the rows of PSV path into up to jobs
+    byte ranges at line boundaries. Rows are single lines, crawl2psv writes compact JSON.
+    Compressed PSVs can't be split and are a single shard.
+    """
+    with open(path, 'rb') as f:
+        if is_compressed(f.read(len(ZSTD_MAGIC))):
+            return None, [(0, None)]
+        f.seek(0)
+        header = f.readline()
+        data_start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+        bounds = [data_start]
+        for i in range(1, jobs):
+            # Back one byte, so a boundary already at a line start stays there
+            f.seek(max(data_start + (size - data_start) * i // jobs, bounds[-1] + 1) - 1)
+            f.readline()
+            bounds.append(min(f.tell(), size))
+        bounds.append(size)
+    return header, [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def psv_openers(paths, jobs=1):
+    """
+    Return (source, opener) per shard of PSV paths, opener opens a binary file-like object.
+    With fewer paths than jobs, the paths are split into shards (see psv_shards).
+    """
+    openers = []
+    split = max(1, jobs // len(paths)) if len(paths) < jobs else 1
+    for path in paths:
+        header, shards = psv_shards(path, split) if split > 1 else (None, [(0, None)])
+        for start, end in shards:
+            if end is None:
+                openers.append((path, lambda path=path: decompressed(open(path, 'rb'))))
+            else:
+                # Shard line numbers count from its start byte
+                openers.append((f"{path}@{start}", lambda path=path, start=start, end=end, header=header:
+                                io.BufferedReader(ShardReader(path, header, start, end), buffer_size=CHUNK_SIZE)))
+    return openers
+
+
+def parallel_copy_to_staging(conn, db_url, openers, columns, jobs, rejects=None, epsg=3857):
+    """
+    Recreate the staging table and COPY each opened shard into it, over jobs connections
+    in parallel (the COPY parse of the JSON columns is per backend).
+    With rejects, rows whose bbox_geom in EPSG epsg fails are moved to it too.
+    Returns (rows, distinct filepaths) loaded.
+    """
+    with conn.cursor() as cur:
+        create_staging(cur)
+    conn.commit()
+
+    def copy_shard(shard):
+        source, opener = shard
+        shard_conn = psycopg2.connect(db_url)
+        try:
+            with opener() as file_obj, shard_conn.cursor() as cur:
+                copy_psv(cur, file_obj, columns, rejects=rejects, source=source)
+            shard_conn.commit()
+        finally:
+            shard_conn.close()
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        # Raises the first shard error, the target table is untouched
+        list(executor.map(copy_shard, openers))
+    with conn.cursor() as cur:
+        if rejects is not None:
+            # Shards share the staging table, a row's shard is not known
+            reject_geometries(cur, columns, epsg, rejects)
+        return staging_counts(cur)
+
+
+def insert_from_staging(cur, columns, epsg=3857, staging=STAGING_TABLE, drop=True):
+    """
+    Insert all staging rows into imagery_metadata with bbox_geom, drops the staging table if drop.
+    """
+    cols = ', '.join(columns)
+    cur.execute(
+        f"INSERT INTO {TABLE} ({cols}, bbox_geom) "
+        f"SELECT {staging_selects(cur, columns, epsg)} FROM {staging};"
+    )
+    if drop:
+        cur.execute(f"DROP TABLE {staging};")
 
 
+def upsert_from_staging(cur, columns, delete_missing=None, epsg=3857, staging=STAGING_TABLE, drop=True):
+    """
+    Upsert staging rows into imagery_metadata, see upsert_psv_to_db, drops the staging table if drop.
+    Returns (inserted, updated, deleted) counts.
+    """
+    updates = ', '.join(f"{col} = EXCLUDED.{col}" for col in columns + ['bbox_geom'] if col != 'filepath')
+    cols = ', '.join(columns)
+    selects = staging_selects(cur, columns, epsg)
+    # A file crawled twice keeps its latest row, ON CONFLICT can't update a row twice
+    cur.execute(
+        f"""
+        WITH upserted AS (
+            INSERT INTO {TABLE} ({cols}, bbox_geom)
+            SELECT DISTINCT ON (filepath) {selects}
+            FROM {staging}
+            WHERE filepath IS NOT NULL
+            ORDER BY filepath, modified DESC NULLS LAST
+            ON CONFLICT (filepath) DO UPDATE SET {updates}
+            WHERE {TABLE}.size IS DISTINCT FROM EXCLUDED.size
+               OR {TABLE}.modified IS DISTINCT FROM EXCLUDED.modified
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted)
+        FROM upserted;
+        """
+    )
+    inserted, updated = cur.fetchone()
+    deleted = 0
+    if delete_missing is not None:
+        cur.execute(
+            f"""
+            DELETE FROM {TABLE} t
+            WHERE left(t.filepath, length(%s)) = %s
+              AND NOT EXISTS (SELECT 1 FROM {staging} s WHERE s.filepath = t.filepath);
+            """,
+            (delete_missing, delete_missing)
+        )
+        deleted = cur.rowcount
+    if drop:
+        cur.execute(f"DROP TABLE {staging};")
+    return inserted, updated, deleted
+
 
-def load_psv_to_db(conn, file_obj):
+def load_psv_to_db(conn, file_obj, epsg=3857, rejects=None, source=None):
     """
     Copy PSV content from file_obj into imagery_metadata table.
+    Rows go through the staging table so bbox_geom is computed for the new rows only.
+    With rejects (Rejects), rows COPY fails on are written to it and the rest loaded.
     """
     # Get column names from the table to create a dynamic COPY statement
     try:
 
+        # PSV columns match the table columns by position
+        columns = table_columns(conn)
+
         with conn.cursor() as cur:
-            cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='imagery_metadata' AND column_name != 'bbox_geom';")
-            columns = [col[0] for col in cur.fetchall()]
-            
-        copy_sql = (
-            f"COPY imagery_metadata ({', '.join(columns)}) "
-            "FROM STDIN WITH (FORMAT csv, DELIMITER '|', HEADER true)"
-        )
-        with conn.cursor() as cur:
-            cur.copy_expert(copy_sql, file_obj)
+            loaded, distinct = copy_to_staging(cur, file_obj, columns, rejects, source, epsg)
+            insert_from_staging(cur, columns, epsg)
         conn.commit()
 
     except psycopg2.Error as e:
+        conn.rollback()
         print(f"Error loading PSV into imagery_metadata: {e}", file=sys.stderr)
 
-        # Read the first few lines to help diagnose
+        # Show the first few lines to help diagnose, streams can't be reread
+        if not file_obj.seekable():
+            raise
         file_obj.seek(0)  # Reset file pointer to the beginning
-        lines = file_obj.readlines()
-        print("First few lines of the PSV file:")
+        # A bounded sample, the PSV may be multi-GB (or compressed)
+        sample = file_obj.read(64 * 1024)
+        if isinstance(sample, bytes):
+            sample = sample.decode('utf-8', 'replace')
+        print("First few lines of the PSV file:", file=sys.stderr)
+        for line in sample.splitlines()[:5]:
+            print(line[:500] + ('...' if len(line) > 500 else ''), file=sys.stderr)
         # import pandas as pd
         # print (file_obj.name)
         # df = pd.read_csv(file_obj, sep='|', header=0, dtype=str)
@@ -81,43 +676,381 @@ def load_psv_to_db(conn, file_obj):
 
         raise  # Re-raise the exception to propagate it
 
+    return loaded
 
 
 
 
-def process_geometry(conn, epsg):
+def ensure_filepath_key(conn):
+    """
+    Create the unique filepath index upsert conflicts on, if the table lacks it.
+    Plain loads don't need it, and a table loaded from PSVs listing a file twice can't have it.
     """
-    Add/Post-process geometry column bbox_geom using PostGIS based on EPSG code.
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_imagery_metadata_filepath "
+                "ON imagery_metadata (filepath);"
+            )
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error creating unique filepath index, remove duplicate filepaths or --init: {e}",
+              file=sys.stderr)
+        raise
+
+
+def rejects_keep_missing(rejects, delete_missing):
+    """
+    Returns delete_missing, or None if rows were rejected: their filepaths aren't staged,
+    so deleting missing rows would delete them.
+    """
+    if delete_missing is not None and rejects is not None and rejects.count:
+        print(f"Not deleting missing rows, {rejects.count} rows were rejected.", file=sys.stderr)
+        return None
+    return delete_missing
+
+
+def upsert_psv_to_db(conn, file_obj, delete_missing=None, epsg=3857, rejects=None, source=None):
+    """
+    Upsert PSV content from file_obj into imagery_metadata via an unlogged staging table.
+    New filepaths are inserted, existing ones updated only if size or modified changed.
+    If delete_missing is a filepath prefix ('' for all), rows under it not in the PSV are deleted.
+    bbox_geom is computed in EPSG epsg for inserted and updated rows only.
+    Returns dict of loaded rows and inserted, updated, unchanged and deleted filepaths counts.
+    """
+    columns = table_columns(conn)
+    try:
+        with conn.cursor() as cur:
+            loaded, distinct = copy_to_staging(cur, file_obj, columns, rejects, source, epsg)
+            delete_missing = rejects_keep_missing(rejects, delete_missing)
+            inserted, updated, deleted = upsert_from_staging(cur, columns, delete_missing, epsg)
+        conn.commit()
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error upserting PSV into imagery_metadata: {e}", file=sys.stderr)
+        raise
+
+    return {
+        'loaded': loaded,
+        'inserted': inserted,
+        'updated': updated,
+        'unchanged': distinct - inserted - updated,
+        'deleted': deleted,
+    }
+
+
+def load_psvs_parallel(conn, db_url, paths, jobs, epsg=3857, upsert=False, delete_missing=None,
+                       rejects=None):
+    """
+    Load (or upsert) PSV paths over jobs parallel COPY connections into the staging table,
+    then insert into imagery_metadata once on conn.
+    Returns dict of loaded rows and, if upsert, inserted, updated, unchanged and deleted counts.
+    """
+    columns = table_columns(conn)
+    openers = psv_openers(paths, jobs)
+    print(f"Copying {len(paths)} PSV(s) as {len(openers)} shard(s) over {min(jobs, len(openers))} connection(s)")
+    try:
+        loaded, distinct = parallel_copy_to_staging(conn, db_url, openers, columns, jobs, rejects, epsg)
+        with conn.cursor() as cur:
+            if not upsert:
+                insert_from_staging(cur, columns, epsg)
+                counts = {'loaded': loaded}
+            else:
+                delete_missing = rejects_keep_missing(rejects, delete_missing)
+                inserted, updated, deleted = upsert_from_staging(cur, columns, delete_missing, epsg)
+                counts = {
+                    'loaded': loaded,
+                    'inserted': inserted,
+                    'updated': updated,
+                    'unchanged': distinct - inserted - updated,
+                    'deleted': deleted,
+                }
+        conn.commit()
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error loading PSVs into imagery_metadata: {e}", file=sys.stderr)
+        raise
+
+    return counts
+
+
+def ensure_blob_table(conn):
+    """
+    Create the metadata_blobs table of deduplicated JSON blobs, and the imagery_metadata_resolved
+    view, which is imagery_metadata with blob references resolved to their JSON.
     """
     with conn.cursor() as cur:
-        # Drop existing geometry column if present, then add fresh with correct SRID
-        cur.execute("ALTER TABLE imagery_metadata DROP COLUMN IF EXISTS bbox_geom CASCADE;")
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {BLOB_TABLE} (hash TEXT PRIMARY KEY, json JSON);")
         cur.execute(
-            "ALTER TABLE imagery_metadata ADD COLUMN bbox_geom geometry(Polygon, %s);",
-            (epsg,)
+            "SELECT column_name, data_type FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = %s "
+            "ORDER BY ordinal_position;",
+            (TABLE,)
         )
-        # Populate and transform geometry from GeoJSON
+        selects, joins = [], []
+        for i, (col, data_type) in enumerate(cur.fetchall()):
+            if data_type not in ('json', 'jsonb'):
+                selects.append(f"t.{col}")
+                continue
+            selects.append(f"COALESCE(b{i}.json::{data_type}, t.{col}) AS {col}")
+            joins.append(f"LEFT JOIN {BLOB_TABLE} b{i} ON b{i}.hash = t.{col}->>'{BLOB_REF}'")
+        # Recreated, as column types may have changed
+        cur.execute(f"DROP VIEW IF EXISTS {BLOB_VIEW};")
+        cur.execute(f"CREATE VIEW {BLOB_VIEW} AS SELECT {', '.join(selects)} FROM {TABLE} t {' '.join(joins)};")
+    conn.commit()
+
+
+def insert_blobs_from_staging(cur, staging=BLOB_STAGING_TABLE):
+    """
+    Insert staging blobs not already in metadata_blobs, returns count inserted.
+    """
+    cur.execute(
+        f"INSERT INTO {BLOB_TABLE} (hash, json) "
+        f"SELECT DISTINCT ON (hash) hash, json FROM {staging} "
+        "ON CONFLICT (hash) DO NOTHING;"
+    )
+    return cur.rowcount
+
+
+def load_blobs(conn, file_obj):
+    """
+    Load blobs PSV content from file_obj (crawl2psv --dedup-json) into metadata_blobs.
+    Blobs already loaded are skipped, returns count of new blobs.
+    """
+    ensure_blob_table(conn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE TEMP TABLE {BLOB_STAGING_TABLE} (LIKE {BLOB_TABLE}) ON COMMIT DROP;")
+            copy_psv(cur, file_obj, BLOB_COLUMNS, BLOB_STAGING_TABLE)
+            inserted = insert_blobs_from_staging(cur)
+        conn.commit()
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error loading blobs into {BLOB_TABLE}: {e}", file=sys.stderr)
+        raise
+
+    return inserted
+
+
+def prepare_stream(conn, blobs=False):
+    """
+    Ensure the schema DbStream writes into: bbox_geom with its functions and index, the unique
+    filepath upsert key and, with blobs, metadata_blobs. Concurrent crawls (crawl2psv
+    --concurrent) each open a DbStream, so the DDL runs under a session advisory lock, as it
+    would otherwise fail with "tuple concurrently updated" or a duplicate index.
+    Returns the bbox_geom EPSG, that of an existing column or 3857.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(hashtext(%s));", (STREAM_SCHEMA_LOCK,))
+    try:
+        epsg = geometry_srid(conn) or 3857
+        process_geometry(conn, epsg)
+        ensure_filepath_key(conn)
+        if blobs:
+            ensure_blob_table(conn)
+    finally:
+        # Session lock, held through the commits above and a rollback, and released with a
+        # broken connection
+        if not conn.closed:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(hashtext(%s));", (STREAM_SCHEMA_LOCK,))
+            conn.commit()
+    return epsg
+
+
+class DbStream:
+    """
+    Streaming imagery_metadata writer, like utils.CsvStream but upserting rows in batches of
+    batch_rows, each COPYed into a temporary staging table and committed.
+    Rows are dicts of fieldnames, mapped to the table columns by position like a loaded PSV.
+    With blobs, write_blob inserts deduplicated JSON blobs into metadata_blobs with the batch.
+    If the database fails, the batch and all later rows go to the PSV fallback instead, and
+    blobs to its blobs PSV (see utils.blobs_path); error is then the database error.
+    """
+
+    def __init__(self, db_url, fieldnames, fallback=None, batch_rows=5000, append=False, blobs=False):
+        self.fieldnames = list(fieldnames)
+        self.fallback = fallback
+        self.batch_rows = batch_rows
+        self.append = append
+        self.count = 0
+        self.counts = {'inserted': 0, 'updated': 0}
+        self.psv = None
+        self.blobs_psv = None
+        self.error = None
+        self.rows = []
+        self.blobs = []
+        self.conn = psycopg2.connect(db_url)
+        try:
+            self.epsg = prepare_stream(self.conn, blobs)
+            self.columns = table_columns(self.conn)
+            if len(self.columns) != len(self.fieldnames):
+                raise ValueError(f"{TABLE} has {len(self.columns)} columns, rows have {len(self.fieldnames)}")
+            with self.conn.cursor() as cur:
+                # Per session, so concurrent crawls don't share it
+                cur.execute(f"CREATE TEMP TABLE {STREAM_TABLE} (LIKE {TABLE} INCLUDING DEFAULTS) "
+                            "ON COMMIT DELETE ROWS;")
+            self.conn.commit()
+            if blobs:
+                with self.conn.cursor() as cur:
+                    cur.execute(f"CREATE TEMP TABLE {STREAM_BLOB_TABLE} (LIKE {BLOB_TABLE}) "
+                                "ON COMMIT DELETE ROWS;")
+                self.conn.commit()
+        except Exception:
+            self.conn.close()
+            raise
+
+    @staticmethod
+    def _psv_buffer(fieldnames, rows):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fieldnames, delimiter='|')
+        writer.writeheader()
+        writer.writerows(rows)
+        buffer.seek(0)
+        return buffer
+
+    def write_blob(self, blob):
+        """Write blob dict of utils.blob_fields, committed with the next batch of rows."""
+        if self.blobs_psv is not None:
+            self.blobs_psv.write(blob)
+        else:
+            self.blobs.append(blob)
+
+    def write(self, row):
+        """Write row dict."""
+        if self.psv is not None:
+            self.psv.write(row)
+        else:
+            self.rows.append(row)
+            if len(self.rows) >= self.batch_rows:
+                self.flush()
+        self.count += 1
+
+    def flush(self):
+        """Upsert and commit written rows, or flush the fallback PSV."""
+        if self.psv is not None:
+            if self.blobs_psv is not None:
+                self.blobs_psv.flush()
+            self.psv.flush()
+            return
+        if not self.rows and not self.blobs:
+            return
+        try:
+            with self.conn.cursor() as cur:
+                if self.blobs:
+                    copy_psv(cur, self._psv_buffer(blob_fields, self.blobs), BLOB_COLUMNS, STREAM_BLOB_TABLE)
+                    insert_blobs_from_staging(cur, STREAM_BLOB_TABLE)
+                copy_psv(cur, self._psv_buffer(self.fieldnames, self.rows), self.columns, STREAM_TABLE)
+                inserted, updated, _ = upsert_from_staging(cur, self.columns, epsg=self.epsg,
+                                                           staging=STREAM_TABLE, drop=False)
+            self.conn.commit()
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            if self.fallback is None:
+                raise
+            self.error = ' '.join(str(e).split())
+            print(f"WARNING: streaming rows into {TABLE} failed, this and all later rows are written "
+                  f"to \"{self.fallback}\" instead, load it with load_psv.py --upsert: {self.error}",
+                  file=sys.stderr)
+            append = self.append and os.path.isfile(self.fallback) and os.path.getsize(self.fallback) > 0
+            self.psv = CsvStream(self.fallback, self.fieldnames, delimiter='|', append=append)
+            for row in self.rows:
+                self.psv.write(row)
+            if self.blobs:
+                blobsfn = blobs_path(self.fallback)
+                append = self.append and os.path.isfile(blobsfn) and os.path.getsize(blobsfn) > 0
+                self.blobs_psv = CsvStream(blobsfn, blob_fields, delimiter='|', append=append)
+                for blob in self.blobs:
+                    self.blobs_psv.write(blob)
+                self.blobs_psv.flush()
+            self.psv.flush()
+        else:
+            self.counts['inserted'] += inserted
+            self.counts['updated'] += updated
+        self.rows = []
+        self.blobs = []
+
+    def close(self):
+        """Flush, analyze and close the connection and fallback PSV."""
+        try:
+            self.flush()
+            if self.psv is None:
+                analyze_table(self.conn)
+        finally:
+            if self.blobs_psv is not None:
+                self.blobs_psv.close()
+            if self.psv is not None:
+                self.psv.close()
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def geometry_srid(conn):
+    """
+    Return SRID of the bbox_geom column, or None if there is no such column.
+    """
+    with conn.cursor() as cur:
         cur.execute(
-            """
-            UPDATE imagery_metadata
-            SET bbox_geom = ST_Transform(
-                ST_SetSRID(ST_GeomFromGeoJSON(bbox::text), bbox_epsg), %s
-            )
-            WHERE bbox IS NOT NULL AND bbox_epsg IS NOT NULL;
-            """,
-            (epsg,)
+            "SELECT srid FROM geometry_columns "
+            "WHERE f_table_schema = current_schema() AND f_table_name = %s AND f_geometry_column = 'bbox_geom';",
+            (TABLE,)
         )
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def process_geometry(conn, epsg):
+    """
+    Ensure geometry column bbox_geom with SRID epsg and its GIST index exist, before loading.
+    Loads compute bbox_geom per new row (see geometry_expression), so the column and index
+    are kept; existing rows are only recomputed if the column has another SRID.
+    """
+    srid = geometry_srid(conn)
+    with conn.cursor() as cur:
+        create_geometry_functions(cur)
+        geometry = geometry_expression(epsg)
+        if srid is None:
+            cur.execute(
+                "ALTER TABLE imagery_metadata ADD COLUMN IF NOT EXISTS bbox_geom geometry(Polygon, %s);",
+                (epsg,)
+            )
+            # Rows loaded before bbox_geom was computed at load time
+            cur.execute(
+                f"UPDATE imagery_metadata SET bbox_geom = {geometry} "
+                "WHERE bbox_geom IS NULL AND bbox IS NOT NULL AND bbox_epsg IS NOT NULL;"
+            )
+        elif srid != epsg:
+            print(f"Rebuilding bbox_geom from SRID {srid} to EPSG:{epsg}.")
+            cur.execute(
+                "ALTER TABLE imagery_metadata ALTER COLUMN bbox_geom TYPE geometry(Polygon, %s) "
+                f"USING {geometry};",
+                (epsg,)
+            )
         # Create spatial index
         cur.execute(
             "CREATE INDEX IF NOT EXISTS idx_imagery_metadata_bbox_geom ON imagery_metadata USING GIST (bbox_geom);"
         )
     conn.commit()
 
-        # Vacuum analyze table for QGIS metadata
-    conn.autocommit = True
+
+def analyze_table(conn):
+    """
+    Update planner statistics after a load, for QGIS metadata and the spatial index.
+    Autovacuum reclaims rows an upsert replaced, the table is not rewritten.
+    """
     with conn.cursor() as cur:
-        cur.execute("VACUUM ANALYZE imagery_metadata;")
-    conn.autocommit = False
+        cur.execute("ANALYZE imagery_metadata;")
+    conn.commit()
 
 
 
@@ -138,10 +1071,64 @@ pylasinfo_json
 metadata_json
 
 '''
-def init_schema(conn):
+def create_jsonb_indexes(conn, gin=False):
+    """
+    Create the JSONB key functions and their expression indexes (see JSONB_FUNCTIONS and
+    JSONB_INDEXES), and if gin GIN indexes of the JSON documents (see GIN_COLUMNS).
+    """
+    with conn.cursor() as cur:
+        for signature, expression in JSONB_FUNCTIONS.items():
+            cur.execute(
+                f"CREATE OR REPLACE FUNCTION {signature} "
+                f"LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$ SELECT {expression} $$;"
+            )
+        for name, expression in JSONB_INDEXES.items():
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {TABLE} {expression};")
+        for col in GIN_COLUMNS if gin else ():
+            # jsonb_path_ops: smaller and faster, for @> containment only
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_imagery_metadata_{col}_gin "
+                        f"ON {TABLE} USING GIN ({col} jsonb_path_ops);")
+    conn.commit()
+
+
+def convert_jsonb(conn):
+    """
+    Convert JSON document columns of an existing imagery_metadata to JSONB (rewrites the table).
+    Blob references are resolved from metadata_blobs, as in staging_selects.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = %s AND data_type = 'json';",
+            (TABLE,)
+        )
+        cols = [col[0] for col in cur.fetchall() if col[0] in JSON_COLUMNS]
+        if not cols:
+            return
+        # The view depends on the column types, ensure_blob_table recreates it
+        cur.execute(f"DROP VIEW IF EXISTS {BLOB_VIEW};")
+        cur.execute("SELECT to_regclass(%s);", (BLOB_TABLE,))
+        blobs = cur.fetchone()[0] is not None
+        cur.execute(f"ALTER TABLE {TABLE} " +
+                    ', '.join(f"ALTER COLUMN {col} TYPE JSONB USING {col}::jsonb" for col in cols) + ";")
+        for col in cols if blobs else ():
+            cur.execute(
+                f"UPDATE {TABLE} t SET {col} = b.json::jsonb FROM {BLOB_TABLE} b "
+                f"WHERE b.hash = t.{col}->>'{BLOB_REF}';"
+            )
+    conn.commit()
+    print(f"Converted {', '.join(cols)} to JSONB.")
+    if blobs:
+        ensure_blob_table(conn)
+
+
+def init_schema(conn, jsonb=False, gin=False):
     """
     Drop and recreate imagery_metadata table and primary index.
+    With jsonb the JSON document columns are JSONB, with key expression indexes
+    and, if gin, GIN indexes (see create_jsonb_indexes).
     """
+    json_type = 'JSONB' if jsonb else 'JSON'
     commands = [
         "DROP TABLE IF EXISTS imagery_metadata CASCADE;",
         '''
@@ -156,23 +1143,40 @@ def init_schema(conn):
             metadatafilepath TEXT,
             bbox_epsg INT,
             original_crs_int INT,
-            bbox JSON,
-            gdalinfo JSON,
-            pylasinfo JSON,
-            metadata JSON
+            bbox {json_type},
+            gdalinfo {json_type},
+            pylasinfo {json_type},
+            metadata {json_type}
         );
-        ''',
+        '''.format(json_type=json_type),
         "DROP INDEX IF EXISTS idx_pk_imagery_metadata;",
-        "CREATE INDEX idx_pk_imagery_metadata ON imagery_metadata (filename);"
+        "CREATE INDEX idx_pk_imagery_metadata ON imagery_metadata (filename);",
+        # The unique filepath upsert key is only added by upserts (ensure_filepath_key),
+        # so plain loads of PSVs listing a file twice still load
+        # Deduplicated JSON, see load_blobs
+        f"DROP TABLE IF EXISTS {BLOB_TABLE};",
+        f"CREATE TABLE {BLOB_TABLE} (hash TEXT PRIMARY KEY, json JSON);",
     ]
     with conn.cursor() as cur:
         for cmd in commands:
             cur.execute(cmd)
     conn.commit()
+    if jsonb:
+        create_jsonb_indexes(conn, gin)
+
+
+def report_rejects(rejects):
+    """
+    Print rejected rows count and where they were written.
+    """
+    if rejects is not None and rejects.count:
+        print(f"Rejected {rejects.count} rows, see {rejects.path} and {rejects.path}.err",
+              file=sys.stderr)
 
 
 def main():
     args = parse_args()
+    rejects = None
 
     # Establish database connection
     try:
@@ -183,8 +1187,17 @@ def main():
 
     # Initialize schema if requested
     if args.init:
-        init_schema(conn)
+        init_schema(conn, args.jsonb, args.gin)
         print("Initialized imagery_metadata table and primary index.")
+    elif args.jsonb:
+        # Existing table, converted in place
+        try:
+            convert_jsonb(conn)
+            create_jsonb_indexes(conn, args.gin)
+        except psycopg2.Error as exc:
+            conn.rollback()
+            print(f"Error converting imagery_metadata to JSONB: {exc}", file=sys.stderr)
+            sys.exit(1)
 
     try:
         if args.clear:
@@ -193,15 +1206,34 @@ def main():
             conn.commit()
             print("Cleared imagery_metadata table.")
 
+        rejects = Rejects(args.reject_file) if args.reject_file else None
+        # Geometry column and spatial index, filled as rows are loaded
+        process_geometry(conn, args.epsg)
+        for path in args.blobs or []:
+            with decompressed(open(path, 'rb', buffering=CHUNK_SIZE)) as blobs_obj:
+                print(f"Loaded {load_blobs(conn, blobs_obj)} new blobs from {path}")
         # Obtain PSV content
+        if args.psv and (len(args.psv) > 1 or args.jobs > 1):
+            # Sharded over parallel connections, opened per shard
+            if args.upsert:
+                ensure_filepath_key(conn)
+            counts = load_psvs_parallel(conn, args.db_url, args.psv, args.jobs, args.epsg,
+                                        args.upsert, args.delete_missing, rejects)
+            print(f"Loaded PSVs: {counts}")
+            report_rejects(rejects)
+            analyze_table(conn)
+            print("Successfully loaded PSV into imagery_metadata.")
+            return
         if args.url:
             print(f"Downloading PSV from {args.url}")
-            response = requests.get(args.url)
+            # Streamed into COPY as it downloads, never held in memory
+            response = requests.get(args.url, stream=True, timeout=60)
             response.raise_for_status()
-            file_obj = io.StringIO(response.text)
+            file_obj = response_stream(response)
         else:
-            print(f"Loading PSV from {args.psv}")
-            file_obj = open(args.psv, 'r')
+            print(f"Loading PSV from {args.psv[0]}")
+            # Compressed PSVs (.psv.gz, .psv.zst) are decompressed as they are copied
+            file_obj = decompressed(open(args.psv[0], 'rb', buffering=CHUNK_SIZE))
             if False:    
                 import pandas as pd
                 df1 = pd.read_csv(file_obj, sep='|', header=0, dtype=str)
@@ -210,9 +1242,15 @@ def main():
                 df2.bbox_json[10]
                 # df1.
         # Load into DB
-        load_psv_to_db(conn, file_obj)
-        # Create geometry and spatial index
-        process_geometry(conn, args.epsg)
+        if args.upsert:
+            ensure_filepath_key(conn)
+            counts = upsert_psv_to_db(conn, file_obj, args.delete_missing, args.epsg,
+                                      rejects, args.url or args.psv[0])
+            print(f"Upserted PSV: {counts}")
+        else:
+            load_psv_to_db(conn, file_obj, args.epsg, rejects, args.url or args.psv[0])
+        report_rejects(rejects)
+        analyze_table(conn)
         print("Successfully loaded PSV into imagery_metadata.")
 
     except Exception as exc:
@@ -225,6 +1263,12 @@ def main():
             file_obj.close()
         except:
             pass
+        try:
+            response.close()
+        except:
+            pass
+        if rejects is not None:
+            rejects.close()
         conn.close()
 
 
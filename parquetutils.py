@@ -0,0 +1,167 @@
+# GeoParquet Utilities (streaming crawl output).
+import os
+import sys
+import json
+import struct
+import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+GEOMETRY_COLUMN = 'geometry'
+# Rows per Parquet row group
+ROW_GROUP_ROWS = 10000
+# Arrow types of the PSV field type suffixes, JSON is kept as text (zstd compressed)
+FIELD_TYPES = {
+    'text': pa.string(),
+    'datetime': pa.timestamp('us'),
+    'bigint': pa.int64(),
+    'int': pa.int32(),
+    'json': pa.string(),
+}
+WKB_TYPES = {
+    'Polygon': 3,
+    'MultiPolygon': 6,
+}
+
+
+def field_column(field):
+    """Return (column name, arrow type) of PSV field name_type, e.g. 'size_bigint'."""
+    name, _, kind = field.rpartition('_')
+    return name, FIELD_TYPES[kind]
+
+
+def _wkb_rings(rings):
+    """Return WKB bytes of polygon rings (2D)."""
+    parts = [struct.pack('<I', len(rings))]
+    for ring in rings:
+        parts.append(struct.pack('<I', len(ring)))
+        parts.extend(struct.pack('<2d', point[0], point[1]) for point in ring)
+    return b''.join(parts)
+
+
+def geojson_wkb(geometry):
+    """Return little endian WKB bytes of a GeoJSON Polygon or MultiPolygon dict."""
+    kind = geometry['type']
+    header = struct.pack('<BI', 1, WKB_TYPES[kind])
+    if kind == 'Polygon':
+        return header + _wkb_rings(geometry['coordinates'])
+    return header + struct.pack('<I', len(geometry['coordinates'])) + b''.join(
+        struct.pack('<BI', 1, WKB_TYPES['Polygon']) + _wkb_rings(polygon)
+        for polygon in geometry['coordinates'])
+
+
+def geo_metadata(epsg=None, geometry_types=()):
+    """Return GeoParquet 1.0 'geo' metadata dict of a WKB geometry column in EPSG epsg."""
+    column = {
+        'encoding': 'WKB',
+        'geometry_types': list(geometry_types),
+    }
+    if epsg:
+        # PROJJSON, GeoParquet defaults to OGC:CRS84 without it
+        import pyproj
+        column['crs'] = pyproj.CRS.from_epsg(epsg).to_json_dict()
+    return {
+        'version': '1.0.0',
+        'primary_column': GEOMETRY_COLUMN,
+        'columns': {GEOMETRY_COLUMN: column},
+    }
+
+
+def _typed(value, kind):
+    """Return PSV row value as the python value of arrow type kind, None if empty or invalid."""
+    if value is None or value == '':
+        return None
+    try:
+        if kind == pa.timestamp('us'):
+            return value if isinstance(value, datetime.datetime) else datetime.datetime.fromisoformat(value)
+        if kind in (pa.int64(), pa.int32()):
+            return int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if isinstance(value, str) else str(value)
+
+
+class ParquetStream:
+    """Streaming GeoParquet writer of PSV field rows, like utils.CsvStream.
+       Columns are typed by PSV field suffix (see FIELD_TYPES) and named without it, plus a WKB
+       geometry column from bbox_field GeoJSON in EPSG epsg. Rows are written in row groups of
+       row_group_rows, to path + '.tmp' renamed to path on close, as a Parquet file is only
+       readable complete."""
+
+    def __init__(self, path, fieldnames, epsg=None, geometry_types=('Polygon',),
+                 row_group_rows=ROW_GROUP_ROWS, compression='zstd', bbox_field='bbox_json'):
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.row_group_rows = row_group_rows
+        self.bbox_field = bbox_field
+        self.count = 0
+        self.columns = [field_column(_) for _ in self.fieldnames]
+        self.schema = pa.schema(
+            [pa.field(name, kind) for name, kind in self.columns] + [pa.field(GEOMETRY_COLUMN, pa.binary())],
+            metadata={'geo': json.dumps(geo_metadata(epsg, geometry_types))})
+        self.rows = []
+        self.writer = pq.ParquetWriter(path + '.tmp', self.schema, compression=compression)
+
+    def _geometry(self, row):
+        """Return WKB of row bbox, or None."""
+        bbox = row.get(self.bbox_field)
+        if not bbox:
+            return None
+        geometry = json.loads(bbox) if isinstance(bbox, str) else bbox
+        if geometry.get('type') not in WKB_TYPES:
+            return None
+        return geojson_wkb(geometry)
+
+    def write(self, row):
+        """Write row dict."""
+        self.rows.append(row)
+        self.count += 1
+        if len(self.rows) >= self.row_group_rows:
+            self.flush()
+
+    def flush(self):
+        """Write buffered rows as a row group."""
+        if not self.rows:
+            return
+        arrays = [pa.array([_typed(row.get(field), kind) for row in self.rows], type=kind)
+                  for field, (name, kind) in zip(self.fieldnames, self.columns)]
+        arrays.append(pa.array([self._geometry(row) for row in self.rows], type=pa.binary()))
+        self.writer.write_batch(pa.record_batch(arrays, schema=self.schema))
+        self.rows = []
+
+    def close(self, complete=True):
+        """Write remaining rows, and rename the file to path if complete."""
+        if self.writer is None:
+            return
+        if complete:
+            self.flush()
+        self.writer.close()
+        self.writer = None
+        if complete:
+            os.replace(self.path + '.tmp', self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        # A failed crawl leaves path + '.tmp' for inspection
+        self.close(complete=exc_type is None)
+
+
+if __name__ == '__main__':
+    # Tests for parquetutils.
+    def tests_geojson_wkb():
+        polygon = {'type': 'Polygon', 'coordinates': [[[0, 0], [2, 0], [2, 1], [0, 0]]]}
+        wkb = geojson_wkb(polygon)
+        assert wkb[:9] == struct.pack('<BII', 1, 3, 1)
+        assert len(wkb) == 1 + 4 + 4 + 4 + 4 * 16
+        multi = {'type': 'MultiPolygon', 'coordinates': [polygon['coordinates']] * 2}
+        assert geojson_wkb(multi) == struct.pack('<BII', 1, 6, 2) + wkb * 2
+
+    def tests():
+        tests_geojson_wkb()
+        print('parquetutils tests passed', file=sys.stderr)
+
+    tests()
@@ -1,106 +1,457 @@
-# Utilities.
-import os
-import csv
-import json
-import platform
-
-
-def compacts(data):
-    """Return object dump to compact json."""
-    return json.dumps(data, separators=(',', ':'))
-
-def dumps(data):
-    """Return object dump to pretty json."""
-    return json.dumps(data, indent=4)
-
-def fileuri(path):
-    """Return file uri for path."""
-    if not path:
-        return None
-    if platform.system() == 'Windows':
-        return 'file:///' + path
-    elif platform.system() == 'Linux':
-        return 'file://' + path
-    raise NotImplementedError('Running on an unknown OS!')
-
-def posixpath(path):
-    """Return posix path for path on Windows."""
-    if not path:
-        return None
-    if platform.system() == 'Windows':
-        return path.replace(os.sep, '/')
-    elif platform.system() == 'Linux':
-        return path
-    raise NotImplementedError('Running on an unknown OS!')
-
-
-def head_file(path, n=10):
-    """Return first n lines from file. If n is None, return all lines."""
-    lines = []
-    with open(path) as f:
-        for line in f if n is None else (f.readline() for _ in range(n)):
-            if line:
-                lines.append(line.strip())
-    return lines
-
-def head_list(data, n=10):
-    """Return first n items from list. If n is None, return all items."""
-    return data if n is None else data[:n]
-
-
-def read_xml(path):
-    """Read XML to string."""
-    with open(path, 'r', encoding='utf-8') as f:
-        xml_str = f.read()
-        return xml_str
-
-
-def save_csv(path, data, delimiter=','):
-    """Save to delimited file. CSV default."""
-    with open(path, 'w', newline='') as f:
-        if not data:
-            f.truncate()
-            return
-        fieldnames = data[0].keys()
-        writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=delimiter)
-        writer.writeheader()
-        for item in data:
-            writer.writerow(item)
-
-def save_psv(path, data):
-    """Save to PSV (Pipe Separated Values) file."""
-    return save_csv(path, data, delimiter='|')
-
-def save_json(path, data):
-    """Save to JSON file."""
-    with open(path, 'w') as f:
-        if not data:
-            f.truncate()
-            return
-        json.dump(data, f, indent=4)
-
-def save_txt(path, data=None):
-    """Save to TXT file."""
-    with open(path, 'w') as f:
-        if not data:
-            f.truncate()
-            return
-        for line in data:
-            f.write(line + '\n')
-
-def save_txt_line(path, line=None):
-    """Create or append line to TXT file. Truncate if line is None."""
-    if line is None:
-        with open(path, 'w', encoding='utf-8') as f:
-            pass
-        return
-    with open(path, 'a', encoding='utf-8') as f:
-        f.write(line + '\n')
-
-
-if __name__ == '__main__':
-    # Tests for utils.
-    def tests():
-        print("tests")
-
-    tests()
+# Utilities.
+import os
+import sys
+import csv
+import gzip
+import hashlib
+import io
+import json
+import platform
+import math
+import time
+import heapq
+import contextlib
+import collections
+
+
+def compacts(data):
+    """Return object dump to compact json."""
+    return json.dumps(data, separators=(',', ':'))
+
+def dumps(data):
+    """Return object dump to pretty json."""
+    return json.dumps(data, indent=4)
+
+def fileuri(path):
+    """Return file uri for path."""
+    if not path:
+        return None
+    if platform.system() == 'Windows':
+        return 'file:///' + path
+    elif platform.system() == 'Linux':
+        return 'file://' + path
+    raise NotImplementedError('Running on an unknown OS!')
+
+def posixpath(path):
+    """Return posix path for path on Windows."""
+    if not path:
+        return None
+    if platform.system() == 'Windows':
+        return path.replace(os.sep, '/')
+    elif platform.system() == 'Linux':
+        return path
+    raise NotImplementedError('Running on an unknown OS!')
+
+
+# Compressed file extensions, see open_compressed
+COMPRESSION_EXTS = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+def compression(path):
+    """Return 'gzip' or 'zstd' by path extension, or None."""
+    for name, ext in COMPRESSION_EXTS.items():
+        if path.lower().endswith(ext):
+            return name
+    return None
+
+def open_compressed(path, mode='r', encoding=None, newline=None):
+    """Open text file like open, (de)compressing gzip (.gz) or zstd (.zst, needs zstandard) files.
+       Appending adds a gzip member or zstd frame, multi-member/frame files read as one."""
+    name = compression(path)
+    if name is None:
+        return open(path, mode, encoding=encoding, newline=newline)
+    mode = mode.replace('t', '')
+    if name == 'gzip':
+        return gzip.open(path, mode + 't', encoding=encoding, newline=newline)
+    import zstandard
+    if mode == 'r':
+        binary = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True)
+    else:
+        binary = zstandard.ZstdCompressor().stream_writer(open(path, mode + 'b'))
+    return io.TextIOWrapper(binary, encoding=encoding, newline=newline)
+
+def head_file(path, n=10):
+    """Return first n lines from file. If n is None, return all lines."""
+    lines = []
+    with open(path) as f:
+        for line in f if n is None else (f.readline() for _ in range(n)):
+            if line:
+                lines.append(line.strip())
+    return lines
+
+def head_list(data, n=10):
+    """Return first n items from list. If n is None, return all items."""
+    return data if n is None else data[:n]
+
+
+def read_xml(path):
+    """Read XML to string."""
+    with open(path, 'r', encoding='utf-8') as f:
+        xml_str = f.read()
+        return xml_str
+
+
+def read_csv(path, delimiter=','):
+    """Yield rows as dicts from delimited file. CSV default."""
+    # JSON columns easily exceed the default 128KB field limit
+    csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+    with open_compressed(path, newline='') as f:
+        for row in csv.DictReader(f, delimiter=delimiter):
+            yield row
+
+def read_psv(path):
+    """Yield rows as dicts from PSV (Pipe Separated Values) file."""
+    return read_csv(path, delimiter='|')
+
+
+def save_csv(path, data, delimiter=','):
+    """Save to delimited file. CSV default."""
+    with open_compressed(path, 'w', newline='') as f:
+        if not data:
+            f.truncate()
+            return
+        fieldnames = data[0].keys()
+        writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=delimiter)
+        writer.writeheader()
+        for item in data:
+            writer.writerow(item)
+
+def save_psv(path, data):
+    """Save to PSV (Pipe Separated Values) file."""
+    return save_csv(path, data, delimiter='|')
+
+class CsvStream:
+    """Streaming delimited file writer with a fixed header. CSV default.
+       Rows are written as they arrive and flushed every flush_every rows.
+       .gz and .zst paths are compressed (see open_compressed) and only flushed by flush()."""
+
+    def __init__(self, path, fieldnames, delimiter=',', flush_every=1000, append=False):
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.delimiter = delimiter
+        self.flush_every = flush_every
+        self.compression = compression(path)
+        self.count = 0
+        self._open('a' if append else 'w')
+        if not append:
+            self.writer.writeheader()
+
+    def _open(self, mode):
+        self.file = open_compressed(self.path, mode, newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames, delimiter=self.delimiter)
+
+    def write(self, row):
+        """Write row dict."""
+        self.writer.writerow(row)
+        self.count += 1
+        if self.flush_every and self.count % self.flush_every == 0 and not self.compression:
+            self.flush()
+
+    def flush(self):
+        """Flush written rows to the OS. Compressed files end their gzip member or zstd frame,
+           so the file is complete, and can be truncated back, at its current size."""
+        if self.compression:
+            self.file.close()
+            self._open('a')
+        else:
+            self.file.flush()
+
+    def close(self):
+        """Flush and close file."""
+        if not self.file.closed:
+            self.file.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def save_csv_stream(path, rows, fieldnames, delimiter=',', flush_every=1000):
+    """Save rows iterator to delimited file as rows are produced. CSV default.
+       Returns count of rows written."""
+    with CsvStream(path, fieldnames, delimiter=delimiter, flush_every=flush_every) as stream:
+        for row in rows:
+            stream.write(row)
+        return stream.count
+
+def save_psv_stream(path, rows, fieldnames, flush_every=1000):
+    """Save rows iterator to PSV (Pipe Separated Values) file as rows are produced."""
+    return save_csv_stream(path, rows, fieldnames, delimiter='|', flush_every=flush_every)
+
+# JSON value replacing a deduplicated blob, {"$blob": sha1 hex}
+BLOB_REF = '$blob'
+# Blobs PSV columns
+blob_fields = ('hash_text', 'json_json')
+# Sources whose blob references JsonDedup keeps, more than the directories crawled at once
+DEDUP_SOURCES = 1024
+
+def blobs_path(psvpath):
+    """Return blobs PSV path of PSV psvpath, e.g. crawl2psv.raw.blobs.psv.gz for crawl2psv.raw.psv.gz."""
+    i = psvpath.rfind('.psv')
+    return psvpath[:i] + '.blobs' + psvpath[i:] if i >= 0 else psvpath + '.blobs'
+
+def blob_ref(value):
+    """Return blob hash if JSON text value is a blob reference, else None."""
+    if value and value.startswith('{"' + BLOB_REF + '":'):
+        return json.loads(value)[BLOB_REF]
+    return None
+
+def read_blobs(path):
+    """Return {hash: json} of blobs PSV path, empty if there is none."""
+    if not os.path.isfile(path):
+        return {}
+    return {row['hash_text']: row['json_json'] for row in read_psv(path)}
+
+def resolve_blobs(row, blobs, fields):
+    """Return row with blob references in fields replaced by their JSON from blobs."""
+    refs = {field: blob_ref(row.get(field)) for field in fields}
+    return dict(row, **{field: blobs.get(ref, row[field]) for field, ref in refs.items() if ref})
+
+class JsonDedup:
+    """Content-addressed deduplication of JSON text row values.
+       Values in fields of at least min_bytes are replaced by {"$blob": sha1} references,
+       each distinct value is written once to write_blob as a blob_fields row.
+       sources maps a field to the row column naming the file its value was read from, e.g. the
+       metadata XML shared by a directory. References are cached per source file with the value,
+       a value equal to the cached one from its source (usually the same string) is not hashed
+       again, a changed one (e.g. the XML was edited since an --incremental manifest) is."""
+
+    def __init__(self, min_bytes, write_blob, fields, sources=None, cache_size=DEDUP_SOURCES):
+        self.min_bytes = min_bytes
+        self.write_blob = write_blob
+        self.fields = fields
+        self.sources = sources or {}
+        self.cache_size = cache_size
+        self.hashes = set()
+        # (field, source) -> (value, reference), least recently used first
+        self.refs = collections.OrderedDict()
+        self.counts = {'blobs': 0, 'refs': 0, 'hashed': 0, 'bytes_saved': 0}
+
+    def ref(self, field, value, source=None):
+        """Return reference JSON of value read from source (or None), writing its blob if new."""
+        key = (field, source)
+        cached = self.refs.get(key) if source is not None else None
+        if cached is not None and cached[0] == value:
+            ref = cached[1]
+            self.refs.move_to_end(key)
+        else:
+            digest = hashlib.sha1(value.encode('utf-8')).hexdigest()
+            ref = compacts({BLOB_REF: digest})
+            self.counts['hashed'] += 1
+            if digest not in self.hashes:
+                self.hashes.add(digest)
+                self.write_blob({'hash_text': digest, 'json_json': value})
+                self.counts['blobs'] += 1
+            if source is not None:
+                self.refs[key] = (value, ref)
+                self.refs.move_to_end(key)
+                if len(self.refs) > self.cache_size:
+                    self.refs.popitem(last=False)
+        self.counts['refs'] += 1
+        self.counts['bytes_saved'] += len(value) - len(ref)
+        return ref
+
+    def __call__(self, row):
+        """Return row with large JSON values replaced by references."""
+        large = [_ for _ in self.fields if row.get(_) and len(row[_]) >= self.min_bytes]
+        if not large:
+            return row
+        return dict(row, **{field: self.ref(field, row[field], row.get(self.sources.get(field)))
+                            for field in large})
+
+def save_json(path, data):
+    """Save to JSON file."""
+    with open(path, 'w') as f:
+        if not data:
+            f.truncate()
+            return
+        json.dump(data, f, indent=4)
+
+def save_txt(path, data=None):
+    """Save to TXT file."""
+    with open(path, 'w') as f:
+        if not data:
+            f.truncate()
+            return
+        for line in data:
+            f.write(line + '\n')
+
+def save_txt_line(path, line=None):
+    """Create or append line to TXT file. Truncate if line is None."""
+    if line is None:
+        with open(path, 'w', encoding='utf-8') as f:
+            pass
+        return
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(line + '\n')
+
+# Stage seconds accumulated by timed, collected per task with pop_timings
+_timings = {}
+
+@contextlib.contextmanager
+def timed(stage):
+    """Accumulate seconds spent in the with block under stage. Stages may nest."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timings[stage] = _timings.get(stage, 0.0) + time.perf_counter() - start
+
+def pop_timings():
+    """Return and reset stage seconds accumulated by timed in this process."""
+    timings = dict(_timings)
+    _timings.clear()
+    return timings
+
+# Log histogram of StageTimings: buckets per decade of seconds (~4.7% wide), from 1 microsecond
+HISTOGRAM_BUCKETS_PER_DECADE = 50
+HISTOGRAM_MIN_SECONDS = 1e-6
+
+def histogram_bucket(seconds):
+    """Return log histogram bucket of seconds, 0 for seconds up to HISTOGRAM_MIN_SECONDS."""
+    if seconds <= HISTOGRAM_MIN_SECONDS:
+        return 0
+    return 1 + int(math.log10(seconds / HISTOGRAM_MIN_SECONDS) * HISTOGRAM_BUCKETS_PER_DECADE)
+
+def histogram_percentile(histogram, count, p, maximum):
+    """Return nearest-rank p percentile of log histogram {bucket: count}: the upper bound of
+       the percentile's bucket, at most maximum."""
+    rank = min(count, max(1, math.ceil(p / 100 * count)))
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= rank:
+            upper = HISTOGRAM_MIN_SECONDS * 10 ** (bucket / HISTOGRAM_BUCKETS_PER_DECADE)
+            return min(upper, maximum)
+    return maximum
+
+class StageTimings:
+    """Per-file stage timings summary: per-stage totals and percentiles,
+       per-extension totals and the top slowest files.
+       Memory is flat in the number of files: per stage a count, total, max and a log
+       histogram for the percentiles, and only the top files' stages."""
+
+    def __init__(self, top=10):
+        self.top = top
+        self.count = 0
+        self.stages = {}
+        self.extensions = {}
+        self.slowest = []
+
+    def add(self, filepath, timings, total_stage='total'):
+        """Add stage seconds dict of filepath, total_stage being the whole file's seconds."""
+        self.count += 1
+        for stage, seconds in timings.items():
+            stats = self.stages.setdefault(stage, {'count': 0, 'total': 0.0, 'max': 0.0, 'histogram': {}})
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            bucket = histogram_bucket(seconds)
+            stats['histogram'][bucket] = stats['histogram'].get(bucket, 0) + 1
+        ext = os.path.splitext(filepath)[1].lower()
+        extension = self.extensions.setdefault(ext, {'count': 0, 'stages': {}})
+        extension['count'] += 1
+        for stage, seconds in timings.items():
+            extension['stages'][stage] = extension['stages'].get(stage, 0.0) + seconds
+        item = (timings.get(total_stage, 0.0), filepath, timings)
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, item)
+        elif item[0] > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def summary(self, digits=6):
+        """Return JSON-friendly summary dict."""
+        stages = {}
+        for stage, stats in sorted(self.stages.items()):
+            count, histogram, maximum = stats['count'], stats['histogram'], stats['max']
+            stages[stage] = {
+                'count': count,
+                'total': round(stats['total'], digits),
+                'mean': round(stats['total'] / count, digits),
+                # Within a histogram bucket (~4.7%) of the exact percentile
+                'p50': round(histogram_percentile(histogram, count, 50, maximum), digits),
+                'p90': round(histogram_percentile(histogram, count, 90, maximum), digits),
+                'p99': round(histogram_percentile(histogram, count, 99, maximum), digits),
+                'max': round(maximum, digits),
+            }
+        extensions = {
+            ext: {
+                'count': _['count'],
+                'stages': {k: round(v, digits) for k, v in sorted(_['stages'].items())},
+            }
+            for ext, _ in sorted(self.extensions.items())
+        }
+        slowest = [
+            {
+                'filepath': filepath,
+                'seconds': round(seconds, digits),
+                'stages': {k: round(v, digits) for k, v in sorted(timings.items())},
+            }
+            for seconds, filepath, timings in sorted(self.slowest, key=lambda _: _[0], reverse=True)
+        ]
+        return {
+            'count': self.count,
+            'stages': stages,
+            'extensions': extensions,
+            'slowest': slowest,
+        }
+
+
+if __name__ == '__main__':
+    # Tests for utils.
+    def tests_stage_timings():
+        timings = StageTimings(top=2)
+        for i in range(1, 101):
+            timings.add(f'/tmp/{i}.tif' if i % 2 else f'/tmp/{i}.las', {'total': i / 100, 'stat': i / 1000})
+        summary = timings.summary()
+        total = summary['stages']['total']
+        assert 0.5 <= total['p50'] <= 0.5 * 1.05 and 0.99 <= total['p99'] <= 1.0
+        assert total['max'] == 1.0 and total['count'] == 100 and abs(total['total'] - 50.5) < 1e-9
+        # Flat memory: histogram buckets, not one value per file
+        for i in range(100000):
+            timings.add('/tmp/x.tif', {'total': 0.5})
+        assert len(timings.stages['total']['histogram']) <= 2 * HISTOGRAM_BUCKETS_PER_DECADE
+        assert summary['extensions']['.las']['count'] == 50
+        assert [_['filepath'] for _ in summary['slowest']] == ['/tmp/100.las', '/tmp/99.tif']
+        with timed('stage'):
+            with timed('stage'):
+                pass
+        assert list(pop_timings()) == ['stage'] and not pop_timings()
+
+    def tests_json_dedup():
+        blobs = []
+        dedup = JsonDedup(10, blobs.append, ('a_json',), {'a_json': 'a_path'}, cache_size=2)
+        value = compacts({'product': 'x' * 20})
+        rows = [dedup({'a_json': value, 'b_json': value, 'a_path': 'a.xml'}) for _ in range(3)]
+        rows.append(dedup({'a_json': '{}', 'b_json': None}))
+        assert len(blobs) == 1 and dedup.counts['refs'] == 3 and dedup.counts['hashed'] == 1
+        # Same content from another source is hashed once more, but stored once
+        for path in ('b.xml', 'c.xml', 'b.xml'):
+            assert dedup({'a_json': value, 'a_path': path})['a_json'] == rows[0]['a_json']
+        assert len(blobs) == 1 and dedup.counts['hashed'] == 3 and len(dedup.refs) == 2
+        dedup({'a_json': value})
+        assert dedup.counts['hashed'] == 4
+        assert rows[0]['a_json'] == rows[2]['a_json'] and rows[0]['b_json'] == value
+        assert rows[3]['a_json'] == '{}'
+        # --incremental: a carried row caches the old XML content, a re-extracted row after the
+        # XML changed must reference the new content, not the cached blob of its path
+        changed = compacts({'product': 'y' * 20})
+        carried = dedup({'a_json': value, 'a_path': 'b.xml'})
+        extracted = dedup({'a_json': changed, 'a_path': 'b.xml'})
+        assert carried['a_json'] == rows[0]['a_json'] and extracted['a_json'] != carried['a_json']
+        assert len(blobs) == 2 and blobs[-1]['json_json'] == changed
+        assert dedup({'a_json': changed, 'a_path': 'b.xml'})['a_json'] == extracted['a_json']
+        resolved = resolve_blobs(rows[0], {_['hash_text']: _['json_json'] for _ in blobs}, ('a_json',))
+        assert resolved['a_json'] == value
+        assert blobs_path('crawl2psv.raw.psv.gz') == 'crawl2psv.raw.blobs.psv.gz'
+
+    def tests():
+        print("tests")
+        tests_stage_timings()
+        tests_json_dedup()
+
+    tests()
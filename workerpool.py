@@ -0,0 +1,237 @@
+# Process Pool with Per-Task Timeouts.
+import sys
+import time
+import threading
+import multiprocessing
+import multiprocessing.connection
+from collections import deque
+from concurrent.futures import Future
+
+
+class TaskTimeout(Exception):
+    """Task ran past the pool timeout, its worker was killed."""
+    reason = 'TIMEOUT'
+
+class WorkerDied(Exception):
+    """Worker process exited while running the task (e.g. a driver segfault)."""
+    reason = 'WORKER_DIED'
+
+
+def _worker_main(conn):
+    """Worker loop: receive (fn, args), send (True, result) or (False, exception), until None."""
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError, KeyboardInterrupt):
+            return
+        if message is None:
+            return
+        fn, args = message
+        try:
+            reply = True, fn(*args)
+        except Exception as ex:
+            reply = False, ex
+        try:
+            conn.send(reply)
+        except Exception as ex:
+            # Unpicklable result or exception
+            conn.send((False, RuntimeError(f'{type(ex).__name__}: {ex}')))
+
+
+class _Worker:
+    """Worker process, its connection and the task it is running."""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.future = None
+        self.deadline = None
+
+    def kill(self):
+        """Kill the process without waiting on it, a process blocked in the kernel
+           (e.g. on a stale NFS handle) may not exit until its I/O returns."""
+        try:
+            self.process.kill()
+            self.process.join(0.1)
+        except Exception:
+            pass
+        self.conn.close()
+
+
+class WatchdogPool:
+    """Process pool whose tasks each have timeout seconds to complete.
+       A worker still running a task at its deadline is killed and replaced and the task's
+       Future fails with TaskTimeout, a worker that dies fails it with WorkerDied; other tasks
+       are unaffected. submit returns concurrent.futures.Future, like ProcessPoolExecutor."""
+
+    def __init__(self, max_workers=1, timeout=None, mp_context=None):
+        self.max_workers = max(1, max_workers or 1)
+        self.timeout = timeout
+        self.context = mp_context or multiprocessing.get_context()
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.shutting_down = False
+        self.abandoned = []
+        self.wakeup_reader, self.wakeup_writer = self.context.Pipe(duplex=False)
+        self.workers = [_Worker(self.context) for _ in range(self.max_workers)]
+        self.thread = threading.Thread(target=self._manage, name='WatchdogPool', daemon=True)
+        self.thread.start()
+
+    def submit(self, fn, *args):
+        """Schedule fn(*args), returns Future."""
+        future = Future()
+        with self.lock:
+            if self.shutting_down:
+                raise RuntimeError('cannot submit after shutdown')
+            self.pending.append((future, fn, args))
+        self._wakeup()
+        return future
+
+    def shutdown(self, wait=True):
+        """Stop workers once pending tasks are done (if wait) or cancelled."""
+        with self.lock:
+            self.shutting_down = True
+            if not wait:
+                while self.pending:
+                    self.pending.popleft()[0].cancel()
+        self._wakeup()
+        if wait:
+            self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown(wait=True)
+
+    def _wakeup(self):
+        try:
+            self.wakeup_writer.send(None)
+        except OSError:
+            pass
+
+    def _dispatch(self, worker):
+        """Send next pending task to idle worker.
+           An idle worker that died (nothing reads its pipe until it has a task) is replaced
+           and the task sent to the new worker, failing with WorkerDied only if that fails too."""
+        while True:
+            with self.lock:
+                if not self.pending:
+                    return
+                future, fn, args = self.pending.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            for retry in (False, True):
+                if not worker.process.is_alive():
+                    worker = self._replace(worker)
+                try:
+                    worker.conn.send((fn, args))
+                except OSError as ex:
+                    # Broken pipe, the worker died after the is_alive check
+                    if retry:
+                        future.set_exception(WorkerDied(f'worker pipe failed: {ex}'))
+                        break
+                    worker = self._replace(worker)
+                    continue
+                except Exception as ex:
+                    # Unpicklable task, the worker never saw it
+                    future.set_exception(ex)
+                    break
+                worker.future = future
+                worker.deadline = time.monotonic() + self.timeout if self.timeout else None
+                return
+
+    def _replace(self, worker, ex=None):
+        """Fail the worker's task (if any) with ex and start a new worker in its place, returned."""
+        worker.kill()
+        if worker.process.is_alive():
+            self.abandoned.append(worker.process)
+        if worker.future is not None:
+            worker.future.set_exception(ex)
+        new_worker = _Worker(self.context)
+        self.workers[self.workers.index(worker)] = new_worker
+        return new_worker
+
+    def _manage(self):
+        """Dispatch tasks, collect results and enforce deadlines until shutdown."""
+        while True:
+            for worker in self.workers:
+                if worker.future is None:
+                    self._dispatch(worker)
+            busy = [_ for _ in self.workers if _.future is not None]
+            with self.lock:
+                if self.shutting_down and not busy and not self.pending:
+                    break
+            deadlines = [_.deadline for _ in busy if _.deadline is not None]
+            wait = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            ready = multiprocessing.connection.wait([self.wakeup_reader] + [_.conn for _ in busy], wait)
+            if self.wakeup_reader in ready:
+                while self.wakeup_reader.poll():
+                    self.wakeup_reader.recv()
+            for worker in busy:
+                if worker.conn in ready:
+                    try:
+                        ok, value = worker.conn.recv()
+                    except (EOFError, OSError):
+                        worker.process.join(0.1)
+                        exitcode = worker.process.exitcode
+                        self._replace(worker, WorkerDied(f'worker exited with code {exitcode}'))
+                        continue
+                    future, worker.future, worker.deadline = worker.future, None, None
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+                elif worker.deadline is not None and time.monotonic() >= worker.deadline:
+                    self._replace(worker, TaskTimeout(f'task exceeded {self.timeout}s'))
+        for worker in self.workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in self.workers:
+            worker.process.join(1)
+            if worker.process.is_alive():
+                worker.kill()
+        if self.abandoned:
+            print(f'WatchdogPool: {len(self.abandoned)} killed workers had not exited.', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    # Tests for workerpool.
+    def tests_watchdog_pool():
+        with WatchdogPool(max_workers=2, timeout=1) as pool:
+            futures = [pool.submit(time.sleep, _) for _ in (0, 5, 0, 0)]
+            futures.append(pool.submit(divmod, 7, 2))
+            futures.append(pool.submit(divmod, 7, 0))
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as ex:
+                    results.append(type(ex).__name__)
+        print(results, file=sys.stderr)
+        assert results == [None, 'TaskTimeout', None, None, (3, 1), 'ZeroDivisionError']
+
+    def tests_dead_idle_worker():
+        """A worker killed while idle is replaced and the next task still runs."""
+        with WatchdogPool(max_workers=1, timeout=5) as pool:
+            assert pool.submit(divmod, 7, 2).result() == (3, 1)
+            idle = pool.workers[0]
+            idle.process.kill()
+            idle.process.join()
+            assert pool.submit(divmod, 9, 2).result() == (4, 1)
+            assert pool.workers[0] is not idle
+            # Pipe broken before is_alive notices, as when the worker dies between the two
+            broken = pool.workers[0]
+            broken.conn.close()
+            assert pool.submit(divmod, 11, 2).result() == (5, 1)
+            assert pool.workers[0] is not broken
+
+    def tests():
+        tests_watchdog_pool()
+        tests_dead_idle_worker()
+
+    tests()